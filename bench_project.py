@@ -0,0 +1,354 @@
+import sys
+import time
+import subprocess
+import tempfile
+import os
+import json
+import platform
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+from project import format_solar_data
+from project import calculate_daily_data
+from project import calculate_monthly_data
+from project import SolarPanel
+from project import ReportGenerator
+from project import get_solar_data
+from project import ResponseCache
+from project import SyntheticSource
+from project import SolcastStandIn
+from project import SyntheticResponse
+from project import synthetic_payload
+from project import fetch_solar_data
+from project import aggregate_data
+from project import simulate_intervals
+from project import simulate_uncertainty
+from project import sweep_orientations
+
+
+# Benchmarks for project.py. Run with: python bench_project.py <benchmark>
+# All benchmarks use synthetic data, so they run offline and without using any API quota.
+
+BASELINE_PATH = "bench_baseline.json" # Stored results of the stages benchmark, compared against on every run
+STAGE_SCENARIOS = [(2, 1, 5), (10, 1, 5), (30, 1, 5), (2, 100, 3), (2, 1000, 1)] # (years, sites, repeats) datasets of the stages benchmark. The best repeat of every stage is kept.
+QUICK_SCENARIOS = [(2, 1, 5), (10, 1, 5), (2, 100, 3)] # Subset for a quick check during development
+MEMORY_SITES = 3 # Sites traced for peak memory. Sites are processed one at a time, so the per-site peak doesn't grow with the number of sites.
+PLOT_SITES = 5 # Sites rendered in the plot stage. Reports are rendered per site, so reports/s doesn't depend on the number of sites.
+REGRESSION_THRESHOLD = 0.5 # A stage more than 50% slower than its baseline is reported as a regression. Timings on shared machines vary by tens of percent between runs.
+
+
+def synthetic_interval_data(years, seed=0):
+    ## Creates "years" years of synthetic 30 minute interval data, with the same columns as parse_month returns.
+    rng = np.random.default_rng(seed)
+    period_end = pd.date_range("2000-01-01", periods=years * 365 * 48, freq="30min")
+    hours = (period_end.hour + period_end.minute / 60).to_numpy()
+    season = np.cos(2 * np.pi * period_end.dayofyear.to_numpy() / 365)
+    clouds = rng.uniform(0.3, 1, len(period_end))
+    gti = np.clip(1000 * np.sin(np.pi * (hours - 6) / 12), 0, None) * (1 + 0.3 * season) * clouds
+    air_temp = 15 + 8 * np.sin(np.pi * (hours - 9) / 12) + 6 * season + rng.normal(0, 2, len(period_end))
+    return pd.DataFrame({
+        "Air Temp": air_temp.round(1).astype(np.float32),
+        "W/m2 (GTI)": gti.round().astype(np.float32),
+        "Period end": period_end.to_numpy(),
+        "Period": np.full(len(period_end), "PT30M", dtype=object)})
+
+
+def legacy_solar_data(df):
+    ## Recreates the column layout get_solar_data returned before the compact schema: Float64/int64 measurements, object Daytime Temp (None at night)
+    # and a string Period column on every row.
+    legacy = pd.DataFrame({
+        "Air Temp": df["Air Temp"].astype(float).to_numpy(),
+        "W/m2 (GTI)": df["W/m2 (GTI)"].astype(np.int64).to_numpy(),
+        "Period end": df["Period end"].to_numpy(),
+        "Period": df["Period"].astype(object).to_numpy()})
+    legacy["Sun Hours"] = 0.0
+    legacy.loc[legacy["W/m2 (GTI)"] > 0, "Sun Hours"] = 0.5
+    legacy["Daytime Temp"] = None
+    legacy.loc[legacy["W/m2 (GTI)"] > 0, "Daytime Temp"] = legacy["Air Temp"]
+    return legacy
+
+
+def best_time(function, repeat):
+    ## Returns the best wall time in seconds of "repeat" calls to function
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_schema(years=10, repeat=5):
+    ## Memory and aggregation throughput of the compact interval schema compared to the legacy object column layout, for a 10 year (175k row) frame.
+    compact = format_solar_data(synthetic_interval_data(years))
+    legacy = legacy_solar_data(compact)
+    rows = len(compact)
+    print(f"Interval schema benchmark: {years} years, {rows} rows")
+    print(f"{'Layout':<8} {'Memory (MB)':>12} {'Monthly (ms)':>13} {'Monthly rows/s':>15} {'Daily (ms)':>11} {'Daily rows/s':>13}")
+    for name, df in [("legacy", legacy), ("compact", compact)]:
+        memory = df.memory_usage(deep=True).sum() / 1024 ** 2
+        monthly = best_time(lambda: calculate_monthly_data(df), repeat)
+        daily = best_time(lambda: calculate_daily_data(df), repeat)
+        print(f"{name:<8} {memory:>12.2f} {monthly * 1000:>13.1f} {rows / monthly:>15,.0f} {daily * 1000:>11.1f} {rows / daily:>13,.0f}")
+
+
+def benchmark_importtime(repeat=5):
+    ## Cold import latency of the simulation core (import project), measured with python -X importtime in a fresh interpreter per run.
+    # Also lists the slowest imported packages, and checks that the plotting, geocoding and HTTP stacks are not loaded.
+    totals = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import project"], capture_output=True, text=True, check=True)
+        # Lines look like: "import time:   self [us] | cumulative | imported package"
+        packages = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, package = line.split("|")
+            # Nested imports are indented by two spaces per level after the separator
+            packages[package[1:].rstrip()] = int(cumulative)
+        totals.append(packages["project"])
+    # Packages imported directly by project are indented one level below it
+    top_level = {package.strip(): cumulative for package, cumulative in packages.items() if package.startswith("  ") and not package.startswith("   ")}
+    print(f"Cold import of project: best {min(totals) / 1000:.1f} ms, median {sorted(totals)[len(totals) // 2] / 1000:.1f} ms over {repeat} runs")
+    print("Slowest imports:")
+    for package, cumulative in sorted(top_level.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {package:<24} {cumulative / 1000:>8.1f} ms")
+    lazy = [package for package in ["matplotlib", "seaborn", "geopy", "requests", "dotenv"] if any(name.strip() == package for name in packages)]
+    print(f"Lazy stacks loaded at import: {', '.join(lazy) if lazy else 'none'}")
+
+
+def current_rss():
+    ## Returns the current resident set size of this process in MB. Reads /proc on Linux, and falls back to the peak RSS elsewhere.
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def benchmark_reports(reports=500, dpi=100, backend="matplotlib", tolerance=25):
+    ## Regression benchmark for the report figure lifecycle. Renders "reports" PDF reports in one process with a single ReportGenerator and samples the RSS.
+    # The RSS after the first 50 reports (imports, font caches and the like are warm) should stay within "tolerance" MB until the last report.
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    monthly = SolarPanel(45, 800, 25, 21.48, -0.34).calculate_yields(calculate_monthly_data(format_solar_data(synthetic_interval_data(10))), 2000)
+    generator = ReportGenerator(dpi=dpi, backend=backend)
+    samples = {}
+    print(f"Report memory benchmark: {reports} {backend} reports at {dpi} dpi")
+    print(f"{'Reports':>8} {'RSS (MB)':>9} {'Reports/s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        for i in range(1, reports + 1):
+            generator.render(monthly, 2000, "Sydney, Australia", os.path.join(directory, f"site-{i % 10}.pdf"))
+            if i == 1 or i % 50 == 0:
+                samples[i] = current_rss()
+                print(f"{i:>8} {samples[i]:>9.1f} {i / (time.perf_counter() - start):>10.1f}")
+    warm = samples[min(50, max(samples))]
+    growth = samples[max(samples)] - warm
+    print(f"RSS growth after warm-up: {growth:+.1f} MB (tolerance {tolerance} MB), open pyplot figures: {len(plt.get_fignums())}")
+    if growth > tolerance or plt.get_fignums():
+        sys.exit("Report memory benchmark failed: memory grows with the number of generated reports.")
+
+
+def benchmark_sources(years=10, latency=0.05, workers=(1, 4, 8)):
+    ## Fetch and parse throughput of get_solar_data against the offline data sources, without any network access or API quota.
+    # The in-process source measures parsing alone. The local stand-in server adds HTTP, JSON encoding and "latency" seconds per request,
+    # showing how concurrent fetching hides the latency. The last run is served from a warm response cache.
+    rows = len(get_solar_data("0", "0", "key", years, rate_limit=1000, session=SyntheticSource()))
+    print(f"Data source benchmark: {years} years ({years * 12} months, {rows} rows), {latency * 1000:.0f} ms stand-in latency")
+    print(f"{'Source':<24} {'Workers':>8} {'Time (s)':>9} {'Rows/s':>10} {'Requests':>9} {'MB sent':>8}")
+    source = SyntheticSource()
+    elapsed = best_time(lambda: get_solar_data("0", "0", "key", years, rate_limit=1000, session=source), 3)
+    print(f"{'in-process':<24} {1:>8} {elapsed:>9.2f} {rows / elapsed:>10,.0f} {source.calls // 3:>9} {'-':>8}")
+    with tempfile.TemporaryDirectory() as directory, SolcastStandIn(latency=latency) as server:
+        def run(name, max_workers, cache=None):
+            session = server.session(max_workers)
+            requests, sent = server.requests, server.bytes_sent
+            start = time.perf_counter()
+            get_solar_data("0", "0", "key", years, max_workers=max_workers, rate_limit=1000, session=session, cache=cache)
+            elapsed = time.perf_counter() - start
+            session.close()
+            print(f"{name:<24} {max_workers:>8} {elapsed:>9.2f} {rows / elapsed:>10,.0f} {server.requests - requests:>9} {(server.bytes_sent - sent) / 1024 ** 2:>8.1f}")
+
+        for max_workers in workers:
+            run("stand-in", max_workers)
+        cache = ResponseCache(os.path.join(directory, "cache.sqlite"))
+        run("stand-in (cold cache)", max(workers), cache)
+        run("stand-in (warm cache)", max(workers), cache)
+        cache.close()
+
+
+class ReplaySource:
+    ## In-process data source replaying synthetic_payload, generated once per month. The synthetic data doesn't depend on the coordinates,
+    # so every site gets the same months. Keeps the cost of generating the payloads out of the fetch stage, which then measures the client side only.
+    def __init__(self):
+        self.payloads = {}
+
+    def get(self, url, params=None, timeout=None):
+        key = (params["start"], params["end"])
+        if key not in self.payloads:
+            self.payloads[key] = synthetic_payload(params)
+        return SyntheticResponse(200, self.payloads[key])
+
+
+def month_ranges(years, end_year=2023):
+    ## Monthly (start, end) date ranges of "years" years ending with end_year, in the format of generate_date_ranges. Not limited to 2-10 years.
+    starts = pd.date_range(f"{end_year - years + 1}-01-01", periods=years * 12, freq="MS")
+    ends = starts + pd.offsets.MonthBegin() - pd.Timedelta(seconds=1)
+    return [(start.strftime("%Y-%m-%dT%XZ"), end.strftime("%Y-%m-%dT%XZ")) for start, end in zip(starts, ends)]
+
+
+def run_stages(years, sites, directory, trace_memory=False):
+    ## Runs the fetch, aggregate, simulate and plot stages of every site one at a time, like run_batch, and returns the totals of every stage.
+    # Rows are interval rows for the data stages and reports for the plot stage. With trace_memory, the peak of traced allocations per stage
+    # is measured too (tracemalloc slows the stages down, so it is run separately from the timed pass).
+    source = ReplaySource()
+    ranges = month_ranges(years)
+    Panel = SolarPanel(45, 800, 25, 21.48, -0.34)
+    generator = ReportGenerator(dpi=72, backend="matplotlib")
+    stages = {stage: {"seconds": 0.0, "rows": 0, "peak_mb": 0.0} for stage in ["fetch", "aggregate", "simulate", "plot"]}
+
+    def measure(stage, function, rows):
+        if trace_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = function()
+        stages[stage]["seconds"] += time.perf_counter() - start
+        stages[stage]["rows"] += rows(result)
+        if trace_memory:
+            stages[stage]["peak_mb"] = max(stages[stage]["peak_mb"], (tracemalloc.get_traced_memory()[1] - before) / 1024 ** 2)
+        return result
+
+    # Fetch once before timing, so generating the replayed payloads isn't timed
+    fetch_solar_data("0", "0", "key", ranges, rate_limit=10 ** 6, session=source)
+    for site in range(sites):
+        latitude, longitude = str(round(-60 + 120 * site / sites, 4)), str(round(-180 + 360 * site / sites, 4))
+        data = measure("fetch", lambda: fetch_solar_data(latitude, longitude, "key", ranges, rate_limit=10 ** 6, session=source), len)
+        aggregates = measure("aggregate", lambda: aggregate_data(data), lambda result: len(data))
+        monthly = measure("simulate", lambda: (Panel.calculate_yields(aggregates["Monthly"], 2000), simulate_intervals(data, Panel, 2000))[0], lambda result: len(data))
+        if site < PLOT_SITES:
+            measure("plot", lambda: generator.render(monthly, 2000, "Benchmark site", os.path.join(directory, "report.pdf")), lambda result: 1)
+    return stages
+
+
+def calibrate(repeat=5):
+    ## Best time of a fixed NumPy and pure Python workload. Stored with the baseline, so the comparisons are corrected for how fast the machine is running right now.
+    rng = np.random.default_rng(0)
+    values = rng.random(10 ** 6)
+    return best_time(lambda: (np.sort(values), sum(range(10 ** 6))), repeat)
+
+
+def benchmark_stages(quick=False, save_baseline=False, check=False):
+    ## Per stage wall time, throughput and peak memory of the simulation pipeline, for synthetic 30 minute datasets of 2, 10 and 30 years and 1, 100 and 1000 sites.
+    # Throughput is interval rows/s for the fetch, aggregate and simulate stages, and reports/s for the plot stage.
+    # Results are compared with the stored baseline (BASELINE_PATH) from the same kind of machine. --save-baseline stores this run as the new baseline,
+    # and --check exits with an error if any stage regressed more than REGRESSION_THRESHOLD.
+    import matplotlib
+    matplotlib.use("Agg")
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            baseline = json.load(file)
+    machine = {"python": platform.python_version(), "machine": platform.machine(), "system": platform.system(), "cpus": os.cpu_count()}
+    if baseline and baseline["machine"] != machine:
+        print(f"Baseline was recorded on {baseline['machine']}, comparisons are only indicative on this machine {machine}")
+
+    results = {}
+    regressions = []
+    # Time changes are scaled by how much faster or slower the calibration workload runs than when the baseline was stored
+    calibration = calibrate()
+    speed = calibration / baseline["calibration"] if baseline.get("calibration") else 1
+    if baseline.get("calibration"):
+        print(f"Calibration workload: {calibration * 1000:.1f} ms ({speed:.2f}x the baseline's time)")
+    print(f"{'Dataset':<16} {'Stage':<10} {'Time (s)':>9} {'Rows/s':>12} {'Peak (MB)':>10} {'vs baseline':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        # Untimed warm-up run, so lazy imports and font caches aren't counted in the first dataset
+        run_stages(2, 1, directory)
+        for years, sites, repeats in QUICK_SCENARIOS if quick else STAGE_SCENARIOS:
+            name = f"{years}y x {sites} sites"
+            runs = [run_stages(years, sites, directory) for _ in range(repeats)]
+            stages = {stage: min((run[stage] for run in runs), key=lambda totals: totals["seconds"]) for stage in runs[0]}
+            tracemalloc.start()
+            try:
+                memory = run_stages(years, min(sites, MEMORY_SITES), directory, trace_memory=True)
+            finally:
+                tracemalloc.stop()
+            results[name] = {}
+            for stage, totals in stages.items():
+                record = {"seconds": round(totals["seconds"], 4), "rows": totals["rows"], "rows_per_s": round(totals["rows"] / totals["seconds"], 1), "peak_mb": round(memory[stage]["peak_mb"], 2)}
+                results[name][stage] = record
+                previous = baseline.get("results", {}).get(name, {}).get(stage)
+                change = ""
+                if previous:
+                    ratio = previous["rows_per_s"] / record["rows_per_s"] / speed - 1
+                    change = f"{ratio:+.0%}"
+                    if ratio > REGRESSION_THRESHOLD:
+                        regressions.append(f"{name} {stage}")
+                        change += " !"
+                print(f"{name:<16} {stage:<10} {record['seconds']:>9.3f} {record['rows_per_s']:>12,.{0 if record['rows_per_s'] >= 100 else 2}f} {record['peak_mb']:>10.1f} {change:>12}")
+
+    if save_baseline:
+        # Keep the baselines of scenarios that weren't run (e.g. with --quick)
+        with open(BASELINE_PATH, "w") as file:
+            json.dump({"machine": machine, "calibration": round(calibration, 5), "results": {**baseline.get("results", {}), **results}}, file, indent=1)
+        print(f"Saved baseline to {BASELINE_PATH}")
+    if regressions:
+        print(f"Slower than baseline (time change corrected for machine speed, ! = over {REGRESSION_THRESHOLD:.0%}): {', '.join(regressions)}")
+        if check:
+            sys.exit("Stages benchmark failed: stages regressed compared to the baseline.")
+
+
+def benchmark_uncertainty(years=10, simulations=(10000, 100000), repeat=3):
+    ## Throughput of the Monte Carlo uncertainty engine, resampling the months or days of a 10 year site for 10k and 100k synthetic years.
+    aggregates = aggregate_data(format_solar_data(synthetic_interval_data(years)), ["Daily", "Monthly"])
+    print(f"Uncertainty benchmark: {years} years of data")
+    print(f"{'Resolution':<11} {'Synthetic years':>16} {'Time (ms)':>10} {'Years/s':>12}")
+    for resolution in ["Monthly", "Daily"]:
+        for count in simulations:
+            elapsed = best_time(lambda: simulate_uncertainty(aggregates[resolution], 21.48, -0.34, 20, count, seed=0), repeat)
+            print(f"{resolution:<11} {count:>16,} {elapsed * 1000:>10.1f} {count / elapsed:>12,.0f}")
+
+
+def benchmark_orientations(years=10, tilts=range(0, 61, 5), azimuths=range(0, 360, 45), repeat=3):
+    ## Throughput of the orientation sweep: one download of GHI, DNI and DHI (10 years, 175k rows) transposed and simulated for 104 tilt and azimuth combinations.
+    data = get_solar_data("-33.856784", "151.215297", "key", years, rate_limit=1000, session=SyntheticSource(), components=True)
+    orientations = len(tilts) * len(azimuths)
+    elapsed = best_time(lambda: sweep_orientations(data, "-33.856784", "151.215297", tilts, azimuths, 21.48, -0.34, 20), repeat)
+    print(f"Orientations benchmark: {years} years, {len(data)} rows")
+    print(f"{'Orientations':>12} {'Time (ms)':>10} {'Orientations/s':>15} {'Rows/s':>14}")
+    print(f"{orientations:>12} {elapsed * 1000:>10.1f} {orientations / elapsed:>15,.1f} {orientations * len(data) / elapsed:>14,.0f}")
+
+
+BENCHMARKS = {
+    "schema": benchmark_schema,
+    "importtime": benchmark_importtime,
+    "reports": benchmark_reports,
+    "sources": benchmark_sources,
+    "stages": benchmark_stages,
+    "uncertainty": benchmark_uncertainty,
+    "orientations": benchmark_orientations,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for project.py, using synthetic data.")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--quick", action="store_true", help="stages: only run the smaller datasets")
+    parser.add_argument("--save-baseline", action="store_true", help=f"stages: store the results as the new baseline in {BASELINE_PATH}")
+    parser.add_argument("--check", action="store_true", help="stages: exit with an error if a stage regressed compared to the baseline")
+    args = parser.parse_args()
+    for name in args.names or list(BENCHMARKS):
+        if name not in BENCHMARKS:
+            sys.exit(f"Unknown benchmark {name}. Choose from: {', '.join(BENCHMARKS)}")
+        if name == "stages":
+            benchmark_stages(quick=args.quick, save_baseline=args.save_baseline, check=args.check)
+        else:
+            BENCHMARKS[name]()
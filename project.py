@@ -1,32 +1,241 @@
 import sys
-import requests
-import seaborn as sns
+import time
+import random
+import threading
+import sqlite3
+import json
+import zlib
+from collections import deque
 import re
 from datetime import date, datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-from geopy.geocoders import Nominatim
-from matplotlib.backends.backend_pdf import PdfPages
-from geopy.location import Location
-from dotenv import load_dotenv
 import os
+import shutil
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+import functools
+# The HTTP (requests), plotting (matplotlib, seaborn), geocoding (geopy) and dotenv libraries are imported lazily by the functions using them,
+# so the simulation core (SolarPanel, aggregation, sweeps) loads fast without them. Cold import latency is tracked by: python bench_project.py importtime
 
 
 # Constants
 NOCT = 45 # Nominal Operating Cell Temperature in °C
 G_NOCT = 800  # Nominal Irradiance in W/m²
 STC_temp = 25 # Temperature coefficient per °C
+INVERTER_EFF = 0.96 # Inverter efficiency (4% loss in DC to AC conversion)
+
+# Panel models
+ARRAY_TYPES = ["fixed", "horizontal_single_axis"] # Solcast array types: fixed tilt arrays, or single axis trackers rotating about a horizontal north-south axis
+PANEL_MODEL = "monofacial" # Default panel model (See PANEL_MODELS)
+BIFACIALITY = 0.7 # Rear side / front side efficiency of bifacial modules. Typically 0.65-0.9. (Provided by cell manufacturer).
+REAR_IRRADIANCE_RATIO = 0.1 # Rear side / front side irradiance of bifacial modules. About 0.05-0.15, higher with bright ground and high mounting.
+
+# API fetch settings
+SOLCAST_URL = "https://api.solcast.com.au/data/historic/radiation_and_weather?"
+MAX_WORKERS = 4 # Max number of months fetched concurrently
+RATE_LIMIT = 5 # Max number of API requests per second (Token bucket refill rate)
+RATE_BURST = 5 # Max number of API requests allowed in a single burst (Token bucket size)
+RETRIES = 3 # Number of retries for a month request failing due to rate limiting, server errors or connection errors
+BACKOFF = 1 # Base backoff time in seconds between retries. Doubled for every retry.
+
+# Response cache settings
+CACHE_PATH = "solcast-cache.sqlite" # Local SQLite file storing compressed API responses
+CACHE_MAX_BYTES = 500 * 1024 ** 2 # Max total size of the stored responses before least recently used months are evicted
+CACHE_RECENT_DAYS = 31 # Months ending less than this many days before they were fetched may still be revised by Solcast, and can expire (ttl)
+
+# Reverse geocoding settings
+GEOCODE_CACHE_PATH = "geocode-cache.sqlite" # Local SQLite file storing coordinate -> location name lookups
+GEOCODE_PRECISION = 3 # Coordinates are rounded to this many decimals in the geocoding cache (About 100 m)
+GAZETTEER_PATH = "gazetteer.csv" # Default local gazetteer (name, latitude, longitude) for offline reverse geocoding
+
+# Incremental refresh settings
+STORE_PATH = "solar-data-store" # Local directory storing the interval data and monthly aggregates of every site for incremental refreshes
+
+# Results export
+RESULTS_PATH = "solar-results" # Local directory of the Parquet results dataset, partitioned by site and year
+RESULTS_SCHEMA_VERSION = 1 # Version of the results dataset layout. Bumped when columns change, so readers can reject data they don't understand.
+RESULTS_TABLES = ["intervals", "daily", "monthly"] # Tables of the results dataset. Interval data, daily aggregates and monthly aggregates with the simulated yields.
+
+# Simulation settings
+SIMULATION_MODE = "monthly" # "monthly" simulates monthly averages. "interval" simulates every interval and rolls the yield up to days, months and years.
+
+# Interval lengths. Every row's length is read from its Period column, so data of any of these periods (or a mix) can be aggregated and simulated.
+PERIOD_MINUTES = {"PT5M": 5, "PT10M": 10, "PT15M": 15, "PT30M": 30, "PT60M": 60}
+DATA_PERIOD = "PT30M" # Interval length requested from Solcast. PT60M for screening many sites with less data, PT5M for the most accurate final design.
+
+# Solcast response keys and the matching dataframe columns
+RESPONSE_COLUMNS = {"air_temp": "Air Temp", "gti": "W/m2 (GTI)", "period_end": "Period end", "period": "Period"}
+COMPONENT_COLUMNS = {"ghi": "W/m2 (GHI)", "dni": "W/m2 (DNI)", "dhi": "W/m2 (DHI)"} # Irradiance components, fetched with components=True for the plane of array transposition
+
+# Compact column schema of the interval dataframe returned by get_solar_data. Float32 measurements, NaN for missing values and a categorical Period.
+SOLAR_DATA_SCHEMA = {
+    "Air Temp": "float32",
+    "W/m2 (GTI)": "float32",
+    "Period end": "datetime64[ns]",
+    "Period": "category",
+    "Sun Hours": "float32",
+    "Daytime Temp": "float32"}
+
+# Resolutions of the aggregation engine
+RESOLUTIONS = ["Daily", "Weekly", "Monthly", "Yearly"]
+SIMULATION_RESOLUTION = "Monthly" # Resolution of the averaged data the monthly simulation mode is applied to: Daily or Monthly. The reports roll daily yields up to months.
+SIMULATION_RESOLUTIONS = ["Daily", "Monthly"] # Resolutions that can be rolled up to months (weeks and years cross month boundaries)
+
+# Plane of array transposition settings
+ALBEDO = 0.2 # Ground reflectance seen by tilted panels. About 0.2 for grass, 0.3 for desert sand and up to 0.8 for fresh snow.
+SOLAR_CONSTANT = 1361 # Extraterrestrial irradiance at the mean Earth-Sun distance in W/m2
+ORIENTATION_BATCH_SIZE = 16 # Orientations transposed per NumPy batch by sweep_orientations. Bounds the memory to about 16 copies of the interval data.
+
+# Typical meteorological year settings
+TMY_WEIGHTS = {"Daily GTI": 0.5, "Mean Air Temp": 0.2, "Max Air Temp": 0.15, "Min Air Temp": 0.15} # Weights of the daily statistics in the Finkelstein-Schafer statistic
+TMY_YEAR = 1900 # Year the typical months are dated to. Not a leap year, so the TMY has 365 days (8760 hourly or 17520 half hourly intervals).
+
+# Uncertainty settings
+MC_SIMULATIONS = 10000 # Synthetic years simulated by the Monte Carlo uncertainty analysis. 0 disables it.
+MC_BATCH_SIZE = 10000 # Synthetic years resampled per NumPy batch. Bounds the memory of resampling days (Batch size x 365 draws).
+MC_RESOLUTION = "Monthly" # "Monthly" resamples whole historical months, "Daily" resamples the days of every calendar month independently
+STC_EFF_TOLERANCE = 3 # Datasheet tolerance of the module efficiency at STC, in percent of the rated value (±)
+TEMP_COEFF_TOLERANCE = 0.02 # Datasheet tolerance of the temperature coefficient of PMax, in %/°C (±)
+INVERTER_EFF_TOLERANCE = 0.01 # Tolerance of the inverter efficiency, in fractional value (±)
+EXCEEDANCE_LEVELS = [50, 75, 90] # Exceedance probabilities (%) of the reported annual yields. P90 is the yield exceeded in 90% of the years.
+
+# Lifetime projection settings
+ASSET_LIFETIME = 25 # Years of operation of the lifetime projection
+DEGRADATION_RATE = 0.5 # Annual module degradation in % of the yield. Applied continuously, month by month.
+LID_LOSS = 2.0 # Light induced degradation in % of the yield, lost in the first days of operation and for the whole lifetime
+
+# Report settings
+REPORT_DPI = 360 # Resolution of the report figures
+REPORT_BACKEND = "seaborn" # "seaborn" draws the reports with plot_data. "matplotlib" draws them faster with plain bars on the precomputed totals (plot_yield).
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+
+# Batch settings
+SITE_COLUMNS = ["latitude", "longitude", "years", "panel_area", "STC_eff", "temp_coeff"] # Required fields of every site in a batch sites file
+
+# Instrumentation
+TRACE_PATH = None # Chrome trace JSON file of the stage durations and month requests (Open in chrome://tracing or ui.perfetto.dev). None disables tracing.
+PROFILE_DIR = None # Directory to dump a cProfile file per traced stage to (Read with pstats or snakeviz). None disables profiling.
+
+
+class Tracer:
+    ## Records the duration of every stage and month request while active, with details like rows, bytes downloaded and cache hits, and saves them
+    # as a Chrome trace (JSON). Spans are recorded with trace() and @traced, which do nothing unless a Tracer is active. Spans in worker processes aren't recorded.
+    # With a profile_dir, every stage (but not nested stages, or stages running while another one is profiled) is profiled with cProfile and dumped there.
+    active = None
+
+    def __init__(self, path=None, profile_dir=None):
+        self.path = path
+        self.profile_dir = profile_dir
+        self.events = []
+        self.lock = threading.Lock()
+        self.profiling = False
+        self.profiles = 0
+        self.start = time.perf_counter()
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def __enter__(self):
+        Tracer.active = self
+        return self
+
+    def __exit__(self, *exc):
+        Tracer.active = None
+        if self.path is not None:
+            self.save(self.path)
+
+    @contextmanager
+    def span(self, name, category="stage", **args):
+        # Yields the args dictionary of the span, so details can be added while it runs
+        profiler = None
+        if self.profile_dir is not None and category == "stage":
+            with self.lock:
+                if not self.profiling:
+                    import cProfile
+                    self.profiling = True
+                    profiler = cProfile.Profile()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            event = {"name": name, "cat": category, "ph": "X", "ts": round((start - self.start) * 1e6, 1), "dur": round((end - start) * 1e6, 1),
+                     "pid": os.getpid(), "tid": threading.get_ident(), "args": {key: value for key, value in args.items() if value is not None}}
+            if profiler is not None:
+                profiler.disable()
+            with self.lock:
+                if profiler is not None:
+                    self.profiles += 1
+                    event["args"]["profile"] = os.path.join(self.profile_dir, f"{self.profiles:03d}-{name.replace(' ', '-')}.prof")
+                    profiler.dump_stats(event["args"]["profile"])
+                    self.profiling = False
+                self.events.append(event)
+
+    def summary(self):
+        # Table of the total duration, rows, bytes and cache hits of every span name
+        columns = ["Duration (ms)", "Input rows", "Rows", "Bytes", "Cache hits"]
+        rows = [{"Name": event["name"], "Category": event["cat"], "Duration (ms)": event["dur"] / 1000, "Input rows": event["args"].get("input_rows", 0),
+                 "Rows": event["args"].get("rows", 0), "Bytes": event["args"].get("bytes", 0), "Cache hits": int(event["args"].get("cache_hit", False))} for event in self.events]
+        table = pd.DataFrame(rows, columns=["Name", "Category"] + columns)
+        summary = table.groupby(["Category", "Name"], sort=False).agg(Calls=("Name", "size"), **{column: (column, "sum") for column in columns})
+        return summary.reset_index()
+
+    def save(self, path):
+        # Chrome trace object format. The per span summary is stored as metadata.
+        with self.lock:
+            events = list(self.events)
+        trace_file = {"traceEvents": sorted(events, key=lambda event: event["ts"]), "displayTimeUnit": "ms", "otherData": {"summary": self.summary().to_dict("records")}}
+        with open(path, "w") as file:
+            json.dump(trace_file, file, indent=1, default=str)
+        return path
+
+
+@contextmanager
+def trace(name, category="stage", **args):
+    ## Context manager recording a span on the active Tracer. Yields a dictionary that details (e.g. rows) can be added to. Does nothing without an active Tracer.
+    tracer = Tracer.active
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, category, **args) as span:
+        yield span
+
+
+def traced(name):
+    ## Decorator recording every call of a function as a stage span on the active Tracer, with the number of rows of the first DataFrame argument and of a DataFrame result.
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if Tracer.active is None:
+                return function(*args, **kwargs)
+            with trace(name) as span:
+                frame = next((arg for arg in args if isinstance(arg, pd.DataFrame)), None)
+                if frame is not None:
+                    span["input_rows"] = len(frame)
+                result = function(*args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    span["rows"] = len(result)
+                return result
+        return wrapper
+    return decorator
 
 
 class SolarPanel:
-    def __init__(self, NOCT, G_NOCT, STC_temp, STC_eff, temp_coeff):
+    ## Fixed tilt monofacial panel model, and the base of the other panel models (See PANEL_MODELS).
+    ## A panel model simulates the irradiance data of its array_type, and can change the irradiance reaching the cells (effective_irradiance).
+    array_type = "fixed"
+
+    def __init__(self, NOCT, G_NOCT, STC_temp, STC_eff, temp_coeff, inverter_eff=INVERTER_EFF):
         self.NOCT = NOCT # Nominal Operating Cell Temperature. Typically 45 degrees Celsius. (Provided by cell manufacturer).
         self.G_NOCT = G_NOCT # Nominal Operating Cell Temperature irradiance. Typically 800 W/m2. (Provided by cell manufacturer).
         self.STC_temp = STC_temp # Standard Test Condition temperature. Typically 25 degrees Celsius. (Provided by cell manufacturer).
         self.STC_eff = STC_eff # Module efficiency at Standard Test Conditions in percentage (%). Varies by cell type. (Provided by cell manufacturer).
         self.temp_coeff = temp_coeff # Temperature coefficient of PMax. (How much module efficiency is affected by cell temp variations). Varies by cell type. (Provided by cell manufacturer).
+        self.inverter_eff = inverter_eff # Inverter efficiency in fractional value. Typically 0.96. (Provided by inverter manufacturer).
 
         # Getters and setters to prevent invalid instance attributes, both upon object construction and attempts to change the attributes elsewhere.
         @property
@@ -85,8 +294,16 @@ class SolarPanel:
                 self._temp_coeff = temp_coeff
 
     # Methods
+    # All calculation methods accept single values as well as NumPy arrays / pandas Series, and calculate every element in one vectorized pass.
+
+    # Irradiance reaching the cells, from the irradiance on the front side of the panel. The front side only for monofacial panels.
+    def effective_irradiance(self, Hourly_GTI, Total_GTI):
+        return np.asarray(Hourly_GTI, dtype=float), np.asarray(Total_GTI, dtype=float)
+
     # Calculate cell temperature based on ambient temp and irradiance conditions
     def calculate_celltemp(self, daytemp, Hourly_GTI): # Hourly_GTI = Average hourly GTI in W
+        daytemp = np.asarray(daytemp, dtype=float)
+        Hourly_GTI = np.asarray(Hourly_GTI, dtype=float)
         cell_temp = daytemp + (Hourly_GTI / self.G_NOCT) * (self.NOCT - 20)
         return cell_temp # Average cell temperature for the time interval of interest.
 
@@ -99,38 +316,331 @@ class SolarPanel:
 
     # Calculate electric energy yield based on irradiance data, size of panel area and adjusted, real panel efficiency.
     def calculate_yield(self, daytemp, Hourly_GTI, Total_GTI, panel_area): #Total_GTI = Total GTI in Wh
+        Hourly_GTI, Total_GTI = self.effective_irradiance(Hourly_GTI, Total_GTI)
         adjusted_efficiency = self.calculate_efficiency(daytemp, Hourly_GTI)
         energy_yield = (Total_GTI * panel_area * adjusted_efficiency) / 1000 # Energy yield in KWh
-        energy_yield = energy_yield * 0.96 # Account for 96% inverter efficiency (4% loss in DC to AC conversion)
+        energy_yield = energy_yield * self.inverter_eff # Account for inverter efficiency (Default 96%, 4% loss in DC to AC conversion)
         return energy_yield
 
+    # Batch simulation. Fills the "Energy Yield (KWh)" column of an aggregated DataFrame (from calculate_monthly_data or calculate_daily_data) in one vectorized pass.
+    @traced("simulate")
+    def calculate_yields(self, df, panel_area):
+        if not isinstance(df, pd.DataFrame):
+            raise TypeError("calculate_yields's df parameter expects a pandas.DataFrame object as input.")
+        df["Energy Yield (KWh)"] = self.calculate_yield(df["Average Daytime Temp"], df["Average hourly GTI (W/m2)"], df["Total GTI (Wh/m2)"], panel_area)
+        return df
+
+
+class TrackerPanel(SolarPanel):
+    ## Monofacial panels on single axis trackers. Simulates the irradiance on the tracked plane, fetched from Solcast with the horizontal_single_axis array type.
+    array_type = "horizontal_single_axis"
+
+
+class BifacialPanel(SolarPanel):
+    ## Fixed tilt bifacial panels. The rear side converts the irradiance reflected from the ground (rear_ratio x the front side irradiance)
+    ## with "bifaciality" times the front side efficiency. The rear side irradiance heats the cells like the front side irradiance.
+    def __init__(self, NOCT, G_NOCT, STC_temp, STC_eff, temp_coeff, inverter_eff=INVERTER_EFF, bifaciality=BIFACIALITY, rear_ratio=REAR_IRRADIANCE_RATIO):
+        super().__init__(NOCT, G_NOCT, STC_temp, STC_eff, temp_coeff, inverter_eff)
+        self.bifaciality = bifaciality # Rear side / front side efficiency. (Provided by cell manufacturer).
+        self.rear_ratio = rear_ratio # Rear side / front side irradiance. Depends on the ground albedo and mounting height.
+
+    def effective_irradiance(self, Hourly_GTI, Total_GTI):
+        gain = 1 + np.asarray(self.bifaciality, dtype=float) * self.rear_ratio
+        return np.asarray(Hourly_GTI, dtype=float) * gain, np.asarray(Total_GTI, dtype=float) * gain
+
+
+class BifacialTrackerPanel(BifacialPanel, TrackerPanel):
+    ## Bifacial panels on single axis trackers
+    pass
+
+
+# Panel models by name, for the --model setting and the model field of batch sites
+PANEL_MODELS = {"monofacial": SolarPanel, "tracker": TrackerPanel, "bifacial": BifacialPanel, "bifacial_tracker": BifacialTrackerPanel}
+
+
+def panel_model(name=None):
+    ## Returns the panel model class of a name in PANEL_MODELS. Empty names (e.g. a blank model field in a sites file) give the default PANEL_MODEL.
+    ## Panel model classes are returned as they are.
+    if isinstance(name, type) and issubclass(name, SolarPanel):
+        return name
+    if name is None or (isinstance(name, float) and np.isnan(name)) or name == "":
+        name = PANEL_MODEL
+    if name not in PANEL_MODELS:
+        raise ValueError(f"Unknown panel model {name}. Choose from: {', '.join(PANEL_MODELS)}.")
+    return PANEL_MODELS[name]
+
+
+class TokenBucket:
+    ## Thread safe token bucket rate limiter used to keep concurrent API requests within the Solcast request quota.
+    # Tokens are refilled continuously at "rate" tokens per second, up to "capacity" tokens. Every request consumes one token.
+    def __init__(self, rate, capacity):
+        if not rate > 0:
+            raise ValueError("TokenBucket rate must be a positive number.")
+        if not capacity >= 1:
+            raise ValueError("TokenBucket capacity must be at least 1.")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Block until a token is available, then consume it
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ResponseCache:
+    ## Persistent on-disk cache of API month responses, stored as zlib compressed JSON blobs in a SQLite file.
+    # Keyed by (latitude, longitude, output_parameters, array_type, start, end). The API key is not part of the key.
+    # Least recently used months are evicted when the total size of the blobs exceeds "max_bytes".
+    # Historical months never expire, but months fetched less than "recent_days" after they ended expire after "ttl" seconds (None = never).
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, ttl=None, recent_days=CACHE_RECENT_DAYS):
+        if not isinstance(max_bytes, int):
+            raise TypeError("ResponseCache max_bytes parameter expects an integer.")
+        if max_bytes < 0:
+            raise ValueError("ResponseCache max_bytes must be a positive integer.")
+        if ttl is not None and ttl < 0:
+            raise ValueError("ResponseCache ttl must be a positive number of seconds or None.")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.recent_days = recent_days
+        self.hits = 0
+        self.misses = 0
+        # One connection shared by the fetch threads, serialized by a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            recent INTEGER NOT NULL,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.connection.commit()
+
+    # Build the cache key of a request payload
+    @staticmethod
+    def make_key(payload):
+        output_parameters = payload["output_parameters"]
+        if not isinstance(output_parameters, str):
+            output_parameters = ",".join(output_parameters)
+        key = "|".join([str(payload["latitude"]), str(payload["longitude"]), output_parameters, payload["array_type"], payload["start"], payload["end"]])
+        # Only other periods than the default 30 minutes are part of the key, so responses cached before periods were configurable stay valid
+        if payload.get("period", "PT30M") != "PT30M":
+            key += f"|{payload['period']}"
+        return key
+
+    # Return the cached JSON response of a payload, or None if it is missing or expired
+    def get(self, payload):
+        key = self.make_key(payload)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT data, recent, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] and self.ttl is not None and now - row[2] > self.ttl):
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    # Store the JSON response of a payload, then evict least recently used months if the cache is too big
+    def put(self, payload, data):
+        key = self.make_key(payload)
+        blob = zlib.compress(json.dumps(data).encode(), 6)
+        now = time.time()
+        end = datetime.strptime(payload["end"], "%Y-%m-%dT%XZ")
+        recent = datetime.now() - end < timedelta(days=self.recent_days)
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", (key, blob, len(blob), int(recent), now, now))
+            self.evict()
+            self.connection.commit()
+
+    # Delete the least recently used months until the total size is within max_bytes. Called with the lock held.
+    def evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def close(self):
+        self.connection.close()
+
+
 def main():
     # Load API Key. The concept of storing the API Key in an .env file and importing using dotenv and os libraries was suggested by CS50 Duck Debugger.
+    from dotenv import load_dotenv
     load_dotenv()
     api_key = os.getenv('API_KEY')
-    # Retrieve variables for production location coordinates, number of years of historical data, size of solar farm, solar panel specifications and API Key
-    latitude, longitude, location, years, panel_area, STC_eff, temp_coeff = get_variables()
+    # Command line arguments runs the program without the interactive prompts, in batch mode for a list of sites or for a single site
+    if len(sys.argv) > 1:
+        args = parse_arguments(sys.argv[1:])
+        # Optional tracing of the stages and month requests to a Chrome trace file, and cProfile dumps per stage
+        with Tracer(args.trace, args.profile) if args.trace or args.profile else nullcontext():
+            if args.batch:
+                run_batch_mode(args, api_key)
+            else:
+                run_headless(args, api_key)
+        return
+    # Optional tracing of the stages and month requests to a Chrome trace file (TRACE_PATH), and cProfile dumps per stage (PROFILE_DIR)
+    with Tracer(TRACE_PATH, PROFILE_DIR) if TRACE_PATH or PROFILE_DIR else nullcontext():
+        # Retrieve variables for production location coordinates, number of years of historical data, size of solar farm, solar panel specifications and API Key
+        with trace("input"):
+            latitude, longitude, location, years, panel_area, STC_eff, temp_coeff = get_variables()
+        run_site(latitude, longitude, location, years, panel_area, STC_eff, temp_coeff, api_key)
+
+
+def run_site(latitude, longitude, location, years, panel_area, STC_eff, temp_coeff, api_key, name=None, report="solar-yield-analysis.pdf", results=RESULTS_PATH,
+             mode=SIMULATION_MODE, backend=REPORT_BACKEND, dpi=REPORT_DPI, max_workers=MAX_WORKERS, rate_limit=RATE_LIMIT, cache_path=CACHE_PATH, session=None,
+             period=DATA_PERIOD, resample=None, simulations=MC_SIMULATIONS, tmy=False, store=STORE_PATH, orientation=None, model=PANEL_MODEL):
+    ## Runs the pipeline of a single site with validated inputs: fetch, aggregate, simulate, export and plot. Used by the interactive and the headless mode.
+    ## Returns the simulated data at SIMULATION_RESOLUTION. cache_path None skips the local response cache.
+    ## Data is fetched in "period" intervals, and optionally resampled to the "resample" period before it is aggregated and simulated.
+    ## "simulations" synthetic years are simulated for the P50 / P75 / P90 annual yields of the report (0 skips the uncertainty analysis).
+    ## With tmy=True the site is simulated for its typical meteorological year, cached in the SiteStore directory "store" (See get_tmy).
+    ## orientation is a (tilt, azimuth) pair to simulate instead of Solcast's default fixed array (See orient_solar_data). Azimuth None faces the equator.
+    ## model is the name of the panel model in PANEL_MODELS. Its array type decides which irradiance data is fetched.
     # Retrieve raw irradiance and temperature data, clean up data and return as a DataFrame
-    data = get_solar_data(latitude, longitude, api_key, years)
-    # Manipulate the data and create monthly averages through the years
-    monthly_data = calculate_monthly_data(data)
-    # Initiate SolarPanel object to simulate photovoltaic energy production
-    Panel = SolarPanel(NOCT, G_NOCT, STC_temp, STC_eff, temp_coeff)
+    # Months already downloaded in an earlier run are loaded from the local response cache
+    if SIMULATION_RESOLUTION not in SIMULATION_RESOLUTIONS:
+        raise ValueError(f"SIMULATION_RESOLUTION must be one of {', '.join(SIMULATION_RESOLUTIONS)}, so the yields can be reported by month.")
+    Model = panel_model(model)
+    if orientation is not None and Model.array_type != "fixed":
+        raise ValueError(f"A panel orientation can only be set for fixed arrays, not for the {model} model.")
+    cache = ResponseCache(cache_path) if cache_path else None
+    try:
+        components = orientation is not None
+        if tmy:
+            data = get_tmy(latitude, longitude, api_key, years, SiteStore(store), max_workers=max_workers, rate_limit=rate_limit, session=session, cache=cache, period=period,
+                           components=components, array_type=Model.array_type)
+        else:
+            data = get_solar_data(latitude, longitude, api_key, years, max_workers=max_workers, rate_limit=rate_limit, session=session, cache=cache, period=period,
+                                  components=components, array_type=Model.array_type)
+    finally:
+        if cache is not None:
+            cache.close()
+    if orientation is not None:
+        data = orient_solar_data(data, latitude, longitude, *orientation)
+    if resample is not None and resample != period:
+        data = resample_intervals(data, resample)
+    # Manipulate the data and create averages through the years. Every resolution is aggregated in one pass, and the simulation uses SIMULATION_RESOLUTION.
+    aggregates = aggregate_data(data)
+    aggregated_data = aggregates[SIMULATION_RESOLUTION]
+    # Initiate the panel model object (SolarPanel by default) to simulate photovoltaic energy production
+    Panel = Model(NOCT, G_NOCT, STC_temp, STC_eff, temp_coeff)
     # Simulation process. Monthy by month averaged solar irradiance data and ambient temp is applied to SolarPanel's yield calculation method, and added to yield column in dataframe.
-    # Like raw sun irradiance hitting a PV panel, creating electricity
-    for index, row in monthly_data.iterrows():
-        monthly_data.at[index, "Energy Yield (KWh)"] = Panel.calculate_yield(row["Average Daytime Temp"], row["Average hourly GTI (W/m2)"], row["Total GTI (Wh/m2)"], panel_area)
+    # Like raw sun irradiance hitting a PV panel, creating electricity. All months are simulated in one vectorized pass.
+    aggregated_data = Panel.calculate_yields(aggregated_data, panel_area)
+    # Interval mode simulates every 30 minute interval instead, and reports how much it differs from the averaged approximation
+    if mode == "interval":
+        data = simulate_intervals(data, Panel, panel_area)
+        interval_yield = rollup_interval_yield(data)[SIMULATION_RESOLUTION]
+        print(compare_yield_models(aggregated_data, interval_yield).round(2).to_string())
+        aggregated_data["Energy Yield (KWh)"] = interval_yield["Energy Yield (KWh)"]
+    # Monte Carlo uncertainty analysis. Synthetic years resampled from the historical weather, with panel settings varied within their datasheet tolerances.
+    uncertainty = None
+    if simulations:
+        uncertainty = simulate_uncertainty(aggregates[MC_RESOLUTION], STC_eff, temp_coeff, panel_area, simulations, model=model)
+        print(exceedance_yields(uncertainty).round(2).to_string())
+    # Export the interval data, aggregates and yields to the Parquet results dataset, so they can be queried without running the simulation again
+    if results:
+        ResultsStore(results).export(name or f"{latitude}_{longitude}", data, aggregates["Daily"], aggregated_data if SIMULATION_RESOLUTION == "Monthly" else resample_aggregates(aggregated_data, "Monthly"))
     # Visualize the energy production yields through plots. One plot for yearly totals, and one for monthly averages (through the years).
-    yearly_plot = plot_data(monthly_data, "Years", panel_area, location)
-    monthly_plot = plot_data(monthly_data, "Months", panel_area, location)
-    # Save bar plots to a PDF
-    with PdfPages("solar-yield-analysis.pdf") as pdf:
-        pdf.savefig(yearly_plot)
-        pdf.savefig(monthly_plot)
-
-
-def get_variables():
-    ## Retrieve all variables needed for program to function, and validate them
+    # Save bar plots to a PDF, and close the figures
+    if report:
+        render_report(aggregated_data, panel_area, location, report, dpi=dpi, backend=backend, uncertainty=uncertainty)
+    return aggregated_data
+
+
+def run_headless(args, api_key):
+    ## Single site mode without the interactive prompts, for cron jobs and job queues. The site is validated with the same checks as get_variables,
+    ## and any invalid setting or failed stage exits with an error message and a non-zero exit code.
+    site = {column: getattr(args, column) for column in SITE_COLUMNS}
+    try:
+        latitude, longitude, years, panel_area, STC_eff, temp_coeff = validate_site(site)
+        latitude, longitude = validate_coordinates(latitude, longitude)
+        if not 2 <= years <= 10:
+            raise ValueError("Year must be an integer value between 2 and 10.")
+    except ValueError as e:
+        sys.exit(f"Invalid site: {e}")
+
+    try:
+        # Converts coordinates to location name. Offline from the gazetteer if given, otherwise with the cached network lookup.
+        if args.gazetteer:
+            location = reverse_geocode(latitude, longitude, offline=OfflineGeocoder(args.gazetteer))
+        else:
+            cache = GeocodeCache()
+            location = reverse_geocode(latitude, longitude, cache=cache)
+            cache.close()
+        # Results are exported to RESULTS_PATH by default, and not at all with --no-export
+        results = RESULTS_PATH if args.export is None else args.export or None
+        monthly_data = run_site(latitude, longitude, location, years, panel_area, STC_eff, temp_coeff, api_key, name=args.name, report=args.report,
+                                results=results, mode=args.mode or SIMULATION_MODE, backend=args.backend, dpi=args.dpi, max_workers=args.workers, rate_limit=args.rate_limit,
+                                cache_path=args.cache or None, period=args.period, resample=args.resample, simulations=args.simulations, tmy=args.tmy, store=args.store or STORE_PATH,
+                                orientation=None if args.tilt is None else (args.tilt, args.azimuth), model=args.model or PANEL_MODEL)
+        if args.lifetime:
+            monthly_data = monthly_data.reset_index().assign(Site=args.name or f"{latitude}_{longitude}")
+            write_lifetime(monthly_data, args)
+    except Exception as e:
+        sys.exit(f"Failed to simulate site {args.name or f'{latitude}_{longitude}'}: {type(e).__name__}: {e}")
+    print(f"Simulated {location}. Report saved to {args.report}")
+
+
+def run_batch_mode(args, api_key):
+    ## Batch mode for a list of sites from a sites file. See run_batch.
+    sites = load_sites(args.batch)
+    cache = ResponseCache(args.cache) if args.cache else None
+    store = SiteStore(args.store) if args.store else None
+    offline = OfflineGeocoder(args.gazetteer) if args.gazetteer else None
+    if args.tmy and store is None:
+        store = SiteStore()
+    results, failures = run_batch(sites, api_key, max_workers=args.workers, processes=args.processes, rate_limit=args.rate_limit, cache=cache, store=store, offline=offline,
+                                  period=args.period, tmy=args.tmy)
+    if cache is not None:
+        cache.close()
+    results.to_csv(args.output, index=False)
+    if args.export and not results.empty:
+        ResultsStore(args.export).write("monthly", results)
+    print(f"Simulated {results['Site'].nunique()} of {len(sites)} sites. Results saved to {args.output}")
+    for failure in failures.itertuples():
+        print(f"Failed site {failure.Site}: {failure.Error}")
+    if args.lifetime and not results.empty:
+        write_lifetime(results, args)
+    if args.reports:
+        rendered = render_reports(report_jobs(results, sites, args.reports, args.dpi, args.backend), processes=args.processes)
+        print(f"Rendered {rendered['Error'].isna().sum()} reports to {args.reports}")
+        for failure in rendered.dropna().itertuples():
+            print(f"Failed report {failure.Path}: {failure.Error}")
+
+
+def write_lifetime(results, args):
+    ## Projects the lifetime production of every site in a results table (a row per site and month, like run_batch returns) with project_lifetime.
+    ## The yearly curves of all sites are saved to the --lifetime CSV file, and the summary is printed.
+    yields = results.assign(**{"Energy Yield (KWh)": results["Energy Yield (KWh)"].astype(float)})
+    profiles = yields.pivot_table(index="Site", columns="Month", values="Energy Yield (KWh)", aggfunc="mean", sort=False)
+    summary, curves = project_lifetime(profiles, args.asset_life, args.degradation, args.lid)
+    curves.reset_index().to_csv(args.lifetime, index=False)
+    print(summary.round(2).to_string())
+    print(f"Lifetime projection of {len(summary)} sites over {args.asset_life} years saved to {args.lifetime}")
+
+
+def get_variables(cache_path=GEOCODE_CACHE_PATH):
+    ## Retrieve all variables needed for program to function, and validate them. Location names are cached in the GeocodeCache at cache_path.
 
     # Retrieves latitude and validates
     for _ in range(3):
@@ -156,10 +666,10 @@ def get_variables():
     else:
         sys.exit("Failed to provide valid longitude after 3 attempts.")
 
-    # The use of Nominatim module in GeoPy library for reverse geolocation was suggested in a YouTube video I watched.
-    # Converts coordinates to location name for later use
-    geoLoc = Nominatim(user_agent="GetLoc")
-    location = geoLoc.reverse(f"{latitude}, {longitude}", language="en-gb")
+    # Converts coordinates to location name for later use. Locations looked up before are loaded from the local geocoding cache.
+    cache = GeocodeCache(cache_path)
+    location = reverse_geocode(latitude, longitude, cache=cache)
+    cache.close()
 
     # Number of years back from current year to fetch data
     for _ in range(3):
@@ -218,9 +728,377 @@ def get_variables():
     return latitude, longitude, location, years, panel_area, STC_eff, temp_coeff
 
 
-def generate_date_ranges(years):
+def parse_arguments(argv):
+    ## Parses the command line arguments of the non-interactive modes: batch mode (--batch) for a list of sites, or a single headless site.
+    # Settings can also be read from a TOML, YAML or JSON config file (--config) with the same names as the arguments (e.g. panel_area, workers).
+    # Arguments given on the command line override the config file.
+    parser = argparse.ArgumentParser(description="Simulate solar energy production for a list of sites, or for a single site without the interactive prompts.")
+    parser.add_argument("--config", default=None, help="TOML, YAML or JSON file with any of these settings. Tables / sections are flattened, e.g. [site] latitude = -33.86")
+    # Single site and panel specifications
+    parser.add_argument("--name", default=None, help="Name of the site in the results dataset (default: <latitude>_<longitude>)")
+    parser.add_argument("--latitude", default=None, help="Latitude of the site in decimal degrees")
+    parser.add_argument("--longitude", default=None, help="Longitude of the site in decimal degrees")
+    parser.add_argument("--years", default=None, help="Number of years back from current year to fetch data for (2-10)")
+    parser.add_argument("--panel-area", dest="panel_area", default=None, help="Total panel area in m2")
+    parser.add_argument("--stc-eff", dest="STC_eff", default=None, help="Module efficiency at standard test conditions in %% (10-30)")
+    parser.add_argument("--temp-coeff", dest="temp_coeff", default=None, help="Temperature coefficient of PMax in %% per degree celsius (-0.5 to -0.3)")
+    parser.add_argument("--model", choices=list(PANEL_MODELS), default=None, help=f"Panel model of a single site (default: {PANEL_MODEL}). Batch sites set it in an optional model field")
+    parser.add_argument("--tilt", type=float, default=None, help="Panel tilt in degrees (0-90). Fetches GHI, DNI and DHI and transposes them to this orientation instead of Solcast's default fixed array")
+    parser.add_argument("--azimuth", type=float, default=None, help="Panel azimuth in degrees clockwise from north, with --tilt (default: facing the equator)")
+    parser.add_argument("--mode", choices=["monthly", "interval"], default=None, help=f"Simulate monthly averages, or every interval of a single site (default: {SIMULATION_MODE})")
+    parser.add_argument("--report", default="solar-yield-analysis.pdf", help="PDF (or PNG) report of a single site")
+    parser.add_argument("--backend", choices=["seaborn", "matplotlib"], default=REPORT_BACKEND, help="Plotting backend of the reports")
+    parser.add_argument("--lifetime", default=None, help="CSV file for the projected yearly and cumulative yields of every site over its asset life, with module degradation")
+    parser.add_argument("--asset-life", dest="asset_life", type=int, default=ASSET_LIFETIME, help="Years of operation of the lifetime projection")
+    parser.add_argument("--degradation", type=float, default=DEGRADATION_RATE, help="Annual module degradation in %% of the yield")
+    parser.add_argument("--lid", type=float, default=LID_LOSS, help="First year light induced degradation in %% of the yield")
+    parser.add_argument("--simulations", type=int, default=MC_SIMULATIONS, help="Synthetic years of the Monte Carlo analysis for the P50 / P75 / P90 annual yields of the report (0 disables it)")
+    # Batch mode
+    parser.add_argument("--batch", default=None, help="CSV or JSON file with one site per row / object. Fields: name (optional), " + ", ".join(SITE_COLUMNS))
+    parser.add_argument("--output", default="solar-yield-results.csv", help="CSV file for the consolidated results table")
+    parser.add_argument("--processes", type=int, default=None, help="Number of worker processes for the simulation (default: number of CPUs)")
+    parser.add_argument("--reports", default=None, help="Directory to render a PDF report per site into, in parallel worker processes")
+    parser.add_argument("--store", default=None, help="Directory of the local site store. Refreshes sites incrementally, only fetching months missing since the last run")
+    parser.add_argument("--tmy", action="store_true", help=f"Simulate a typical meteorological year of every site, built once and cached in the site store (default: {STORE_PATH})")
+    # Shared settings
+    parser.add_argument("--period", choices=list(PERIOD_MINUTES), default=DATA_PERIOD, help="Interval length of the fetched data. PT60M for screening many sites, PT5M for the most accurate final design")
+    parser.add_argument("--resample", choices=list(PERIOD_MINUTES), default=None, help="Resample the fetched data of a single site to this interval length before simulating it")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Number of concurrent downloads")
+    parser.add_argument("--rate-limit", dest="rate_limit", type=float, default=RATE_LIMIT, help="Max number of API requests per second")
+    parser.add_argument("--cache", default=CACHE_PATH, help="SQLite file of the local API response cache")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help="Don't use the local API response cache")
+    parser.add_argument("--gazetteer", default=None, help="Local gazetteer CSV (name, latitude, longitude) for naming the sites without network lookups")
+    parser.add_argument("--dpi", type=int, default=REPORT_DPI, help="Resolution of the report figures")
+    parser.add_argument("--trace", default=None, help="Chrome trace JSON file to record the duration of every stage and month request to")
+    parser.add_argument("--profile", default=None, help="Directory to dump a cProfile file per stage to")
+    parser.add_argument("--export", default=None, help=f"Directory of a Parquet results dataset, partitioned by site and year (single site default: {RESULTS_PATH}). Batch mode exports the monthly yields of every site.")
+    parser.add_argument("--no-export", dest="export", action="store_false", help="Don't export the results of a single site to the Parquet results dataset")
+    args = parser.parse_args(argv)
+
+    if args.config:
+        try:
+            config = load_config(args.config)
+        except (OSError, ValueError, ImportError) as e:
+            parser.error(f"Failed to read config file {args.config}: {e}")
+        unknown = sorted(key for key in config if key not in vars(args) or key == "config")
+        if unknown:
+            parser.error(f"Unknown settings in {args.config}: {', '.join(unknown)}")
+        # Config values become the defaults, so arguments given on the command line still win
+        parser.set_defaults(**config)
+        args = parser.parse_args(argv)
+
+    if args.batch is None:
+        missing = [column for column in SITE_COLUMNS if getattr(args, column) is None]
+        if missing:
+            parser.error(f"A single site run needs {', '.join(missing)} (as arguments or in --config), or use --batch for a sites file.")
+    else:
+        # Single site settings would otherwise be ignored by the batch mode
+        single_site = [f"--{name}" for name in ["mode", "model", "tilt", "azimuth", "resample"] if getattr(args, name) is not None]
+        if single_site:
+            parser.error(f"{', '.join(single_site)} can only be used for a single site run, not with --batch.")
+    return args
+
+
+def load_config(path):
+    ## Loads the settings of a TOML, YAML or JSON config file as a flat dictionary. Sections like [site] or [output] are flattened into their settings.
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as file:
+            config = tomllib.load(file)
+    elif path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("Reading YAML config files requires PyYAML (pip install pyyaml). TOML and JSON config files work without it.")
+        with open(path) as file:
+            config = yaml.safe_load(file) or {}
+    elif path.endswith(".json"):
+        with open(path) as file:
+            config = json.load(file)
+    else:
+        raise ValueError("Config file must be a .toml, .yaml, .yml or .json file.")
+    if not isinstance(config, dict):
+        raise ValueError("Config file must contain a table / mapping of settings.")
+
+    settings = {}
+    for key, value in config.items():
+        if isinstance(value, dict):
+            settings.update({str(subkey).replace("-", "_"): subvalue for subkey, subvalue in value.items()})
+        else:
+            settings[str(key).replace("-", "_")] = value
+    # Accept the command line spelling of the module efficiency as well
+    if "stc_eff" in settings:
+        settings["STC_eff"] = settings.pop("stc_eff")
+    return settings
+
+
+def load_sites(path):
+    ## Loads a list of sites with panel specs from a CSV or JSON file, and returns them as a list of dictionaries.
+    # Sites are only checked for the required fields here. The values are validated per site in run_batch, so one invalid site doesn't stop the batch.
+    if path.endswith(".json"):
+        with open(path) as file:
+            sites = json.load(file)
+        if not isinstance(sites, list):
+            raise ValueError("JSON sites file must contain a list of site objects.")
+    elif path.endswith(".csv"):
+        # Read everything as strings, so the coordinates are validated exactly as written in the file
+        sites = pd.read_csv(path, dtype=str).to_dict("records")
+    else:
+        raise ValueError("Sites file must be a .csv or .json file.")
+
+    for number, site in enumerate(sites, start=1):
+        missing = [column for column in SITE_COLUMNS if column not in site]
+        if missing:
+            raise ValueError(f"Site {number} in {path} is missing the fields: {', '.join(missing)}")
+        # Name sites without a name by their position in the file
+        if not site.get("name") or pd.isna(site["name"]):
+            site["name"] = f"Site {number}"
+    return sites
+
+
+def validate_site(site):
+    ## Converts and validates the panel specifications of a batch site, using the same range checks as get_variables.
+    # Coordinates and years are validated by get_solar_data.
+    try:
+        years = int(site["years"])
+        panel_area = int(site["panel_area"])
+        STC_eff = float(str(site["STC_eff"]).strip(" %"))
+        temp_coeff = float(str(site["temp_coeff"]).strip(" %"))
+    except ValueError:
+        raise ValueError("years and panel_area must be integers, STC_eff and temp_coeff must be numbers.")
+    if panel_area < 0:
+        raise ValueError("Panel area must be a positive integer.")
+    if not 10 < STC_eff < 30:
+        raise ValueError("Module efficiency at STC must be a value between 10 and 30.")
+    if not -0.5 < temp_coeff < -0.3:
+        raise ValueError("Temperature coefficient of PMax must be a value between -0.5 and -0.3.")
+    return str(site["latitude"]).strip(), str(site["longitude"]).strip(), years, panel_area, STC_eff, temp_coeff
+
+
+def simulate_site(monthly_data, panel_area, STC_eff, temp_coeff, model=PANEL_MODEL):
+    ## CPU stage of the batch mode, run in a worker process. Simulates the monthly energy yield of a site's monthly aggregates with its panel model.
+    Panel = panel_model(model)(NOCT, G_NOCT, STC_temp, STC_eff, temp_coeff)
+    return Panel.calculate_yields(monthly_data, panel_area)
+
+
+@traced("batch")
+def run_batch(sites, api_key, max_workers=MAX_WORKERS, processes=None, rate_limit=RATE_LIMIT, session=None, cache=None, store=None, offline=None, period=DATA_PERIOD, tmy=False):
+    ## Simulates a list of sites (from load_sites) and returns one consolidated results table with a row per site and month, and a table of failed sites.
+    # Downloads of all sites run in one shared I/O thread pool, sharing one keep-alive session and one request quota.
+    # As soon as a site's data is downloaded, it is aggregated to months in the I/O thread, and only the monthly aggregates are handed to a process pool
+    # for the simulation. The interval data of a site is released once it is aggregated, so memory doesn't grow with the number of sites.
+    # Every site is isolated: a failing site is reported in the failures table and the rest of the batch continues.
+    # If a SiteStore is passed in, sites are refreshed incrementally, so only months missing from the store are fetched.
+    # If an OfflineGeocoder is passed in, the results get a Location column, looked up without any network requests.
+    # All sites are fetched in "period" intervals, e.g. PT60M to screen many sites quickly.
+    # With tmy=True every site is simulated for its typical meteorological year, loaded from (or built into) the SiteStore.
+    # Every site is simulated with the panel model of its optional model field (See PANEL_MODELS), and fetched with that model's array type.
+    import requests
+    from requests.adapters import HTTPAdapter
+    if not isinstance(sites, list):
+        raise TypeError("run_batch's sites parameter expects a list of site dictionaries.")
+    if not isinstance(max_workers, int):
+        raise TypeError("max_workers parameter expects an integer.")
+    if max_workers < 1:
+        raise ValueError("max_workers must be a positive integer.")
+    if tmy and store is None:
+        raise ValueError("run_batch needs a SiteStore to cache the typical meteorological years in when tmy=True.")
+    # Results and failures are reported by site name, so every site needs a unique name
+    names = pd.Series([site.get("name") for site in sites], dtype=object)
+    if names.duplicated().any():
+        raise ValueError(f"run_batch's sites must have unique names. Duplicate names: {', '.join(map(str, names[names.duplicated()].unique()))}")
+
+    bucket = TokenBucket(rate_limit, RATE_BURST)
+    own_session = session is None
+    if own_session:
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+
+    # Fetch and aggregate one site. Each site fetches its months one at a time, so the I/O pool size is the total number of concurrent requests.
+    def fetch_site(site):
+        latitude, longitude, years, panel_area, STC_eff, temp_coeff = validate_site(site)
+        model = site.get("model")
+        array_type = panel_model(model).array_type
+        if tmy:
+            data = get_tmy(latitude, longitude, api_key, years, store, max_workers=1, session=session, cache=cache, bucket=bucket, period=period, array_type=array_type)
+            return calculate_monthly_data(data), panel_area, STC_eff, temp_coeff, model
+        if store is not None:
+            _, monthly_data, _ = refresh_solar_data(latitude, longitude, api_key, years, store, max_workers=1, session=session, cache=cache, bucket=bucket, period=period,
+                                                    array_type=array_type)
+            return monthly_data, panel_area, STC_eff, temp_coeff, model
+        data = get_solar_data(latitude, longitude, api_key, years, max_workers=1, session=session, cache=cache, bucket=bucket, period=period, array_type=array_type)
+        return calculate_monthly_data(data), panel_area, STC_eff, temp_coeff, model
+
+    results = []
+    failures = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as io_pool, ProcessPoolExecutor(max_workers=processes) as cpu_pool:
+            downloads = {io_pool.submit(fetch_site, site): site for site in sites}
+            simulations = {}
+            for future in as_completed(downloads):
+                # Drop the finished download once it is handed off, so its data can be released
+                site = downloads.pop(future)
+                try:
+                    simulations[cpu_pool.submit(simulate_site, *future.result())] = site
+                except Exception as e:
+                    failures.append({"Site": site["name"], "Stage": "fetch", "Error": f"{type(e).__name__}: {e}"})
+            for future in as_completed(simulations):
+                site = simulations.pop(future)
+                try:
+                    monthly_data = future.result().reset_index()
+                except Exception as e:
+                    failures.append({"Site": site["name"], "Stage": "simulate", "Error": f"{type(e).__name__}: {e}"})
+                    continue
+                # A site the gazetteer can't name is reported like any other failing site
+                try:
+                    location = offline.reverse(site["latitude"], site["longitude"]).address if offline is not None else None
+                except Exception as e:
+                    failures.append({"Site": site["name"], "Stage": "geocode", "Error": f"{type(e).__name__}: {e}"})
+                    continue
+                monthly_data.insert(0, "Site", site["name"])
+                monthly_data.insert(1, "Latitude", str(site["latitude"]))
+                monthly_data.insert(2, "Longitude", str(site["longitude"]))
+                if offline is not None:
+                    monthly_data.insert(3, "Location", location)
+                results.append(monthly_data)
+    finally:
+        if own_session:
+            session.close()
+
+    # Keep the sites in the same order as the sites file
+    order = {site["name"]: number for number, site in enumerate(sites)}
+    if results:
+        results = pd.concat(results, ignore_index=True)
+        results = results.sort_values(["Site", "Year", "Month"], key=lambda column: column.map(order) if column.name == "Site" else column, ignore_index=True)
+    else:
+        results = pd.DataFrame(columns=["Site", "Latitude", "Longitude", "Year", "Month"])
+    failures = pd.DataFrame(failures, columns=["Site", "Stage", "Error"])
+    failures = failures.sort_values("Site", key=lambda column: column.map(order), ignore_index=True)
+    return results, failures
+
+
+class GeocodeCache:
+    ## Persistent coordinate -> location cache for reverse geocoding, stored in a SQLite file.
+    # Coordinates are rounded to "precision" decimals (3 decimals is about 100 m), so nearby coordinates share one lookup.
+    def __init__(self, path=GEOCODE_CACHE_PATH, precision=GEOCODE_PRECISION):
+        if not isinstance(precision, int):
+            raise TypeError("GeocodeCache precision parameter expects an integer.")
+        if not 0 <= precision <= 7:
+            raise ValueError("GeocodeCache precision must be an integer between 0 and 7.")
+        self.path = path
+        self.precision = precision
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS locations (
+            key TEXT PRIMARY KEY,
+            address TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            raw TEXT NOT NULL)""")
+        self.connection.commit()
+
+    # Build the cache key of a coordinate pair, rounded to the cache precision
+    def make_key(self, latitude, longitude):
+        return f"{round(float(latitude), self.precision):.{self.precision}f},{round(float(longitude), self.precision):.{self.precision}f}"
+
+    # Return the cached geopy Location of a coordinate pair, or None if it isn't cached
+    def get(self, latitude, longitude):
+        from geopy.location import Location
+        with self.lock:
+            row = self.connection.execute("SELECT address, latitude, longitude, raw FROM locations WHERE key = ?", (self.make_key(latitude, longitude),)).fetchone()
+        if row is None:
+            return None
+        return Location(row[0], (row[1], row[2]), json.loads(row[3]))
+
+    # Store the geopy Location of a coordinate pair
+    def put(self, latitude, longitude, location):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO locations VALUES (?, ?, ?, ?, ?)",
+                (self.make_key(latitude, longitude), location.address, location.latitude, location.longitude, json.dumps(location.raw)))
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class OfflineGeocoder:
+    ## Offline reverse geocoder backed by a local gazetteer CSV file (e.g. an export of GeoNames cities), with a KD-tree spatial index.
+    # The gazetteer needs name, latitude and longitude columns. Optional admin and country columns are added to the location name.
+    # Places are indexed as 3D points on the unit sphere, so the nearest point in the KD-tree is also the nearest place on the globe.
+    def __init__(self, path=GAZETTEER_PATH):
+        from scipy.spatial import cKDTree
+        places = pd.read_csv(path, dtype={"name": str}, keep_default_na=False)
+        missing = [column for column in ["name", "latitude", "longitude"] if column not in places.columns]
+        if missing:
+            raise ValueError(f"Gazetteer {path} is missing the columns: {', '.join(missing)}")
+        if places.empty:
+            raise ValueError(f"Gazetteer {path} has no places.")
+        self.places = places
+        self.tree = cKDTree(self.to_unit_vectors(places["latitude"].to_numpy(dtype=float), places["longitude"].to_numpy(dtype=float)))
+
+    # Convert coordinates in decimal degrees to 3D points on the unit sphere
+    @staticmethod
+    def to_unit_vectors(latitude, longitude):
+        latitude = np.radians(latitude)
+        longitude = np.radians(longitude)
+        return np.column_stack([np.cos(latitude) * np.cos(longitude), np.cos(latitude) * np.sin(longitude), np.sin(latitude)])
+
+    # Return the nearest gazetteer place of a coordinate pair as a geopy Location. The raw data includes the distance to the place in km.
+    def reverse(self, latitude, longitude):
+        from geopy.location import Location
+        chord, index = self.tree.query(self.to_unit_vectors(float(latitude), float(longitude))[0])
+        place = self.places.iloc[index]
+        address = ", ".join(str(place[column]) for column in ["name", "admin", "country"] if column in place.index and place[column] != "")
+        raw = {column: (value.item() if hasattr(value, "item") else value) for column, value in place.items()}
+        raw["distance_km"] = round(2 * np.arcsin(min(chord / 2, 1)) * 6371.0, 3)
+        return Location(address, (float(place["latitude"]), float(place["longitude"])), raw)
+
+
+def reverse_geocode(latitude, longitude, cache=None, offline=None):
+    ## Converts coordinates to a geopy Location. Looks in the GeocodeCache first, then the OfflineGeocoder if provided, and only then
+    ## asks Nominatim (rate limited to about 1 request per second). New lookups are stored in the cache.
+    # The use of Nominatim module in GeoPy library for reverse geolocation was suggested in a YouTube video I watched.
+    if cache is not None:
+        location = cache.get(latitude, longitude)
+        if location is not None:
+            return location
+    if offline is not None:
+        location = offline.reverse(latitude, longitude)
+    else:
+        from geopy.geocoders import Nominatim
+        geoLoc = Nominatim(user_agent="GetLoc")
+        location = geoLoc.reverse(f"{latitude}, {longitude}", language="en-gb")
+    if cache is not None and location is not None:
+        cache.put(latitude, longitude, location)
+    return location
+
+
+def report_jobs(results, sites, directory, dpi=REPORT_DPI, backend=REPORT_BACKEND):
+    ## Builds one render_reports job per simulated site from run_batch's results table. Reports are named after the sites, and drawn with the plotting backend "backend".
+    # Locations are geopy Locations like in the single site reports, named by the Location column of the results or else by the coordinates.
+    from geopy.location import Location
+    os.makedirs(directory, exist_ok=True)
+    panel_areas = {site["name"]: int(site["panel_area"]) for site in sites}
+    jobs = []
+    for name, site_results in results.groupby("Site", sort=False):
+        latitude, longitude = site_results["Latitude"].iloc[0], site_results["Longitude"].iloc[0]
+        address = site_results["Location"].iloc[0] if "Location" in site_results.columns else f"{latitude}, {longitude}"
+        location = Location(address, (float(latitude), float(longitude)), {})
+        filename = re.sub(r"[^\w\-. ]", "_", str(name)) + ".pdf"
+        jobs.append({
+            "df": site_results.set_index(["Year", "Month"]).drop(columns=["Site", "Latitude", "Longitude", "Location"], errors="ignore"),
+            "panel_area": panel_areas[name],
+            "location": location,
+            "path": os.path.join(directory, filename),
+            "dpi": dpi,
+            "backend": backend})
+    return jobs
+
+
+def generate_date_ranges(years, today=None):
     ## Generator function to feed "start" and "end" parameteres for the API call.
     # Each parameter set / date range representing one month of data. The generator counts backwards "years" number of years (provided by the year parameter) from the current year.
+    # The current year is the year of "today" (default: date.today()).
 
     # Validate function argument
     if not isinstance(years, int):
@@ -229,7 +1107,7 @@ def generate_date_ranges(years):
         raise ValueError("Year must be an integer value between 2 and 10.")
 
     # Generates the start/end parameters and yields them.
-    start_year = date.today().year - years
+    start_year = (today or date.today()).year - years
     start_date = datetime(start_year, 1, 1)
     end_date = start_date + relativedelta(years=years) - timedelta(days=1)
     current_start = start_date
@@ -241,11 +1119,141 @@ def generate_date_ranges(years):
         current_start = current_end + timedelta(seconds=1)
 
 
-def get_solar_data(latitude, longitude, api_key, years):
-    ## Retrieves historical ambient temperature and irradiance data from API (1 month at a time, with data in 30 minute intervals) for the provided duration.
-    ## Creates a pandas dataframe of it for easier data manipulation. Irradiance type is GTI (Global Tilted Irradiance), where both weather conditions and tilt angle of panel is considered.
+def incremental_date_ranges(years, today=None):
+    ## Generator function like generate_date_ranges, for the incremental refresh mode. Counts backwards "years" number of years from the current year,
+    # but continues through the current year up to the end of yesterday, so the latest data is included. The current month is a partial range.
+    if not isinstance(years, int):
+        raise TypeError("Years parameter expects an integer.")
+    if not 2 <= years <= 10:
+        raise ValueError("Year must be an integer value between 2 and 10.")
 
-    # Validate function arguments
+    today = today or date.today()
+    current_start = datetime(today.year - years, 1, 1)
+    end_date = datetime(today.year, today.month, today.day) - timedelta(seconds=1)
+    while current_start < end_date:
+        current_end = min(current_start + relativedelta(months=1) - timedelta(seconds=1), end_date)
+        yield current_start.strftime("%Y-%m-%dT%XZ"), current_end.strftime("%Y-%m-%dT%XZ")
+        current_start = current_start + relativedelta(months=1)
+
+
+def fetch_month(session, payload, bucket=None, retries=RETRIES, backoff=BACKOFF, cache=None):
+    ## Fetches one month of data from the API through a shared (keep-alive) session and returns the parsed JSON.
+    # If a ResponseCache is provided, cached months are returned without any network I/O, and fetched months are stored in it.
+    # Rate limited requests (429), server errors (5xx) and connection errors are retried with exponential backoff.
+    # Other failed requests (e.g. wrong API key) are not worth retrying and raise HTTPError straight away.
+    # Every month is recorded as a request span on the active Tracer, with its cache hit, attempts, status code and bytes downloaded
+    with trace("month", "request", start=payload["start"]) as span:
+        return request_month(session, payload, bucket, retries, backoff, cache, span)
+
+
+def request_month(session, payload, bucket, retries, backoff, cache, span):
+    ## Request loop of fetch_month, filling in the details of the month's trace span
+    import requests
+    if cache is not None:
+        data = cache.get(payload)
+        span["cache_hit"] = data is not None
+        if data is not None:
+            return data
+
+    for attempt in range(retries + 1):
+        span["attempts"] = attempt + 1
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            response = session.get(SOLCAST_URL, params=payload, timeout=60)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise requests.HTTPError(f"Failed to fetch data for {payload['start']} after {retries + 1} attempts due to connection errors.")
+        else:
+            span["status"] = response.status_code
+            if response.status_code == 200:
+                data = response.json()
+                # In-process sources have no raw response body
+                span["bytes"] = len(response.content) if hasattr(response, "content") else None
+                if cache is not None:
+                    cache.put(payload, data)
+                return data
+            if response.status_code != 429 and response.status_code < 500:
+                raise requests.HTTPError("Failed to fetch data either due to wrong API key or a problem with the API sever.")
+            if attempt == retries:
+                raise requests.HTTPError(f"Failed to fetch data for {payload['start']} after {retries + 1} attempts. Status code: {response.status_code}")
+            # Respect the servers requested wait time if provided, up to the longest backoff, so a misbehaving server can't stall a worker
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                time.sleep(min(int(retry_after), backoff * 2 ** retries))
+                continue
+        # Exponential backoff with a little jitter so concurrent workers don't retry in lockstep
+        time.sleep(backoff * 2 ** attempt + random.uniform(0, backoff))
+
+
+def iter_months(session, payloads, bucket, cache, max_workers):
+    ## Generator yielding the JSON data of every month payload, in the same order as the payloads.
+    # Up to "max_workers" months are fetched concurrently. At most 2 x max_workers months are requested ahead of the month being consumed,
+    # so fetched months don't pile up in memory waiting for a slow month.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        payloads = iter(payloads)
+        for payload in payloads:
+            pending.append(executor.submit(fetch_month, session, payload, bucket, cache=cache))
+            if len(pending) >= 2 * max_workers:
+                break
+        while pending:
+            data = pending.popleft().result()
+            for payload in payloads:
+                pending.append(executor.submit(fetch_month, session, payload, bucket, cache=cache))
+                break
+            yield data
+
+
+def parse_month(data):
+    ## Parses the JSON data of one month into typed column arrays. Float32 measurements and datetime64 period ends (UTC, without timezone information).
+    records = data["estimated_actuals"]
+    count = len(records)
+    columns = {}
+    # Irradiance components are only in responses requested with components=True
+    keys = RESPONSE_COLUMNS | {key: column for key, column in COMPONENT_COLUMNS.items() if records and key in records[0]}
+    for key, column in keys.items():
+        if key == "period_end":
+            # Period ends look like "2022-01-01T00:30:00.0000000Z". Seconds precision is enough, and skips the timezone suffix.
+            columns[column] = np.array([record[key][:19] for record in records], dtype="datetime64[s]").astype("datetime64[ns]")
+        elif key == "period":
+            columns[column] = np.array([record[key] for record in records], dtype=object)
+        else:
+            columns[column] = np.fromiter((record[key] for record in records), dtype=np.float32, count=count)
+    return columns
+
+
+class IntervalBuffer:
+    ## Preallocated columnar buffer that parsed months are appended to. Capacity doubles whenever it runs out of rows.
+    # The column arrays are allocated on the first append, with the columns and dtypes of the first month.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.columns = {}
+
+    # Copy a parsed month (from parse_month) into the buffer
+    def append(self, month):
+        count = len(next(iter(month.values())))
+        if not self.columns:
+            self.capacity = max(self.capacity, count)
+            self.columns = {column: np.empty(self.capacity, dtype=array.dtype) for column, array in month.items()}
+        if self.size + count > self.capacity:
+            self.capacity = max(2 * self.capacity, self.size + count)
+            for column, array in self.columns.items():
+                grown = np.empty(self.capacity, dtype=array.dtype)
+                grown[:self.size] = array[:self.size]
+                self.columns[column] = grown
+        for column, array in self.columns.items():
+            array[self.size:self.size + count] = month[column]
+        self.size += count
+
+    # Return the filled part of the buffer as a DataFrame, without copying the arrays
+    def to_frame(self):
+        return pd.DataFrame({column: array[:self.size] for column, array in self.columns.items()}, copy=False)
+
+
+def validate_coordinates(latitude, longitude):
+    ## Validates latitude and longitude strings in decimal degrees, and returns them
     match = re.fullmatch(r"^[-+]?([1-8]?\d(\.\d+)?|90(\.0+)?)$", latitude)
     if match:
         latitude = match.group(0)
@@ -257,142 +1265,1220 @@ def get_solar_data(latitude, longitude, api_key, years):
         longitude = match.group(0)
     else:
         raise ValueError("Invalid longitude or format. Use decimal degrees.")
+    return latitude, longitude
+
+
+def get_solar_data(latitude, longitude, api_key, years, max_workers=MAX_WORKERS, rate_limit=RATE_LIMIT, session=None, cache=None, bucket=None, period=DATA_PERIOD, components=False,
+                   array_type="fixed"):
+    ## Retrieves historical ambient temperature and irradiance data from API (1 month at a time, with data in "period" intervals, 30 minutes by default) for the provided duration.
+    ## Creates a pandas dataframe of it for easier data manipulation. Irradiance type is GTI (Global Tilted Irradiance), where both weather conditions and tilt angle of panel is considered.
+    ## Months are fetched concurrently by up to "max_workers" threads over a shared keep-alive session, limited to "rate_limit" requests per second.
+    ## A session can be passed in to share its connection pool between several calls.
+    ## If a ResponseCache is passed in, months already stored locally are loaded from it instead of the API.
+    ## A TokenBucket can be passed in to share one request quota between several calls (rate_limit is then ignored).
+    ## With components=True the GHI, DNI and DHI are fetched as well, so the data can be transposed to any panel orientation (See transpose_irradiance).
+    ## array_type is the Solcast array type of the GTI, "fixed" or "horizontal_single_axis" (the array_type of the simulated panel model).
+
+    # Validate function arguments
+    latitude, longitude = validate_coordinates(latitude, longitude)
 
     if not isinstance(years, int):
         raise TypeError("Years parameter expects an integer.")
     if not 2 <= years <= 10:
         raise ValueError("Year must be an integer value between 2 and 10.")
 
-    # Build query strings, make API calls and store fetched JSON data in a list
-    all_data = []
-    url = "https://api.solcast.com.au/data/historic/radiation_and_weather?"
-    for start, end in generate_date_ranges(years):
-        payload = {
+    return fetch_solar_data(latitude, longitude, api_key, generate_date_ranges(years), max_workers, rate_limit, session, cache, bucket, period, components, array_type)
+
+
+@traced("fetch")
+def fetch_solar_data(latitude, longitude, api_key, date_ranges, max_workers=MAX_WORKERS, rate_limit=RATE_LIMIT, session=None, cache=None, bucket=None, period=DATA_PERIOD,
+                     components=False, array_type="fixed"):
+    ## Fetches the given (start, end) date ranges from the API and returns them as one formatted dataframe. Used by get_solar_data and refresh_solar_data.
+    # Coordinates are expected to be validated by the caller.
+    import requests
+    from requests.adapters import HTTPAdapter
+    if not isinstance(max_workers, int):
+        raise TypeError("max_workers parameter expects an integer.")
+    if max_workers < 1:
+        raise ValueError("max_workers must be a positive integer.")
+    if period not in PERIOD_MINUTES:
+        raise ValueError(f"period must be one of {', '.join(PERIOD_MINUTES)}.")
+    if array_type not in ARRAY_TYPES:
+        raise ValueError(f"array_type must be one of {', '.join(ARRAY_TYPES)}.")
+
+    # Build query strings, one per month
+    payloads = []
+    for start, end in date_ranges:
+        payloads.append({
             "latitude": latitude,
             "longitude": longitude,
-            "output_parameters": ["gti", "air_temp"],
-            "array_type": "fixed",
+            "output_parameters": ["gti", "air_temp"] + (list(COMPONENT_COLUMNS) if components else []),
+            "array_type": array_type,
             "start": start,
             "end": end,
+            "period": period,
             "format": "json",
             "api_key": api_key,
-            }
-        # Store all JSON data in one list
-        response = requests.get(url, params=payload)
-        if response.status_code == 200:
-            all_data.append(response.json())
+            })
+
+    # Make API calls concurrently, and parse every month straight into typed column arrays as soon as it arrives (in chronological order).
+    # The JSON of a month is discarded once parsed, so peak memory stays close to the size of the final dataframe.
+    # Capacity is preallocated for the longest possible months (31 days of intervals), and grows if more rows arrive.
+    if bucket is None:
+        bucket = TokenBucket(rate_limit, RATE_BURST)
+    own_session = session is None
+    if own_session:
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+    buffer = IntervalBuffer(len(payloads) * 31 * 24 * 60 // PERIOD_MINUTES[period])
+    try:
+        for data in iter_months(session, payloads, bucket, cache, max_workers):
+            buffer.append(parse_month(data))
+    finally:
+        if own_session:
+            session.close()
+    return format_solar_data(buffer.to_frame())
+
+
+def synthetic_payload(params, extra_fields=0):
+    ## Deterministic synthetic "estimated_actuals" JSON for the start to end range of a request, in the same format as the Solcast API.
+    # Clear sky like GTI and air temperature curves with a seasonal variation, in the requested period (30 minutes by default).
+    # extra_fields adds that many filler parameters to every record, to simulate larger responses (e.g. more output_parameters).
+    period = params.get("period", "PT30M")
+    minutes = PERIOD_MINUTES[period]
+    periods = pd.date_range(params["start"], params["end"], freq=f"{minutes}min") + pd.Timedelta(minutes=minutes)
+    hours = periods.hour + periods.minute / 60
+    gti = np.clip(900 * np.sin(np.pi * (hours - 6) / 12), 0, None) * (1 + 0.2 * np.cos(periods.month))
+    # Trackers face the sun all day, which flattens the daily GTI curve
+    if params.get("array_type", "fixed") == "horizontal_single_axis":
+        gti = 900 * (gti / 900) ** 0.6
+    elif params.get("array_type", "fixed") != "fixed":
+        raise ValueError(f"Unknown array_type {params['array_type']}")
+    air_temp = 15 + 8 * np.sin(np.pi * (hours - 9) / 12) + 5 * np.cos(2 * np.pi * periods.month / 12)
+    records = [{"air_temp": round(float(t), 1), "gti": round(float(g)), "period_end": p.strftime("%Y-%m-%dT%H:%M:%S.0000000Z"), "period": period}
+               for t, g, p in zip(air_temp, gti, periods)]
+    # Irradiance components of a clear sky at the requested location, with a daily varying diffuse fraction
+    output_parameters = params.get("output_parameters", [])
+    if isinstance(output_parameters, str):
+        output_parameters = output_parameters.split(",")
+    if "ghi" in output_parameters:
+        zenith, _, _ = solar_position((periods - pd.Timedelta(minutes=minutes / 2)).tz_localize(None).to_numpy(), float(params["latitude"]), float(params["longitude"]))
+        cos_zenith = np.cos(np.radians(zenith))
+        ghi = 1050 * np.clip(cos_zenith, 0, None) ** 1.2
+        dhi = ghi * (0.15 + 0.2 * (np.sin(periods.dayofyear.to_numpy()) + 1) / 2)
+        dni = np.where(cos_zenith > 0.05, (ghi - dhi) / np.maximum(cos_zenith, 0.05), 0)
+        dhi = np.where(cos_zenith > 0.05, dhi, ghi)
+        for record, g, n, d in zip(records, ghi, dni, dhi):
+            record.update(ghi=round(float(g)), dni=round(float(n)), dhi=round(float(d)))
+    for number in range(extra_fields):
+        for record in records:
+            record[f"extra_{number}"] = record["gti"]
+    return {"estimated_actuals": records}
+
+
+class SyntheticResponse:
+    ## Response of the in-process SyntheticSource, with the parts of requests.Response that fetch_month uses
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+
+# Data sources. Anything with the get(url, params=..., timeout=...) method of requests.Session can be passed as the session of
+# get_solar_data, refresh_solar_data and run_batch. By default a requests.Session fetches from the Solcast API (SOLCAST_URL).
+class SyntheticSource:
+    ## In-process data source serving synthetic_payload, without any sockets or JSON encoding. latency (seconds) is slept per request to simulate the round trip.
+    def __init__(self, latency=0.0, extra_fields=0):
+        if latency < 0:
+            raise ValueError("SyntheticSource latency must be a positive number of seconds.")
+        self.latency = latency
+        self.extra_fields = extra_fields
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        with self.lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return SyntheticResponse(200, synthetic_payload(params, self.extra_fields))
+
+
+class HTTPSource:
+    ## Data source sending the requests for SOLCAST_URL to another Solcast compatible endpoint, e.g. a SolcastStandIn, over one keep-alive session.
+    def __init__(self, url, max_workers=MAX_WORKERS):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.url = url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, params=None, timeout=None):
+        return self.session.get(self.url, params=params, timeout=timeout)
+
+    def close(self):
+        self.session.close()
+
+
+class SolcastStandIn:
+    ## Local HTTP server standing in for the Solcast historic radiation and weather endpoint, for offline tests and benchmarks.
+    # Serves synthetic_payload as JSON after "latency" seconds, with one thread per connection. Requests without an API key, or with another key
+    # than api_key (if set), get a 401 like the real API. Use as a context manager, and fetch from it with session().
+    def __init__(self, latency=0.0, extra_fields=0, api_key=None, host="127.0.0.1", port=0):
+        if latency < 0:
+            raise ValueError("SolcastStandIn latency must be a positive number of seconds.")
+        if not isinstance(extra_fields, int) or extra_fields < 0:
+            raise ValueError("SolcastStandIn extra_fields must be a positive integer.")
+        self.latency = latency
+        self.extra_fields = extra_fields
+        self.api_key = api_key
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/data/historic/radiation_and_weather"
+
+    def start(self):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 keeps the connections of a session alive, like the real API
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stand_in.respond(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def respond(self, request):
+        from urllib.parse import urlsplit, parse_qs
+        url = urlsplit(request.path)
+        params = {key: ",".join(values) for key, values in parse_qs(url.query).items()}
+        if url.path != "/data/historic/radiation_and_weather":
+            status, data = 404, {"response_status": {"message": "Not found"}}
+        elif not params.get("api_key") or (self.api_key is not None and params["api_key"] != self.api_key):
+            status, data = 401, {"response_status": {"message": "Invalid API key"}}
+        else:
+            try:
+                status, data = 200, synthetic_payload(params, self.extra_fields)
+            except (KeyError, ValueError) as e:
+                status, data = 400, {"response_status": {"message": f"Invalid request: {e}"}}
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps(data).encode()
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += len(body)
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def session(self, max_workers=MAX_WORKERS):
+        return HTTPSource(self.url, max_workers)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class SiteStore:
+    ## Local store of the interval data and monthly aggregates of every site, used by the incremental refresh mode.
+    # Every site and array type gets its own directory with intervals.parquet, monthly.parquet and manifest.json. The manifest records which
+    # month ranges are stored, and whether a month was stored before it was complete.
+    def __init__(self, directory=STORE_PATH):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    # Directory of a site, named by its coordinates. Other array types than fixed get their own directory, so fixed and tracker data of a site are kept side by side.
+    def site_directory(self, latitude, longitude, array_type="fixed"):
+        if array_type == "fixed":
+            return os.path.join(self.directory, f"{latitude}_{longitude}")
+        return os.path.join(self.directory, f"{latitude}_{longitude}_{array_type}")
+
+    # Return the stored interval data, monthly aggregates and manifest of a site. Empty if the site isn't stored yet.
+    def load(self, latitude, longitude, array_type="fixed"):
+        directory = self.site_directory(latitude, longitude, array_type)
+        if not os.path.exists(os.path.join(directory, "manifest.json")):
+            return None, None, {}
+        with open(os.path.join(directory, "manifest.json")) as file:
+            manifest = json.load(file)
+        data = pd.read_parquet(os.path.join(directory, "intervals.parquet"))
+        monthly_data = pd.read_parquet(os.path.join(directory, "monthly.parquet"))
+        return data, monthly_data, manifest
+
+    # Store the interval data, monthly aggregates and manifest of a site. The manifest is written last, so an interrupted save is refetched next time.
+    def save(self, latitude, longitude, data, monthly_data, manifest, array_type="fixed"):
+        directory = self.site_directory(latitude, longitude, array_type)
+        os.makedirs(directory, exist_ok=True)
+        data.to_parquet(os.path.join(directory, "intervals.parquet"))
+        monthly_data.to_parquet(os.path.join(directory, "monthly.parquet"))
+        with open(os.path.join(directory, "manifest.json"), "w") as file:
+            json.dump(manifest, file, indent=1)
+
+    # Return the stored typical meteorological year of a site (tmy.parquet) and its manifest (tmy.json). Empty if no TMY is stored yet.
+    def load_tmy(self, latitude, longitude, array_type="fixed"):
+        directory = self.site_directory(latitude, longitude, array_type)
+        if not os.path.exists(os.path.join(directory, "tmy.json")):
+            return None, {}
+        with open(os.path.join(directory, "tmy.json")) as file:
+            manifest = json.load(file)
+        return pd.read_parquet(os.path.join(directory, "tmy.parquet")), manifest
+
+    # Store the typical meteorological year of a site. The manifest is written last, like in save.
+    def save_tmy(self, latitude, longitude, tmy, manifest, array_type="fixed"):
+        directory = self.site_directory(latitude, longitude, array_type)
+        os.makedirs(directory, exist_ok=True)
+        tmy.to_parquet(os.path.join(directory, "tmy.parquet"))
+        with open(os.path.join(directory, "tmy.json"), "w") as file:
+            json.dump(manifest, file, indent=1)
+
+
+def refresh_solar_data(latitude, longitude, api_key, years, store, today=None, max_workers=MAX_WORKERS, rate_limit=RATE_LIMIT, session=None, cache=None, bucket=None, period=DATA_PERIOD,
+                       array_type="fixed"):
+    ## Incremental mode of get_solar_data. Only months missing from the SiteStore, or stored before they were complete, are fetched from the API.
+    ## The fetched months are merged into the stored interval data and monthly aggregates, and only the refreshed months are aggregated again.
+    ## Returns the interval data and monthly aggregates of the requested window, and the number of months fetched.
+    latitude, longitude = validate_coordinates(latitude, longitude)
+    if not isinstance(store, SiteStore):
+        raise TypeError("refresh_solar_data's store parameter expects a SiteStore object.")
+
+    date_ranges = list(incremental_date_ranges(years, today))
+    data, monthly_data, manifest = store.load(latitude, longitude, array_type)
+    # A month is stale if it was stored as a partial month, i.e. with an earlier end than the full month range has now, or with another period or array type
+    missing = [(start, end) for start, end in date_ranges if start not in manifest or manifest[start]["end"] < end or manifest[start].get("period", "PT30M") != period
+               or manifest[start].get("array_type", "fixed") != array_type]
+
+    if missing:
+        fetched = fetch_solar_data(latitude, longitude, api_key, missing, max_workers, rate_limit, session, cache, bucket, period, array_type=array_type)
+        # Intervals belong to the month they start in, like in aggregate_data
+        refreshed_months = [int(start[:4]) * 12 + int(start[5:7]) for start, end in missing]
+        if data is None:
+            data = fetched
+        else:
+            # Replace the stale rows of refreshed months with the fetched rows
+            starts = pd.DatetimeIndex(period_starts(data))
+            data = data[~(starts.year * 12 + starts.month).isin(refreshed_months)]
+            data = pd.concat([data, fetched]).astype(SOLAR_DATA_SCHEMA).sort_index()
+        # Aggregate only the refreshed months, and merge them into the stored monthly aggregates
+        starts = pd.DatetimeIndex(period_starts(data))
+        in_refreshed = (starts.year * 12 + starts.month).isin(refreshed_months)
+        refreshed_monthly = aggregate_data(data[in_refreshed], ["Monthly"])["Monthly"]
+        refreshed_monthly["Energy Yield (KWh)"] = np.nan
+        if monthly_data is None:
+            monthly_data = refreshed_monthly
         else:
-            raise requests.HTTPError("Failed to fetch data either due to wrong API key or a problem with the API sever.")
-
-    # Normalize the list of data as one dataframe per month (list element), and store them one by one in a new list of data frames.
-    normalised_data = []
-    for month in range(len(all_data)):
-        normalised_data.append(pd.json_normalize(all_data[month]["estimated_actuals"]))
-    # Concatenate all the dataframes into one big dataframe called "df"
-    df = pd.concat(normalised_data, ignore_index=True)
-
-    # Rename columns, and add Sun Hours column
-    df.columns = ["Air Temp", "W/m2 (GTI)", "Period end", "Period"]
-    df["Sun Hours"] = 0
-    # Converts Period end column in dataframe into a datetime object for easier date/time manipulation
-    df["Period end"] = pd.to_datetime(df["Period end"])
-    # Removes the timezone information (UTC timezone offset) for groupby method to work by accessing dt (datetime) attributes / methods of dataframe
-    df["Period end"] = df["Period end"].dt.tz_localize(None)
-    # Counts up the sun hours of the dataframe using pandas internal optimizations. Adds 0.5 sun hours because each row represents a 30 minute interval.
-    df["Sun Hours"] = df["Sun Hours"].astype(float)
-    df.loc[df["W/m2 (GTI)"] > 0, "Sun Hours"] = 0.5
-    # Initializes Daytime Temp column, then populates it with only daytime temperatures extracted from the Air Temp column. Used for more precise Cell Temp calculations during production hours.
-    df["Daytime Temp"] = None
-    df.loc[df["W/m2 (GTI)"] > 0, "Daytime Temp"] = df["Air Temp"]
+            monthly_data = pd.concat([monthly_data, refreshed_monthly])
+            monthly_data = monthly_data[~monthly_data.index.duplicated(keep="last")].sort_index()
+        fetched_at = datetime.now().isoformat(timespec="seconds")
+        for start, end in missing:
+            manifest[start] = {"end": end, "period": period, "array_type": array_type, "fetched_at": fetched_at}
+        store.save(latitude, longitude, data, monthly_data, manifest, array_type)
+
+    # Return only the requested window, the same years as get_solar_data fetches (See generate_date_ranges). Older stored months and the current, partial
+    # year are kept in the store. Intervals belong to the month they start in, like in aggregate_data.
+    window = list(generate_date_ranges(years, today))
+    window_start, window_end = (np.datetime64(pd.Timestamp(timestamp.rstrip("Z"))) for timestamp in (window[0][0], window[-1][1]))
+    starts = period_starts(data)
+    data = data[(starts >= window_start) & (starts <= window_end)]
+    stored_years = monthly_data.index.get_level_values("Year")
+    monthly_data = monthly_data[(stored_years >= int(window[0][0][:4])) & (stored_years <= int(window[-1][1][:4]))].copy()
+    monthly_data["Energy Yield (KWh)"] = None
+    return data, monthly_data, len(missing)
+
+
+def get_tmy(latitude, longitude, api_key, years, store, max_workers=MAX_WORKERS, rate_limit=RATE_LIMIT, session=None, cache=None, bucket=None, period=DATA_PERIOD,
+            components=False, array_type="fixed"):
+    ## Returns the typical meteorological year of a site (See build_tmy). Loaded from the SiteStore without any requests if it was built from the same
+    ## years and period before. Otherwise "years" years of data are fetched with get_solar_data, and the TMY is built and stored.
+    ## Later simulations and sweeps of the site then run against one small cached year instead of years of intervals.
+    latitude, longitude = validate_coordinates(latitude, longitude)
+    if not isinstance(store, SiteStore):
+        raise TypeError("get_tmy's store parameter expects a SiteStore object.")
+
+    # The TMY is rebuilt when the fetched window moves to a new year, like generate_date_ranges
+    source = {"first_year": date.today().year - years, "years": years, "period": period, "components": components, "array_type": array_type}
+    tmy, manifest = store.load_tmy(latitude, longitude, array_type)
+    if tmy is not None and all(manifest.get(key) == value for key, value in source.items()):
+        return tmy
+
+    data = get_solar_data(latitude, longitude, api_key, years, max_workers=max_workers, rate_limit=rate_limit, session=session, cache=cache, bucket=bucket, period=period,
+                          components=components, array_type=array_type)
+    selection = select_typical_months(data)
+    tmy = build_tmy(data, selection)
+    manifest = source | {"months": {str(month): {"year": int(year), "fs": float(fs)} for month, year, fs in zip(selection.index, selection["Year"], selection["FS Statistic"])},
+                         "built_at": datetime.now().isoformat(timespec="seconds")}
+    store.save_tmy(latitude, longitude, tmy, manifest, array_type)
+    return tmy
+
+
+class ResultsStore:
+    ## Columnar results dataset of the simulated sites, for downstream analytics without re-running the simulation.
+    # Every table is a Parquet dataset, hive partitioned by site and year: <directory>/<table>/Site=<site>/Year=<year>/part-0.parquet.
+    # Exporting a site again replaces all of its partitions, including years it no longer has. _schema.json records the RESULTS_SCHEMA_VERSION and column types
+    # of every table, and every site of a table must have the same columns.
+    def __init__(self, directory=RESULTS_PATH):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    # Directory of a table, after checking that it's one of RESULTS_TABLES
+    def table_directory(self, table):
+        if table not in RESULTS_TABLES:
+            raise ValueError(f"Results table must be one of: {', '.join(RESULTS_TABLES)}")
+        return os.path.join(self.directory, table)
+
+    # Write a DataFrame to a table. Interval data (DatetimeIndex) is flattened to its columns and aggregates (Year, Month... index) to index columns.
+    # The Site column is added from site, or taken from df (e.g. run_batch's results table with many sites).
+    def write(self, table, df, site=None):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        directory = self.table_directory(table)
+        df = df.reset_index(drop=isinstance(df.index, pd.DatetimeIndex))
+        if site is not None:
+            df.insert(0, "Site", str(site))
+        elif "Site" not in df.columns:
+            raise ValueError("ResultsStore.write needs a site, or a Site column in df.")
+        if "Year" not in df.columns:
+            df["Year"] = df["Period end"].dt.year
+        # Yields are None until simulated
+        if "Energy Yield (KWh)" in df.columns:
+            df["Energy Yield (KWh)"] = df["Energy Yield (KWh)"].astype(float)
+        df["Site"] = df["Site"].astype(str)
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        arrow_table = arrow_table.replace_schema_metadata({**(arrow_table.schema.metadata or {}), b"schema_version": str(RESULTS_SCHEMA_VERSION).encode()})
+        schema = {"schema_version": RESULTS_SCHEMA_VERSION, "columns": {field.name: str(field.type) for field in arrow_table.schema}}
+
+        # Directories of the written sites' partitions, named like write_dataset names them (e.g. Site=Site%2F2)
+        partitioning = ds.partitioning(pa.schema([("Site", pa.string())]), flavor="hive")
+        sites = {os.path.join(directory, partitioning.format(ds.field("Site") == site)[0]) for site in df["Site"].unique()}
+        # Check the columns against the other sites of the table before anything is deleted or written
+        schema_path = os.path.join(directory, "_schema.json")
+        if os.path.exists(schema_path):
+            with open(schema_path) as file:
+                stored = json.load(file)
+            others = [entry.path for entry in os.scandir(directory) if entry.is_dir() and entry.path not in sites]
+            if others and stored != schema:
+                raise ValueError(f"The {table} results in {self.directory} have other columns than the exported {table} data: "
+                                 f"{', '.join(stored['columns'])} instead of {', '.join(schema['columns'])}. Export it to another results directory.")
+        for site_directory in sites:
+            shutil.rmtree(site_directory, ignore_errors=True)
+        ds.write_dataset(arrow_table, directory, format="parquet", partitioning=["Site", "Year"], partitioning_flavor="hive",
+                         basename_template="part-{i}.parquet", existing_data_behavior="delete_matching")
+        with open(schema_path, "w") as file:
+            json.dump(schema, file, indent=1)
+        return len(df)
+
+    # Export a simulated site. Tables that are None are skipped.
+    @traced("export")
+    def export(self, site, intervals=None, daily=None, monthly=None):
+        for table, df in zip(RESULTS_TABLES, [intervals, daily, monthly]):
+            if df is not None:
+                self.write(table, df, site)
+
+    # Load a table as a flat DataFrame, memory-mapping the Parquet files. Only partitions and row groups matching the filter are read.
+    # filter is a pyarrow.dataset expression (e.g. pyarrow.dataset.field("Energy Yield (KWh)") > 1000). sites and years are shorthands for partition filters.
+    def load(self, table, filter=None, columns=None, sites=None, years=None, memory_map=True):
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+        directory = self.table_directory(table)
+        if not os.path.exists(os.path.join(directory, "_schema.json")):
+            raise FileNotFoundError(f"No {table} results exported to {self.directory} yet.")
+        with open(os.path.join(directory, "_schema.json")) as file:
+            version = json.load(file)["schema_version"]
+        if version != RESULTS_SCHEMA_VERSION:
+            raise ValueError(f"{table} results have schema version {version}, but this version of the program reads version {RESULTS_SCHEMA_VERSION}.")
+        dataset = ds.dataset(directory, format="parquet", partitioning="hive", filesystem=fs.LocalFileSystem(use_mmap=memory_map))
+        predicates = [] if filter is None else [filter]
+        if sites is not None:
+            predicates.append(ds.field("Site").isin([str(site) for site in sites]))
+        if years is not None:
+            predicates.append(ds.field("Year").isin([int(year) for year in years]))
+        for predicate in predicates[1:]:
+            predicates[0] = predicates[0] & predicate
+        df = dataset.to_table(filter=predicates[0] if predicates else None, columns=columns).to_pandas()
+        # Partition columns are read last. Move them to the front, where they were written.
+        partitions = [column for column in ["Site", "Year"] if column in df.columns]
+        return df[partitions + [column for column in df.columns if column not in partitions]]
+
+
+def format_solar_data(df):
+    ## Adds the Sun Hours and Daytime Temp columns to parsed interval data, and converts it to the compact SOLAR_DATA_SCHEMA with a datetime64 index.
+    sunny = df["W/m2 (GTI)"].to_numpy() > 0
+    # Counts up the sun hours. Adds the length of the interval in hours (e.g. 0.5 for PT30M) for every sunny row.
+    df["Sun Hours"] = np.where(sunny, period_hours(df), 0).astype(np.float32)
+    # Populates Daytime Temp with only daytime temperatures extracted from the Air Temp column, and NaN at night. Used for more precise Cell Temp calculations during production hours.
+    df["Daytime Temp"] = np.where(sunny, df["Air Temp"].to_numpy(), np.nan).astype(np.float32)
+    df = df.astype(SOLAR_DATA_SCHEMA)
+    # Index the rows by their period end, while keeping the Period end column for the aggregations
+    df.index = pd.DatetimeIndex(df["Period end"], name=None)
     return df
 
 
-def calculate_daily_data(df): # Note: Not currently used in main(), but available for use. Plot_data will need adjustment.
-    # CS50 Duck Debugger in addition to online resources like stackoverflow.com and YouTube helped assist me on how to use the Pandas library.
-    # Performs calculations on the short interval input data for daily temperature averages, total irradiance, total sun hours and average hourly GTI
-    # The model used for calculating average temperature and average hourly GTI is based on only using data during sun hours for more accurate estimations.
+def period_hours(df):
+    ## Returns the interval length in hours of every row, read from the Period column (e.g. PT30M = 0.5 hours). Looked up once per category, not per row.
+    periods = df["Period"]
+    if not isinstance(periods.dtype, pd.CategoricalDtype):
+        periods = periods.astype("category")
+    unknown = [period for period in periods.cat.categories if period not in PERIOD_MINUTES]
+    if unknown:
+        raise ValueError(f"Unsupported interval periods {', '.join(map(str, unknown))}. Supported periods are {', '.join(PERIOD_MINUTES)}.")
+    hours = np.array([PERIOD_MINUTES[period] / 60 for period in periods.cat.categories] + [np.nan])
+    # Missing periods (code -1) give NaN hours
+    return hours[periods.cat.codes.to_numpy()]
+
+
+def period_starts(df, hours=None):
+    ## Returns the start of every interval, from its period end and length
+    if hours is None:
+        hours = period_hours(df)
+    return df["Period end"].to_numpy() - (hours * 60).round().astype(np.int64).astype("timedelta64[m]")
+
+
+@traced("resample")
+def resample_intervals(df, period):
+    ## Resamples interval data (from get_solar_data) to another interval length, e.g. 5 minute data to hourly data for screening, in one vectorized pass.
+    ## Irradiance, sun hours, daytime temperatures and yields are resampled so their daily, monthly and yearly aggregates stay the same.
+    # Coarser periods: rows are binned by the period they start in, weighted by their length. Irradiance is averaged over the whole new interval (energy is kept),
+    # air temperature over the covered time and daytime temperature over the sun hours. Sun hours and yields are summed.
+    # Finer periods: every row is split into equal intervals with the same irradiance and temperature (step interpolation), and the sun hours and yields are split evenly.
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("resample_intervals's df parameter expects a pandas.DataFrame object as input.")
+    if period not in PERIOD_MINUTES:
+        raise ValueError(f"resample_intervals period must be one of {', '.join(PERIOD_MINUTES)}.")
+    target = np.timedelta64(PERIOD_MINUTES[period], "m")
+    hours = period_hours(df)
+    minutes = (hours * 60).round().astype(np.int64)
+    ends = df["Period end"].to_numpy()
+    has_yield = "Energy Yield (KWh)" in df.columns
+
+    if (minutes <= PERIOD_MINUTES[period]).all():
+        # Bins are identified by the end of the new interval the row starts in
+        starts = period_starts(df, hours)
+        bins = (starts.astype("datetime64[m]").astype(np.int64) // PERIOD_MINUTES[period]) * PERIOD_MINUTES[period] + PERIOD_MINUTES[period]
+        bin_ends, codes = np.unique(bins, return_inverse=True)
+        target_hours = PERIOD_MINUTES[period] / 60
+
+        def total(values):
+            return np.bincount(codes, weights=values, minlength=len(bin_ends))
+
+        sun_hours = df["Sun Hours"].to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            columns = {
+                "Air Temp": total(df["Air Temp"].to_numpy(dtype=float) * hours) / total(hours),
+                "W/m2 (GTI)": total(df["W/m2 (GTI)"].to_numpy(dtype=float) * hours) / target_hours,
+                "Period end": bin_ends.astype("datetime64[m]").astype("datetime64[ns]"),
+                "Period": np.full(len(bin_ends), period, dtype=object),
+                "Sun Hours": total(sun_hours),
+                "Daytime Temp": total(np.nan_to_num(df["Daytime Temp"].to_numpy(dtype=float)) * sun_hours) / total(sun_hours)}
+        if has_yield:
+            columns["Energy Yield (KWh)"] = total(df["Energy Yield (KWh)"].to_numpy(dtype=float))
+        for column in COMPONENT_COLUMNS.values():
+            if column in df.columns:
+                columns[column] = total(df[column].to_numpy(dtype=float) * hours) / target_hours
+    elif (minutes % PERIOD_MINUTES[period] == 0).all():
+        # Every row is split into "splits" new intervals, ending "offset" new intervals before the original end
+        splits = minutes // PERIOD_MINUTES[period]
+        rows = np.repeat(np.arange(len(df)), splits)
+        position = np.arange(len(rows)) - np.repeat(np.cumsum(splits) - splits, splits)
+        offsets = np.repeat(splits, splits) - 1 - position
+        columns = {
+            "Air Temp": df["Air Temp"].to_numpy()[rows],
+            "W/m2 (GTI)": df["W/m2 (GTI)"].to_numpy()[rows],
+            "Period end": ends[rows] - offsets * target,
+            "Period": np.full(len(rows), period, dtype=object),
+            "Sun Hours": df["Sun Hours"].to_numpy(dtype=float)[rows] / np.repeat(splits, splits),
+            "Daytime Temp": df["Daytime Temp"].to_numpy()[rows]}
+        if has_yield:
+            columns["Energy Yield (KWh)"] = df["Energy Yield (KWh)"].to_numpy(dtype=float)[rows] / np.repeat(splits, splits)
+        for column in COMPONENT_COLUMNS.values():
+            if column in df.columns:
+                columns[column] = df[column].to_numpy()[rows]
+    else:
+        raise ValueError(f"resample_intervals can't resample a mix of coarser and finer periods than {period}, or periods that aren't a multiple of it.")
+
+    resampled = pd.DataFrame(columns).astype(SOLAR_DATA_SCHEMA).astype({column: "float32" for column in COMPONENT_COLUMNS.values() if column in columns})
+    resampled.index = pd.DatetimeIndex(resampled["Period end"], name=None)
+    return resampled
+
+
+def solar_position(times, latitude, longitude):
+    ## Vectorized solar position for UTC datetime64 timestamps, with the NOAA general solar position equations (accurate to about half a degree).
+    ## Returns the solar zenith and azimuth (degrees, azimuth clockwise from north), and the extraterrestrial normal irradiance (W/m2), as arrays like times.
+    times = np.asarray(times, dtype="datetime64[ns]")
+    days = times.astype("datetime64[D]")
+    years = times.astype("datetime64[Y]")
+    day_of_year = (days - years.astype("datetime64[D]")).astype(float)
+    days_in_year = ((years + 1).astype("datetime64[D]") - years.astype("datetime64[D]")).astype(float)
+    hours = (times - days).astype(np.int64) / 3.6e12
+
+    # Fractional year in radians, equation of time in minutes and solar declination in radians
+    gamma = 2 * np.pi / days_in_year * (day_of_year + (hours - 12) / 24)
+    equation_of_time = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma) - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    declination = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma) - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+                   - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+
+    # Hour angle from the true solar time of the longitude, then zenith and azimuth of the latitude
+    hour_angle = np.radians((hours * 60 + equation_of_time + 4 * float(longitude)) / 4 - 180)
+    latitude = np.radians(float(latitude))
+    cos_zenith = np.clip(np.sin(latitude) * np.sin(declination) + np.cos(latitude) * np.cos(declination) * np.cos(hour_angle), -1, 1)
+    zenith = np.degrees(np.arccos(cos_zenith))
+    azimuth = (np.degrees(np.arctan2(np.sin(hour_angle), np.cos(hour_angle) * np.sin(latitude) - np.tan(declination) * np.cos(latitude))) + 180) % 360
+    extraterrestrial = SOLAR_CONSTANT * (1.00011 + 0.034221 * np.cos(gamma) + 0.00128 * np.sin(gamma) + 0.000719 * np.cos(2 * gamma) + 0.000077 * np.sin(2 * gamma))
+    return zenith, azimuth, extraterrestrial
+
+
+@traced("transpose")
+def transpose_irradiance(df, latitude, longitude, tilts, azimuths, albedo=ALBEDO):
+    ## Plane of array irradiance of interval data (from get_solar_data with components=True) for any number of panel orientations, with the Hay-Davies model.
+    ## tilts and azimuths (degrees, azimuth clockwise from north, e.g. 0 = facing north) are paired, one orientation per element.
+    ## Returns a float32 array of W/m2 with one row per orientation and one column per interval, calculated for all timestamps and orientations in one pass.
+    # The beam irradiance is projected onto the panel, the diffuse irradiance is split into a circumsolar part (projected like the beam, weighted by the anisotropy
+    # index DNI / extraterrestrial irradiance) and an isotropic part from the visible sky dome, and the ground reflects albedo x GHI onto tilted panels.
 
     # Validate correct function usage
     if not isinstance(df, pd.DataFrame):
-        raise TypeError("calculate_daily_data's df parameter expects a pandas.DataFrame object as input.")
+        raise TypeError("transpose_irradiance's df parameter expects a pandas.DataFrame object as input.")
+    if any(column not in df.columns for column in COMPONENT_COLUMNS.values()):
+        raise ValueError("transpose_irradiance needs the GHI, DNI and DHI columns. Fetch the data with components=True.")
+    tilts, azimuths = np.broadcast_arrays(np.atleast_1d(np.asarray(tilts, dtype=float)), np.atleast_1d(np.asarray(azimuths, dtype=float)))
+    if tilts.ndim != 1:
+        raise ValueError("transpose_irradiance's tilts and azimuths must be single values or one dimensional lists.")
+    if ((tilts < 0) | (tilts > 90)).any():
+        raise ValueError("Panel tilt must be between 0 (flat) and 90 (vertical) degrees.")
+    if not 0 <= albedo <= 1:
+        raise ValueError("Albedo must be a fractional value between 0 and 1.")
+
+    # Sun position in the middle of every interval
+    middles = df["Period end"].to_numpy() - (period_hours(df) * 1800).round().astype(np.int64).astype("timedelta64[s]")
+    zenith, sun_azimuth, extraterrestrial = solar_position(middles, latitude, longitude)
+    cos_zenith = np.cos(np.radians(zenith))
+    ghi, dni, dhi = (np.nan_to_num(df[column].to_numpy(dtype=float)) for column in COMPONENT_COLUMNS.values())
+
+    # Angle of incidence of the beam on every orientation. Axes: (orientation, interval). No beam when the sun is behind the panel or below the horizon.
+    tilt = np.radians(tilts)[:, None]
+    cos_incidence = cos_zenith * np.cos(tilt) + np.sin(np.radians(zenith)) * np.sin(tilt) * np.cos(np.radians(sun_azimuth - azimuths[:, None]))
+    cos_incidence = np.where(zenith < 90, np.maximum(cos_incidence, 0), 0)
+    # The beam / horizontal ratio is capped near sunrise and sunset (zenith over 85 degrees)
+    ratio = cos_incidence / np.maximum(cos_zenith, np.cos(np.radians(85)))
+    anisotropy = np.clip(dni / extraterrestrial, 0, 1)
+    beam = dni * cos_incidence
+    diffuse = dhi * (anisotropy * ratio + (1 - anisotropy) * (1 + np.cos(tilt)) / 2)
+    ground = ghi * albedo * (1 - np.cos(tilt)) / 2
+    return (beam + diffuse + ground).astype(np.float32)
+
+
+def orient_solar_data(df, latitude, longitude, tilt, azimuth=None, albedo=ALBEDO):
+    ## Returns interval data (from get_solar_data with components=True) with the GTI of another panel orientation, ready for the rest of the pipeline.
+    ## azimuth None faces the panels to the equator (0 = north in the southern hemisphere, 180 = south in the northern hemisphere).
+    if azimuth is None:
+        azimuth = 0 if float(latitude) < 0 else 180
+    gti = transpose_irradiance(df, latitude, longitude, tilt, azimuth, albedo)[0]
+    return format_solar_data(df.drop(columns=["Sun Hours", "Daytime Temp"]).assign(**{"W/m2 (GTI)": gti}))
+
+
+@traced("orientations")
+def sweep_orientations(df, latitude, longitude, tilts, azimuths, STC_eff, temp_coeff, panel_area, albedo=ALBEDO, model=PANEL_MODEL):
+    ## Orientation sweep. Evaluates every combination of tilts and azimuths against one site's interval data (from get_solar_data with components=True),
+    ## from a single download: the irradiance is transposed to all orientations, aggregated to months and simulated (like the monthly simulation mode) in batched passes.
+    ## The panels are simulated with the panel model "model" (See PANEL_MODELS), which must be a fixed array model.
+    ## Returns a tidy DataFrame with one row per orientation. Sort by "Average Yearly Yield (KWh)" for the best tilt and azimuth.
+    Model = panel_model(model)
+    if Model.array_type != "fixed":
+        raise ValueError(f"Orientations can only be swept for fixed arrays, not for the {model} model.")
+    tilts, azimuths = [grid.ravel() for grid in np.meshgrid(np.atleast_1d(np.asarray(tilts, dtype=float)), np.atleast_1d(np.asarray(azimuths, dtype=float)), indexing="ij")]
+    hours = period_hours(df)
+    air_temp = np.nan_to_num(df["Air Temp"].to_numpy(dtype=float))
+    months = period_starts(df, hours).astype("datetime64[M]")
+    month_ends, month_codes = np.unique(months, return_inverse=True)
+    total_gti = np.empty((len(tilts), len(month_ends)))
+    total_sun_hours = np.empty_like(total_gti)
+    total_temp = np.empty_like(total_gti)
+
+    # Transpose a batch of orientations at a time, and sum every orientation's months with one bincount on (orientation, month) codes.
+    # Intervals belong to the month they start in, like in aggregate_data.
+    for start in range(0, len(tilts), ORIENTATION_BATCH_SIZE):
+        stop = min(start + ORIENTATION_BATCH_SIZE, len(tilts))
+        poa = transpose_irradiance(df, latitude, longitude, tilts[start:stop], azimuths[start:stop], albedo)
+        codes = (np.arange(stop - start)[:, None] * len(month_ends) + month_codes[None, :]).ravel()
+        sun_hours = (poa > 0) * hours
+
+        def total(values):
+            return np.bincount(codes, weights=values.ravel(), minlength=(stop - start) * len(month_ends)).reshape(stop - start, -1)
+
+        total_gti[start:stop] = total(poa * hours)
+        total_sun_hours[start:stop] = total(sun_hours)
+        total_temp[start:stop] = total(sun_hours * air_temp)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        daytime_temp = total_temp / total_sun_hours
+        hourly_gti = total_gti / total_sun_hours
+    monthly_yield = np.nan_to_num(Model(NOCT, G_NOCT, STC_temp, STC_eff, temp_coeff).calculate_yield(daytime_temp, hourly_gti, total_gti, panel_area))
+
+    years = len(month_ends) / 12
+    return pd.DataFrame({
+        "tilt": tilts,
+        "azimuth": azimuths,
+        "Average Yearly GTI (KWh/m2)": total_gti.sum(axis=1) / 1000 / years,
+        "Total Energy Yield (KWh)": monthly_yield.sum(axis=1),
+        "Average Yearly Yield (KWh)": monthly_yield.sum(axis=1) / years})
+
+
+def select_typical_months(df, weights=TMY_WEIGHTS):
+    ## Picks the most representative historical month of every calendar month in interval data (from get_solar_data), for a typical meteorological year.
+    ## Returns a DataFrame indexed by Month with the selected Year and its weighted Finkelstein-Schafer statistic (lower = closer to the long-term distribution).
+    # The FS statistic of a candidate month is the mean distance between the distribution of its daily values and the distribution of the daily values of
+    # that calendar month in all years, at every day of the candidate. It is calculated for the daily GTI and daily mean, max and min air temperature.
+    # Only complete months are candidates.
 
-    # Groups the data day by day, month by month, year by year and calculates the daily number of sun hours. Daytime temp and GTI is sumed for later calculations.
-    daily_df = df.groupby([df["Period end"].dt.year, df["Period end"].dt.month, df["Period end"].dt.day]).agg({
-    "Daytime Temp": "sum", # Total of daytime temperature values
-    "W/m2 (GTI)": "sum",  # Total GTI per day
-    "Sun Hours": "sum"}) # Total sun hours per day
+    # Validate correct function usage
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("select_typical_months's df parameter expects a pandas.DataFrame object as input.")
+    unknown = [statistic for statistic in weights if statistic not in TMY_WEIGHTS]
+    if unknown:
+        raise ValueError(f"Unknown TMY statistics {', '.join(unknown)}. Choose from: {', '.join(TMY_WEIGHTS)}.")
+
+    # Daily statistics. Intervals belong to the day they start in, like in aggregate_data.
+    hours = period_hours(df)
+    days = pd.DatetimeIndex(period_starts(df, hours).astype("datetime64[D]"))
+    intervals = pd.DataFrame({"GTI": df["W/m2 (GTI)"].to_numpy(dtype=float) * hours, "Air Temp": df["Air Temp"].to_numpy(dtype=float)})
+    daily = intervals.groupby(days).agg(**{"Daily GTI": ("GTI", "sum"), "Mean Air Temp": ("Air Temp", "mean"),
+                                           "Max Air Temp": ("Air Temp", "max"), "Min Air Temp": ("Air Temp", "min")})
+    daily["Year"], daily["Month"] = daily.index.year, daily.index.month
+    complete = daily.groupby(["Year", "Month"])["Daily GTI"].transform("size") == daily.index.days_in_month
+    daily = daily[complete]
+    missing = sorted(set(range(1, 13)) - set(daily["Month"]))
+    if missing:
+        raise ValueError(f"select_typical_months needs a complete month of data for every calendar month. Missing months: {', '.join(map(str, missing))}.")
+
+    # Empirical distribution functions at every day: rank / number of days, over all years and within the candidate month
+    statistics = list(weights)
+    long_term = daily.groupby("Month")[statistics].rank(method="max", pct=True)
+    candidate = daily.groupby(["Month", "Year"])[statistics].rank(method="max", pct=True)
+    fs = (candidate - long_term).abs().groupby([daily["Month"], daily["Year"]]).mean()
+    scores = (fs * pd.Series(weights)).sum(axis=1)
+    selected = scores.groupby(level="Month").idxmin()
+    return pd.DataFrame({"Year": [year for _, year in selected], "FS Statistic": scores[selected].to_numpy()}, index=pd.Index(selected.index, name="Month"))
+
+
+@traced("tmy")
+def build_tmy(df, selection=None):
+    ## Builds a typical meteorological year from interval data (from get_solar_data): the intervals of the selected month of every calendar month
+    ## (from select_typical_months), dated to TMY_YEAR. Returns interval data with the same columns, which every aggregation and simulation accepts.
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("build_tmy's df parameter expects a pandas.DataFrame object as input.")
+    if selection is None:
+        selection = select_typical_months(df)
+
+    # Keep the intervals starting in the selected months. Leap days are dropped, as TMY_YEAR has no February 29.
+    starts = period_starts(df)
+    months = starts.astype("datetime64[M]")
+    selected = (selection["Year"].to_numpy() - 1970) * 12 + selection.index.to_numpy() - 1
+    days = starts.astype("datetime64[D]") - months.astype("datetime64[D]")
+    rows = np.isin(months.astype(np.int64), selected) & ~((months.astype(np.int64) % 12 == 1) & (days == np.timedelta64(28, "D")))
+    # Every interval of a month is moved by the same offset, from the start of its month to the start of the month in TMY_YEAR
+    months = months[rows]
+    target = np.datetime64(f"{TMY_YEAR}-01", "M") + months.astype(np.int64) % 12
+    shift = target.astype("datetime64[ns]") - months.astype("datetime64[ns]")
+    tmy = df[rows].copy()
+    tmy["Period end"] = tmy["Period end"].to_numpy() + shift
+    tmy = tmy.astype(SOLAR_DATA_SCHEMA).iloc[np.argsort(tmy["Period end"].to_numpy(), kind="stable")]
+    tmy.index = pd.DatetimeIndex(tmy["Period end"], name=None)
+    return tmy
+
+
+@traced("aggregate")
+def aggregate_data(df, resolutions=RESOLUTIONS):
+    ## Aggregation engine. Sums the short interval input data to days in a single pass, and derives every requested resolution
+    ## ("Daily", "Weekly", "Monthly", "Yearly") from the daily totals. Returns a dictionary of DataFrames, one per resolution.
+    # The model used for calculating average temperature and average hourly GTI is based on only using data during sun hours for more accurate estimations.
+    # If the data has an "Energy Yield (KWh)" column (from simulate_intervals), the yields are summed as well.
 
-    # Calculate the averaged daytime temperature by first transorming the data to hourly values (*= 0.5) as original data is in 30 minute intervals.
-    # Then divide that number by the number of daily sun hours.
-    daily_df["Daytime Temp"] *= 0.5
-    daily_df["Daytime Temp"] = daily_df["Daytime Temp"] / daily_df["Sun Hours"]
+    # Validate correct function usage
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("aggregate_data's df parameter expects a pandas.DataFrame object as input.")
+    for resolution in resolutions:
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"aggregate_data resolutions must be some of {', '.join(RESOLUTIONS)}.")
+
+    # Integer day codes of every interval, counted from the first day of the data. Used as bins for np.bincount.
+    # Intervals belong to the day they start in, so e.g. the interval ending at midnight is counted on the day that ends, at any interval length.
+    hours = period_hours(df)
+    days = period_starts(df, hours).astype("datetime64[D]")
+    first_day = days.min()
+    codes = (days - first_day).astype(np.int64)
+    rows = np.bincount(codes)
+
+    # Daily sums. GTI is multiplied by the interval length in hours (from the Period column), i.e. from W/m2 to Wh/m2.
+    # Daytime temperatures are weighted by the sun hours of the interval, for the average over the sun hours.
+    sun_hours = df["Sun Hours"].to_numpy(dtype=float)
+    columns = {
+        "Daytime Temp": np.nan_to_num(df["Daytime Temp"].to_numpy(dtype=float)) * sun_hours,
+        "W/m2 (GTI)": df["W/m2 (GTI)"].to_numpy(dtype=float) * hours,
+        "Sun Hours": sun_hours}
+    if "Energy Yield (KWh)" in df.columns:
+        columns["Energy Yield (KWh)"] = df["Energy Yield (KWh)"].to_numpy(dtype=float)
+    # Only keep days that have data
+    has_data = rows > 0
+    sums = {column: np.bincount(codes, weights=values, minlength=len(rows))[has_data] for column, values in columns.items()}
+    dates = pd.DatetimeIndex(first_day + np.flatnonzero(has_data))
+
+    return {resolution: group_aggregates(sums, dates, resolution) for resolution in resolutions}
+
+
+def group_aggregates(sums, dates, resolution):
+    ## Groups daily (or coarser) sums to the requested resolution, and calculates the totals and averages of the aggregated dataframes.
+    # sums is a dictionary of summed columns, with one element per date in dates.
+    if resolution == "Daily":
+        keys = [dates.year, dates.month, dates.day]
+        names = ["Year", "Month", "Day"]
+    elif resolution == "Weekly":
+        # ISO weeks, so the week of the first days of January may belong to the previous year
+        calendar = dates.isocalendar()
+        keys = [calendar["year"].to_numpy(), calendar["week"].to_numpy()]
+        names = ["Year", "Week"]
+    elif resolution == "Monthly":
+        keys = [dates.year, dates.month]
+        names = ["Year", "Month"]
+    else:
+        keys = [dates.year]
+        names = ["Year"]
+
+    # Group by the unique key combinations with np.bincount, unless every date is already its own group
+    index = pd.MultiIndex.from_arrays([np.asarray(key, dtype=np.int64) for key in keys], names=names)
+    if not index.is_unique:
+        codes, index = index.factorize()
+        index = pd.MultiIndex.from_tuples(index, names=names)
+        sums = {column: np.bincount(codes, weights=values, minlength=len(index)) for column, values in sums.items()}
+    if resolution == "Yearly":
+        index = index.get_level_values("Year")
+
+    aggregated_df = pd.DataFrame(index=index)
+    # Average daytime temperature during sun hours, total GTI in Wh/m2 and total sun hours
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aggregated_df["Average Daytime Temp"] = sums["Daytime Temp"] / sums["Sun Hours"]
+        aggregated_df["Total GTI (Wh/m2)"] = sums["W/m2 (GTI)"]
+        aggregated_df["Total Sun Hours"] = sums["Sun Hours"]
+        # Average hourly GTI for the cell temp calculation. Replace NaN values (Due to zero division if Total Sun Hours = 0 at some point) with 0.
+        aggregated_df["Average hourly GTI (W/m2)"] = np.nan_to_num(sums["W/m2 (GTI)"] / sums["Sun Hours"])
+    # Summed energy yields, or an Energy Yield column initialized for later calculation
+    if "Energy Yield (KWh)" in sums:
+        aggregated_df["Energy Yield (KWh)"] = sums["Energy Yield (KWh)"]
+    else:
+        aggregated_df["Energy Yield (KWh)"] = None
+    return aggregated_df
 
-    # Convert GTI from W to Wh by multiplying by 0.5 (since each interval is 30 minutes) for the total daily GTI
-    daily_df["W/m2 (GTI)"] = daily_df["W/m2 (GTI)"].astype(float)
-    daily_df["W/m2 (GTI)"] *= 0.5
 
-    # Renames the columns to totals and averages
-    daily_df = daily_df.rename(columns={"W/m2 (GTI)": "Total GTI (Wh/m2)", "Sun Hours": "Total Sun Hours", "Daytime Temp": "Average Daytime Temp"})
-    # Renames indexes to Year, Month, Day
-    daily_df = daily_df.rename_axis(["Year", "Month", "Day"])
+def resample_aggregates(df, resolution):
+    ## Rolls an aggregated dataframe (with energy yields) up to a coarser resolution, without scanning the raw intervals again.
+    # Daily data can be resampled to any resolution. Monthly data to Monthly or Yearly.
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("resample_aggregates's df parameter expects a pandas.DataFrame object as input.")
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resample_aggregates resolution must be one of {', '.join(RESOLUTIONS)}.")
+    names = list(df.index.names)
+    if names == ["Year", "Month", "Day"]:
+        dates = pd.to_datetime(pd.DataFrame({"year": df.index.get_level_values("Year"), "month": df.index.get_level_values("Month"), "day": df.index.get_level_values("Day")}))
+    elif names == ["Year", "Month"] and resolution in ["Monthly", "Yearly"]:
+        dates = pd.to_datetime(pd.DataFrame({"year": df.index.get_level_values("Year"), "month": df.index.get_level_values("Month"), "day": 1}))
+    else:
+        raise ValueError(f"resample_aggregates can't resample data indexed by {', '.join(map(str, names))} to {resolution}.")
 
-    # Calculate daily average hourly GTI for the cell temp calculation
-    # OBS: Potential division by zero. Handle cases where sun hours might be zero
-    daily_df["Average hourly GTI (W/m2)"] = None
-    daily_df["Average hourly GTI (W/m2)"] = daily_df["Total GTI (Wh/m2)"] / daily_df["Total Sun Hours"]
+    # Recover the sums behind the averages, then group them like aggregate_data does
+    sun_hours = df["Total Sun Hours"].to_numpy(dtype=float)
+    sums = {
+        "Daytime Temp": np.nan_to_num(df["Average Daytime Temp"].to_numpy(dtype=float) * sun_hours),
+        "W/m2 (GTI)": df["Total GTI (Wh/m2)"].to_numpy(dtype=float),
+        "Sun Hours": sun_hours}
+    if df["Energy Yield (KWh)"].notna().all():
+        sums["Energy Yield (KWh)"] = df["Energy Yield (KWh)"].to_numpy(dtype=float)
+    return group_aggregates(sums, pd.DatetimeIndex(dates), resolution)
 
-    # Replace potential "None" values in "Average hourly GTI (W/m2)" (Due to zero division if Total Sun Hours = 0 at some point) with 0.
-    daily_df["Average hourly GTI (W/m2)"] = daily_df["Average hourly GTI (W/m2)"].fillna(0)
 
-    # Initialize Energy Yield column for later calculation
-    daily_df["Energy Yield (KWh)"] = None
+def calculate_daily_data(df):
+    # CS50 Duck Debugger in addition to online resources like stackoverflow.com and YouTube helped assist me on how to use the Pandas library.
+    # Performs calculations on the short interval input data for daily temperature averages, total irradiance, total sun hours and average hourly GTI
 
-    return daily_df
+    # Validate correct function usage
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("calculate_daily_data's df parameter expects a pandas.DataFrame object as input.")
+
+    return aggregate_data(df, ["Daily"])["Daily"]
 
 
 def calculate_monthly_data(df):
     # CS50 Duck Debugger in addition to online resources like stackoverflow.com and YouTube helped assist me on how to use the Pandas library.
     # Performs calculations on the short interval input data for monthly temperature averages, total irradiance, total sun hours and average hourly GTI
-    # The model used for calculating average temperature and average hourly GTI is based on only using data during sun hours for more accurate estimations.
 
     # Validate correct function usage
     if not isinstance(df, pd.DataFrame):
         raise TypeError("calculate_monthly_data's df parameter expects a pandas.DataFrame object as input.")
 
-    # Groups the data month by month, year by year and calculates monthly values of average daily Daytime Temp, total daily GTI and total daily Sun Hours
-    monthly_avg_df = df.groupby([df["Period end"].dt.year, df["Period end"].dt.month]).agg({
-    "Daytime Temp": "sum",  # Monthly total of daytime temperature values
-    "W/m2 (GTI)": "sum",  # Total GTI per month
-    "Sun Hours": "sum"}) # Total sun hours per month
+    return aggregate_data(df, ["Monthly"])["Monthly"]
 
-    # Calculate the averaged monthly temperature by first transorming the data to hourly values (*= 0.5) as original data is in 30 minute intervals.
-    # Then divide that number by the number of monthly sun hours.
-    monthly_avg_df["Daytime Temp"] *= 0.5
-    monthly_avg_df["Daytime Temp"] = monthly_avg_df["Daytime Temp"] / monthly_avg_df["Sun Hours"]
 
-    # Convert GTI from W to Wh by multiplying by 0.5 (since each interval is 30 minutes)
-    monthly_avg_df["W/m2 (GTI)"] = monthly_avg_df["W/m2 (GTI)"].astype(float)
-    monthly_avg_df["W/m2 (GTI)"] *= 0.5
+@traced("simulate intervals")
+def simulate_intervals(df, Panel, panel_area):
+    ## Interval level simulation. Calculates cell temperature, efficiency and energy yield for every row of the get_solar_data DataFrame in one vectorized pass.
+    # Unlike the monthly model, the nonlinear temperature effect is applied to the actual air temperature and irradiance of each interval instead of monthly averages.
 
-    # Renames the columns to totals and averages
-    monthly_avg_df = monthly_avg_df.rename(columns={"W/m2 (GTI)": "Total GTI (Wh/m2)", "Sun Hours": "Total Sun Hours", "Daytime Temp": "Average Daytime Temp"})
-    # Renames indexes to Year, Month, Day
-    monthly_avg_df = monthly_avg_df.rename_axis(["Year", "Month"])
+    # Validate correct function usage
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("simulate_intervals's df parameter expects a pandas.DataFrame object as input.")
+    if not isinstance(Panel, SolarPanel):
+        raise TypeError("simulate_intervals's Panel parameter expects a SolarPanel object as input.")
 
-    # Calculate monthly average hourly GTI for the cell temp calculation
-    monthly_avg_df["Average hourly GTI (W/m2)"] = None
-    monthly_avg_df["Average hourly GTI (W/m2)"] = monthly_avg_df["Total GTI (Wh/m2)"] / monthly_avg_df["Total Sun Hours"]
+    interval_df = df.copy()
+    # Irradiance in W/m2 during an interval gives the interval length in hours (e.g. 0.5 for PT30M) Wh/m2 per W/m2. Night intervals have no irradiance and therefore no yield.
+    # Cell temperature and efficiency are reported for the effective irradiance of the panel model, like calculate_yield uses it
+    effective_gti, _ = Panel.effective_irradiance(interval_df["W/m2 (GTI)"], interval_df["W/m2 (GTI)"])
+    interval_df["Cell Temp"] = Panel.calculate_celltemp(interval_df["Air Temp"], effective_gti)
+    interval_df["Efficiency"] = Panel.calculate_efficiency(interval_df["Air Temp"], effective_gti)
+    interval_df["Energy Yield (KWh)"] = Panel.calculate_yield(interval_df["Air Temp"], interval_df["W/m2 (GTI)"], interval_df["W/m2 (GTI)"] * period_hours(interval_df), panel_area)
+    return interval_df
 
-    # Replace potential "None" values in "Average hourly GTI (W/m2)" (Due to zero division if Total Sun Hours = 0 at some point) with 0.
-    monthly_avg_df["Average hourly GTI (W/m2)"] = monthly_avg_df["Average hourly GTI (W/m2)"].fillna(0)
 
-    # Initialize Energy Yield column for later calculation
-    monthly_avg_df["Energy Yield (KWh)"] = None
+def rollup_interval_yield(interval_df):
+    ## Sums the interval energy yields from simulate_intervals up to daily, weekly, monthly and yearly totals, with the aggregate_data engine.
+    # Returns a dictionary of DataFrames indexed like calculate_daily_data / calculate_monthly_data, so they can be used in plot_data.
 
-    return monthly_avg_df
+    # Validate correct function usage
+    if not isinstance(interval_df, pd.DataFrame):
+        raise TypeError("rollup_interval_yield's interval_df parameter expects a pandas.DataFrame object as input.")
+    if "Energy Yield (KWh)" not in interval_df.columns:
+        raise ValueError("rollup_interval_yield's interval_df parameter must be simulated by simulate_intervals first.")
+
+    return aggregate_data(interval_df)
+
+
+def compare_yield_models(monthly_data, interval_monthly):
+    ## Reports how the interval level simulation differs from the monthly averaged approximation, month by month and in total.
+    # monthly_data is the simulated output of calculate_monthly_data, interval_monthly is the "Monthly" rollup of rollup_interval_yield.
+    # Any other resolution works too, as long as both dataframes have the same resolution.
+
+    # Validate correct function usage
+    if not isinstance(monthly_data, pd.DataFrame) or not isinstance(interval_monthly, pd.DataFrame):
+        raise TypeError("compare_yield_models expects pandas.DataFrame objects as input.")
+
+    comparison = pd.DataFrame({
+        "Monthly Model (KWh)": monthly_data["Energy Yield (KWh)"].astype(float),
+        "Interval Model (KWh)": interval_monthly["Energy Yield (KWh)"].astype(float)})
+    comparison["Difference (KWh)"] = comparison["Interval Model (KWh)"] - comparison["Monthly Model (KWh)"]
+    comparison["Difference (%)"] = comparison["Difference (KWh)"] / comparison["Monthly Model (KWh)"] * 100
+    # Add a total row for the whole period
+    total = comparison[["Monthly Model (KWh)", "Interval Model (KWh)", "Difference (KWh)"]].sum()
+    total["Difference (%)"] = total["Difference (KWh)"] / total["Monthly Model (KWh)"] * 100
+    comparison.loc[("Total",) + ("",) * (comparison.index.nlevels - 1), :] = total
+    return comparison
+
+
+def yield_terms(df, model=PANEL_MODEL):
+    ## Reduces aggregated rows (from aggregate_data) to the two terms the yield is linear in: the GTI, and the GTI weighted cell temperature above STC_temp.
+    ## yield = STC_eff / 100 * (GTI - temp_coeff / 100 * GTI * (cell_temp - STC_temp)) * panel_area / 1000 * inverter_eff, so sums of these terms over months,
+    ## days or years give the yield of any panel configuration. See linear_yield. Returns (total_gti, gti_temp) NumPy arrays.
+    ## The GTI is the effective irradiance of the panel model (See PANEL_MODELS), e.g. including the rear side of bifacial panels.
+    # The effective irradiance and cell temperature don't depend on the panel configuration, so they are calculated once (by a panel with any valid STC_eff and temp_coeff).
+    # Rows without sun hours have no daytime temperature, and add nothing to the yield.
+    Panel = panel_model(model)(NOCT, G_NOCT, STC_temp, 20, -0.4)
+    hourly_gti, total_gti = Panel.effective_irradiance(df["Average hourly GTI (W/m2)"], df["Total GTI (Wh/m2)"])
+    cell_temp = Panel.calculate_celltemp(df["Average Daytime Temp"], hourly_gti)
+    return total_gti, np.nan_to_num(total_gti * (cell_temp - STC_temp))
+
+
+def linear_yield(STC_eff, temp_coeff, panel_area, inverter_eff, gti, gti_temp):
+    ## Energy yield (KWh) of summed yield_terms. Every argument can be a broadcastable NumPy array, to evaluate many panel configurations at once.
+    return STC_eff / 100 * (gti - temp_coeff / 100 * gti_temp) * panel_area / 1000 * inverter_eff
+
+
+def sweep_panels(monthly_data, STC_effs, temp_coeffs, panel_areas, inverter_effs=(INVERTER_EFF,), paired=False, model=PANEL_MODEL):
+    ## Parameter sweep. Evaluates a grid of panel configurations against one site's aggregated data (from calculate_monthly_data) in one broadcast NumPy computation.
+    ## Every configuration uses the panel model "model" (See PANEL_MODELS), and monthly_data must be of that model's array type.
+    # Every combination of STC_eff, temp_coeff, panel_area and inverter efficiency is evaluated. With paired=True, STC_effs and temp_coeffs are instead
+    # zipped as module datasheets (one STC_eff and temp_coeff per module), and every module is combined with every panel area and inverter efficiency.
+    # Returns a tidy DataFrame with one row per configuration.
 
+    # Validate correct function usage
+    if not isinstance(monthly_data, pd.DataFrame):
+        raise TypeError("sweep_panels's monthly_data parameter expects a pandas.DataFrame object as input.")
+    STC_effs = np.atleast_1d(np.asarray(STC_effs, dtype=float))
+    temp_coeffs = np.atleast_1d(np.asarray(temp_coeffs, dtype=float))
+    panel_areas = np.atleast_1d(np.asarray(panel_areas, dtype=float))
+    inverter_effs = np.atleast_1d(np.asarray(inverter_effs, dtype=float))
+    if paired and len(STC_effs) != len(temp_coeffs):
+        raise ValueError("sweep_panels needs as many STC_effs as temp_coeffs when paired=True.")
+    if ((STC_effs <= 10) | (STC_effs >= 30)).any():
+        raise ValueError("Module efficiency at STC must be a value between 10 and 30.")
+    if ((temp_coeffs <= -0.5) | (temp_coeffs >= -0.3)).any():
+        raise ValueError("Temperature coefficient of PMax must be a value between -0.5 and -0.3.")
+    if (panel_areas < 0).any():
+        raise ValueError("Panel area must be a positive number.")
+    if ((inverter_effs <= 0) | (inverter_effs > 1)).any():
+        raise ValueError("Inverter efficiency must be a fractional value between 0 and 1.")
+
+    # The yield is linear in STC_eff, temp_coeff, panel_area and inverter efficiency, so the months can be reduced to two sums per year before broadcasting (See yield_terms)
+    total_gti, gti_temp = yield_terms(monthly_data, model)
+    years = monthly_data.index.get_level_values("Year")
+    gti_sum = pd.Series(total_gti).groupby(years).sum().to_numpy()
+    gti_temp_sum = pd.Series(gti_temp).groupby(years).sum().to_numpy()
+
+    # Broadcast the configurations against the yearly sums. Axes: (module, panel area, inverter efficiency, year)
+    if paired:
+        modules_eff, modules_coeff = STC_effs, temp_coeffs
+    else:
+        modules_eff, modules_coeff = [grid.ravel() for grid in np.meshgrid(STC_effs, temp_coeffs, indexing="ij")]
+    yearly_yield = linear_yield(modules_eff[:, None, None, None], modules_coeff[:, None, None, None], panel_areas[None, :, None, None], inverter_effs[None, None, :, None],
+                                gti_sum[None, None, None, :], gti_temp_sum[None, None, None, :])
+
+    # Flatten the result cube to a tidy table
+    configurations = [grid.ravel() for grid in np.meshgrid(np.arange(len(modules_eff)), panel_areas, inverter_effs, indexing="ij")]
+    yearly_yield = yearly_yield.reshape(-1, yearly_yield.shape[-1])
+    return pd.DataFrame({
+        "STC_eff": modules_eff[configurations[0]],
+        "temp_coeff": modules_coeff[configurations[0]],
+        "panel_area": configurations[1],
+        "inverter_eff": configurations[2],
+        "Total Energy Yield (KWh)": yearly_yield.sum(axis=1),
+        "Average Yearly Yield (KWh)": yearly_yield.mean(axis=1),
+        "Lowest Year (KWh)": yearly_yield.min(axis=1),
+        "Highest Year (KWh)": yearly_yield.max(axis=1)})
+
+
+@traced("compare")
+def compare_panel_models(monthly_data, configurations):
+    ## Mixed technology comparison of a portfolio. Simulates panel configurations of many sites and panel models in one batched pass:
+    ## one vectorized calculate_yield call per panel model, covering every configuration of every site using that model.
+    ## monthly_data maps (site, array_type) to the site's monthly aggregates (from calculate_monthly_data) of that array type, e.g. fetched with get_solar_data(..., array_type=...).
+    ## configurations is a DataFrame with Site, model (See PANEL_MODELS), STC_eff, temp_coeff, panel_area and optionally inverter_eff columns, one row per configuration.
+    ## Returns the configurations with their total, average yearly and per m² yields.
+
+    # Validate correct function usage
+    if not isinstance(monthly_data, dict):
+        raise TypeError("compare_panel_models's monthly_data parameter expects a dictionary of (site, array_type): DataFrame.")
+    if not isinstance(configurations, pd.DataFrame):
+        raise TypeError("compare_panel_models's configurations parameter expects a pandas.DataFrame object as input.")
+    missing = [column for column in ["Site", "model", "STC_eff", "temp_coeff", "panel_area"] if column not in configurations.columns]
+    if missing:
+        raise ValueError(f"compare_panel_models's configurations are missing the columns {', '.join(missing)}.")
+    STC_effs = configurations["STC_eff"].to_numpy(dtype=float)
+    temp_coeffs = configurations["temp_coeff"].to_numpy(dtype=float)
+    panel_areas = configurations["panel_area"].to_numpy(dtype=float)
+    inverter_effs = configurations["inverter_eff"].to_numpy(dtype=float) if "inverter_eff" in configurations.columns else np.full(len(configurations), INVERTER_EFF)
+    if ((STC_effs <= 10) | (STC_effs >= 30)).any():
+        raise ValueError("Module efficiency at STC must be a value between 10 and 30.")
+    if ((temp_coeffs <= -0.5) | (temp_coeffs >= -0.3)).any():
+        raise ValueError("Temperature coefficient of PMax must be a value between -0.5 and -0.3.")
+    if (panel_areas < 0).any():
+        raise ValueError("Panel area must be a positive number.")
+    if ((inverter_effs <= 0) | (inverter_effs > 1)).any():
+        raise ValueError("Inverter efficiency must be a fractional value between 0 and 1.")
+    # Resolve the panel model of every configuration first, so blank models (None, NaN or "") are simulated with the default model
+    models = np.array([panel_model(model) for model in configurations["model"]], dtype=object)
+    keys = [(site, Model.array_type) for site, Model in zip(configurations["Site"], models)]
+    unknown = sorted({f"{site} ({array_type})" for site, array_type in keys if (site, array_type) not in monthly_data}, key=str)
+    if unknown:
+        raise ValueError(f"compare_panel_models has no monthly data of: {', '.join(unknown)}.")
+
+    # Stack the monthly data of every (site, array type) once, and gather the months of every configuration. Axis: (configuration month)
+    stacked = list(monthly_data)
+    frames = [monthly_data[key] for key in stacked]
+    counts = np.array([len(frame) for frame in frames])
+    offsets = np.cumsum(counts) - counts
+    daytemp, hourly_gti, total_gti = (np.concatenate([frame[column].to_numpy(dtype=float) for frame in frames])
+                                      for column in ["Average Daytime Temp", "Average hourly GTI (W/m2)", "Total GTI (Wh/m2)"])
+    positions = np.array([stacked.index(key) for key in keys], dtype=np.int64)
+    months = counts[positions]
+    configuration = np.repeat(np.arange(len(configurations)), months)
+    rows = np.repeat(offsets[positions], months) + np.arange(months.sum()) - np.repeat(np.cumsum(months) - months, months)
+
+    # One vectorized simulation per panel model. The yield is linear in the panel settings (See yield_terms), so the months of every configuration using
+    # the model are reduced to their effective GTI terms once, and evaluated with the panel settings of every configuration month as arrays.
+    monthly_yield = np.zeros(len(rows))
+    for Model in set(models):
+        selected = models[configuration] == Model
+        owners = configuration[selected]
+        model_rows = pd.DataFrame({"Average Daytime Temp": daytemp[rows[selected]], "Average hourly GTI (W/m2)": hourly_gti[rows[selected]],
+                                   "Total GTI (Wh/m2)": total_gti[rows[selected]]})
+        gti, gti_temp = yield_terms(model_rows, Model)
+        monthly_yield[selected] = linear_yield(STC_effs[owners], temp_coeffs[owners], panel_areas[owners], inverter_effs[owners], gti, gti_temp)
+
+    total_yield = np.bincount(configuration, weights=monthly_yield, minlength=len(configurations))
+    compared = configurations.copy()
+    compared["Total Energy Yield (KWh)"] = total_yield
+    compared["Average Yearly Yield (KWh)"] = total_yield / (months / 12)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        compared["Average Yearly Yield (KWh/m2)"] = compared["Average Yearly Yield (KWh)"] / panel_areas
+    return compared
+
+
+@traced("uncertainty")
+def simulate_uncertainty(df, STC_eff, temp_coeff, panel_area, simulations=MC_SIMULATIONS, inverter_eff=INVERTER_EFF,
+                         tolerances=(STC_EFF_TOLERANCE, TEMP_COEFF_TOLERANCE, INVERTER_EFF_TOLERANCE), batch_size=MC_BATCH_SIZE, seed=None, model=PANEL_MODEL):
+    ## Monte Carlo uncertainty engine. Simulates synthetic years by resampling the historical weather of every calendar month, and perturbing STC_eff,
+    ## temp_coeff and the inverter efficiency uniformly within their (STC_eff %, temp_coeff, inverter_eff) tolerances.
+    ## The panels are simulated with the panel model "model" (See PANEL_MODELS), and df must be of that model's array type.
+    ## Returns the annual energy yield (KWh) of every synthetic year as a NumPy array. See exceedance_yields for the P50 / P75 / P90 yields.
+    # Monthly data (from aggregate_data) draws every calendar month from one of the historical years, keeping the weather variation between years.
+    # Daily data draws every day of a calendar month independently from all historical days of that month, giving more distinct years from a few years of data,
+    # but averaging out part of the variation between years.
+
+    # Validate correct function usage
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("simulate_uncertainty's df parameter expects a pandas.DataFrame object as input.")
+    if list(df.index.names) not in [["Year", "Month"], ["Year", "Month", "Day"]]:
+        raise ValueError("simulate_uncertainty needs Monthly or Daily data from aggregate_data.")
+    if not isinstance(simulations, int) or not isinstance(batch_size, int):
+        raise TypeError("simulate_uncertainty's simulations and batch_size parameters expect integers.")
+    if simulations < 1 or batch_size < 1:
+        raise ValueError("simulate_uncertainty's simulations and batch_size must be positive integers.")
+    if any(tolerance < 0 for tolerance in tolerances):
+        raise ValueError("simulate_uncertainty's tolerances must be positive numbers.")
+
+    # The yield is linear in the panel settings, so every month or day is reduced to its GTI and its GTI weighted cell temperature (See yield_terms)
+    total_gti, gti_temp = yield_terms(df, model)
+
+    # Pool of every calendar month: the rows sorted by month, with the offset and number of rows of each month
+    months = df.index.get_level_values("Month").to_numpy()
+    order = np.argsort(months, kind="stable")
+    total_gti, gti_temp = total_gti[order], gti_temp[order]
+    counts = np.bincount(months, minlength=13)[1:]
+    if (counts == 0).any():
+        raise ValueError("simulate_uncertainty needs data of every calendar month.")
+    offsets = np.cumsum(counts) - counts
+    # Slots of a synthetic year. One per month, or the typical number of days of every month.
+    if df.index.nlevels == 3:
+        years = pd.Series(df.index.get_level_values("Year")).groupby(months).nunique().to_numpy()
+        slots = np.repeat(np.arange(12), np.round(counts / years).astype(int))
+    else:
+        slots = np.arange(12)
+
+    # Resample the synthetic years in batches. Every slot draws a random row of its month's pool.
+    rng = np.random.default_rng(seed)
+    gti_sums = np.empty(simulations)
+    gti_temp_sums = np.empty(simulations)
+    for start in range(0, simulations, batch_size):
+        stop = min(start + batch_size, simulations)
+        rows = offsets[slots] + (rng.random((stop - start, len(slots))) * counts[slots]).astype(np.int64)
+        gti_sums[start:stop] = total_gti[rows].sum(axis=1)
+        gti_temp_sums[start:stop] = gti_temp[rows].sum(axis=1)
+
+    # Perturb the panel settings of every synthetic year
+    STC_effs = STC_eff * (1 + rng.uniform(-1, 1, simulations) * tolerances[0] / 100)
+    temp_coeffs = temp_coeff + rng.uniform(-1, 1, simulations) * tolerances[1]
+    inverter_effs = np.minimum(inverter_eff + rng.uniform(-1, 1, simulations) * tolerances[2], 1)
+    return linear_yield(STC_effs, temp_coeffs, panel_area, inverter_effs, gti_sums, gti_temp_sums)
+
+
+def exceedance_yields(yields, levels=EXCEEDANCE_LEVELS):
+    ## Returns the annual yields exceeded with the given probabilities (%) in the synthetic years of simulate_uncertainty, e.g. P90 = the 10th percentile.
+    yields = np.asarray(yields, dtype=float)
+    if yields.ndim != 1 or len(yields) == 0:
+        raise ValueError("exceedance_yields needs a one dimensional array of annual yields.")
+    levels = np.asarray(levels, dtype=float)
+    if ((levels <= 0) | (levels >= 100)).any():
+        raise ValueError("Exceedance probabilities must be between 0 and 100.")
+    return pd.DataFrame({"Exceedance Probability (%)": levels, "Annual Energy Yield (KWh)": np.percentile(yields, 100 - levels)},
+                        index=pd.Index([f"P{level:g}" for level in levels], name="Estimate"))
+
+
+def yield_profiles(monthly_data, configurations, model=PANEL_MODEL):
+    ## Average monthly yield profile (KWh of every calendar month) of every panel configuration, for one site's aggregated data (from calculate_monthly_data).
+    ## configurations is a DataFrame with STC_eff, temp_coeff, panel_area and optionally inverter_eff columns, e.g. from sweep_panels.
+    ## Every configuration uses the panel model "model" (See PANEL_MODELS), and monthly_data must be of that model's array type.
+    ## Returns a DataFrame with the configurations' index and one column per month (1-12), in one broadcast computation. See project_lifetime.
+    if not isinstance(monthly_data, pd.DataFrame) or not isinstance(configurations, pd.DataFrame):
+        raise TypeError("yield_profiles expects pandas.DataFrame objects as input.")
+    missing = [column for column in ["STC_eff", "temp_coeff", "panel_area"] if column not in configurations.columns]
+    if missing:
+        raise ValueError(f"yield_profiles's configurations are missing the columns {', '.join(missing)}.")
+
+    # The yield is linear in the panel settings, so the months are reduced to the average GTI and GTI weighted cell temperature of every calendar month (See yield_terms)
+    total_gti, gti_temp = yield_terms(monthly_data, model)
+    months = monthly_data.index.get_level_values("Month")
+    gti = pd.Series(total_gti).groupby(months).mean().reindex(range(1, 13)).to_numpy()
+    gti_temp = pd.Series(gti_temp).groupby(months).mean().reindex(range(1, 13)).to_numpy()
+
+    # Broadcast the configurations against the months. Axes: (configuration, month)
+    STC_effs = configurations["STC_eff"].to_numpy(dtype=float)[:, None]
+    temp_coeffs = configurations["temp_coeff"].to_numpy(dtype=float)[:, None]
+    panel_areas = configurations["panel_area"].to_numpy(dtype=float)[:, None]
+    inverter_effs = configurations["inverter_eff"].to_numpy(dtype=float)[:, None] if "inverter_eff" in configurations.columns else INVERTER_EFF
+    profiles = linear_yield(STC_effs, temp_coeffs, panel_areas, inverter_effs, gti[None, :], gti_temp[None, :])
+    return pd.DataFrame(profiles, index=configurations.index, columns=pd.Index(range(1, 13), name="Month"))
+
+
+@traced("lifetime")
+def project_lifetime(profiles, lifetime=ASSET_LIFETIME, degradation=DEGRADATION_RATE, lid=LID_LOSS):
+    ## Lifetime production projection. Applies first year light induced degradation (lid, %) and an annual degradation rate (degradation, %) to monthly yield profiles
+    ## (one row per configuration or site, one column per month 1-12, e.g. from yield_profiles or the monthly yields of a batch) over "lifetime" years of operation.
+    ## degradation and lid are single values, or one value per row. Every row and year is projected in one array computation.
+    ## Returns a summary with a row per profile, and the yearly curves (Energy Yield (KWh) and Cumulative Yield (MWh)) indexed by profile and Operating Year.
 
-def plot_data(df, plot_type, panel_area, location):
+    # Validate correct function usage
+    if not isinstance(profiles, pd.DataFrame):
+        raise TypeError("project_lifetime's profiles parameter expects a pandas.DataFrame object as input.")
+    if not isinstance(lifetime, int):
+        raise TypeError("project_lifetime's lifetime parameter expects an integer.")
+    if lifetime < 1:
+        raise ValueError("project_lifetime's lifetime must be a positive number of years.")
+    yields = profiles.reindex(columns=range(1, 13)).to_numpy(dtype=float)
+    if np.isnan(yields).any():
+        raise ValueError("project_lifetime needs a yield for every month (columns 1-12) of every profile.")
+    degradation = np.broadcast_to(np.asarray(degradation, dtype=float), len(yields))
+    lid = np.broadcast_to(np.asarray(lid, dtype=float), len(yields))
+    if ((degradation < 0) | (degradation >= 100) | (lid < 0) | (lid >= 100)).any():
+        raise ValueError("Degradation and LID must be percentages between 0 and 100.")
+
+    # The yield of month m in operating year y is its profile yield x (1 - lid) x (1 - degradation) ^ (y + (m - 0.5) / 12).
+    # The year factor is shared by every month, so each year is the profile weighted by the degradation within a year, times the year factor. Axes: (profile, year)
+    retained = 1 - degradation[:, None] / 100
+    within_year = (yields * retained ** ((np.arange(1, 13) - 0.5) / 12)).sum(axis=1)
+    yearly = (1 - lid[:, None] / 100) * within_year[:, None] * retained ** np.arange(lifetime)
+    cumulative = np.cumsum(yearly, axis=1) / 1000
+
+    undegraded = yields.sum(axis=1) * lifetime
+    summary = pd.DataFrame({
+        "First Year Yield (KWh)": yearly[:, 0],
+        "Final Year Yield (KWh)": yearly[:, -1],
+        "Lifetime Yield (MWh)": cumulative[:, -1],
+        "Lifetime Loss (%)": 100 * (1 - cumulative[:, -1] * 1000 / undegraded)}, index=profiles.index)
+    index = pd.MultiIndex.from_product([profiles.index, np.arange(1, lifetime + 1)], names=[profiles.index.name or "Profile", "Operating Year"])
+    curves = pd.DataFrame({"Energy Yield (KWh)": yearly.ravel(), "Cumulative Yield (MWh)": cumulative.ravel()}, index=index)
+    return summary, curves
+
+
+def plot_data(df, plot_type, panel_area, location, dpi=REPORT_DPI, ax=None):
+    ## Draws on ax if given (See ReportGenerator), otherwise on a new pyplot figure which the caller closes.
+    import seaborn as sns
+    from matplotlib.ticker import MultipleLocator
+    from geopy.location import Location
 
     # CS50 Duck Debugger in addition to online resources like stackoverflow.com and YouTube helped assist me on how to use the Seaborn and Matplotlib library.
     # Validate correct function usage
@@ -415,6 +2501,10 @@ def plot_data(df, plot_type, panel_area, location):
         raise TypeError("plot_data parameter location must take a geopy.location.Location object as an argument.")
 
 
+    # Roll daily data up to months first. Weekly and yearly data can't be split into months, and raise a ValueError in resample_aggregates.
+    if list(df.index.names) != ["Year", "Month"]:
+        df = resample_aggregates(df, "Monthly")
+
     # Reset the index of the dataframe for easier manipulation
     df_reset = df.reset_index()
     month_map = {
@@ -433,14 +2523,21 @@ def plot_data(df, plot_type, panel_area, location):
     df_reset["Month"] = df_reset["Month"].map(month_map)
 
     # General settings for the plot
-    # Adjust the figure size
-    plt.figure(figsize=(12, 9))
-
-    # Increase resolution of figure
-    plt.rcParams["figure.dpi"] = 360
-
-    # Set gridstyle
-    sns.set_style("whitegrid")
+    # Adjust the figure size and resolution of this figure only
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.figure(figsize=(12, 9), dpi=dpi).gca()
+
+    # Set gridstyle. The whitegrid style is applied to this axes only, so the global matplotlib / seaborn style is left unchanged.
+    style = sns.axes_style("whitegrid")
+    ax.set_facecolor(style["axes.facecolor"])
+    ax.set_axisbelow(True)
+    ax.grid(True, color=style["grid.color"])
+    ax.tick_params(colors=style["xtick.color"], labelcolor=style["text.color"], bottom=style["xtick.bottom"], left=style["ytick.left"])
+    ax.xaxis.label.set_color(style["axes.labelcolor"])
+    ax.yaxis.label.set_color(style["axes.labelcolor"])
+    for spine in ax.spines.values():
+        spine.set_edgecolor(style["axes.edgecolor"])
 
     if plot_type == "Years":
         # Group data by year and get the highest yield year
@@ -473,25 +2570,25 @@ def plot_data(df, plot_type, panel_area, location):
         palette_list = np.array(palette)[ranks].tolist()
 
         # Create the plot. sns.barplot() does the aggregation, which is set to sum (estimator="sum")
-        barplot = sns.barplot(x="Year", y=energy_yield_column, hue="Year", palette=palette_list, data=df_reset, estimator="sum", errorbar=None, legend=False)
+        barplot = sns.barplot(x="Year", y=energy_yield_column, hue="Year", palette=palette_list, data=df_reset, estimator="sum", errorbar=None, legend=False, ax=ax)
         barplot.set_title("Total Solar Energy Production Yield by Year", fontsize=16)
         barplot.set_ylabel(f"Total Energy Yield ({unit})")
-        plt.xlabel("")
-        sns.despine(left=True)
+        barplot.set_xlabel("")
+        sns.despine(ax=barplot, left=True)
 
         # Increase the "roof" of the plot
-        plt.ylim(0, barplot.get_ylim()[1] * 1.3)
+        barplot.set_ylim(0, barplot.get_ylim()[1] * 1.3)
 
         # Customize grid and locators
-        plt.grid(True, which="both", axis="both", alpha=0.3)
+        barplot.grid(True, which="both", axis="both", alpha=0.3)
         if max_year > 100:
-            plt.gca().yaxis.set_major_locator(plt.MultipleLocator(50))
+            barplot.yaxis.set_major_locator(MultipleLocator(50))
         elif 0 <= max_year <= 10:
-            plt.gca().yaxis.set_major_locator(plt.MultipleLocator(0.5))
+            barplot.yaxis.set_major_locator(MultipleLocator(0.5))
         elif 50 <= max_year <= 99:
-            plt.gca().yaxis.set_major_locator(plt.MultipleLocator(5))
+            barplot.yaxis.set_major_locator(MultipleLocator(5))
         elif 10 < max_year <= 49:
-            plt.gca().yaxis.set_major_locator(plt.MultipleLocator(2.5))
+            barplot.yaxis.set_major_locator(MultipleLocator(2.5))
 
         # Add yield annotations for the bars
         for p in barplot.patches:
@@ -547,25 +2644,25 @@ def plot_data(df, plot_type, panel_area, location):
         palette_list = np.array(palette)[ranks].tolist()
 
         # Create the plot. sns.barplot() does the aggregation, which is set to mean by default (estimator="mean"))
-        barplot = sns.barplot(x="Month", y=energy_yield_column, hue="Month", palette=palette_list, data=df_reset, errorbar=("pi", 100), legend=False)
+        barplot = sns.barplot(x="Month", y=energy_yield_column, hue="Month", palette=palette_list, data=df_reset, errorbar=("pi", 100), legend=False, ax=ax)
         barplot.set_title("Average Solar Energy Production Yield By Month", fontsize=16)
         barplot.set_ylabel(f"Average Energy Yield ({unit})")
-        plt.xlabel("")
-        sns.despine(left=True)
+        barplot.set_xlabel("")
+        sns.despine(ax=barplot, left=True)
 
         # Increase the "roof" of the plot
-        plt.ylim(0, barplot.get_ylim()[1] * 1.2)
+        barplot.set_ylim(0, barplot.get_ylim()[1] * 1.2)
 
         # Customize grid and locators
-        plt.grid(True, which="both", axis="both", alpha=0.3)
+        barplot.grid(True, which="both", axis="both", alpha=0.3)
         if max_month > 100:
-            plt.gca().yaxis.set_major_locator(plt.MultipleLocator(50))
+            barplot.yaxis.set_major_locator(MultipleLocator(50))
         elif 0 <= max_month <= 10:
-            plt.gca().yaxis.set_major_locator(plt.MultipleLocator(0.5))
+            barplot.yaxis.set_major_locator(MultipleLocator(0.5))
         elif 50 <= max_month <= 99:
-            plt.gca().yaxis.set_major_locator(plt.MultipleLocator(5))
+            barplot.yaxis.set_major_locator(MultipleLocator(5))
         elif 10 < max_month <= 49:
-            plt.gca().yaxis.set_major_locator(plt.MultipleLocator(2.5))
+            barplot.yaxis.set_major_locator(MultipleLocator(2.5))
 
         # Adjust month labels (xticklabels)
         barplot.set_xticks(range(len(barplot.get_xticklabels())))
@@ -582,5 +2679,200 @@ def plot_data(df, plot_type, panel_area, location):
         return figure
 
 
+def plot_yield(df, plot_type, panel_area, location, dpi=REPORT_DPI, ax=None):
+    ## Fast rendering backend for plot_data's "Years" and "Months" plots. Draws plain matplotlib bars on the precomputed yearly totals / monthly averages,
+    ## instead of letting seaborn aggregate the data again. The location can be a geopy Location or a plain name.
+    ## Draws on ax if given (See ReportGenerator), otherwise on a new pyplot figure which the caller closes.
+    from matplotlib import colormaps
+
+    # Validate correct function usage
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError("plot_yield function must take a Pandas DataFrame object as an argument for the df parameter.")
+    if plot_type not in ["Months", "Years"]:
+        raise ValueError("plot_yield parameter plot_type must either be Months or Years.")
+    if not isinstance(panel_area, int):
+        raise TypeError("plot_yield parameter panel_area expects an integer.")
+    if panel_area < 0:
+        raise ValueError("plot_yield parameter panel_area must be a positive integer.")
+
+    # Roll daily data up to months first. Weekly and yearly data can't be split into months, and raise a ValueError in resample_aggregates.
+    if list(df.index.names) != ["Year", "Month"]:
+        df = resample_aggregates(df, "Monthly")
+    yields = df["Energy Yield (KWh)"].astype(float)
+
+    # Precomputed bar heights. Yearly totals, or average monthly yields with the lowest and highest year of every month as error bars.
+    if plot_type == "Years":
+        values = yields.groupby(level="Year").sum()
+        labels = [str(year) for year in values.index]
+    else:
+        months = yields.groupby(level="Month")
+        values = months.mean().reindex(range(1, 13))
+        lows = months.min().reindex(range(1, 13))
+        highs = months.max().reindex(range(1, 13))
+        labels = MONTH_NAMES
+
+    # Change unit of measurement to approprate unit
+    max_value = values.max()
+    if max_value >= 1000000:
+        scale, unit = 1000000, "GWh"
+    elif max_value >= 1000:
+        scale, unit = 1000, "MWh"
+    else:
+        scale, unit = 1, "KWh"
+    values = values / scale
+
+    # Color hue based on height ranking of bars. Tallest = darkest, shortest = lightest.
+    ranks = values.rank(method="first").sub(1).fillna(0).astype(int).to_numpy()
+    colors = colormaps["Blues"](np.linspace(0.35, 0.9, len(values)))[ranks]
+
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.figure(figsize=(12, 9), dpi=dpi).gca()
+    figure = ax.figure
+    if plot_type == "Years":
+        bars = ax.bar(labels, values.to_numpy(), color=colors)
+        ax.bar_label(bars, fmt="%.2f", padding=3)
+        ax.set_title("Total Solar Energy Production Yield by Year", fontsize=16)
+        ax.set_ylabel(f"Total Energy Yield ({unit})")
+        summary = f"Highest Year: {values.max():.2f} {unit}\nLowest Year: {values.min():.2f} {unit}\nAvg (Dashed line): {values.mean():.2f} {unit}"
+    else:
+        errors = np.clip([(values - lows / scale).to_numpy(), (highs / scale - values).to_numpy()], 0, None)
+        ax.bar(labels, values.to_numpy(), color=colors, yerr=errors, capsize=4, ecolor="0.3")
+        ax.set_title("Average Solar Energy Production Yield By Month", fontsize=16)
+        ax.set_ylabel(f"Average Energy Yield ({unit})")
+        ax.tick_params(axis="x", labelrotation=45)
+        summary = f"Highest Average Month: {values.max():.2f} {unit}\nLowest Average Month: {values.min():.2f} {unit}\nAverage Month (Dashed line): {values.mean():.2f} {unit}"
+
+    # Average line, raised plot "roof", light grid and the textbox with max, min and avg values of all yield data
+    ax.axhline(values.mean(), color="gray", linestyle="--")
+    ax.set_ylim(0, ax.get_ylim()[1] * 1.3)
+    ax.grid(True, axis="y", alpha=0.3)
+    ax.set_axisbelow(True)
+    for side in ["top", "right", "left"]:
+        ax.spines[side].set_visible(False)
+    figure.text(0.15, 0.78, f"Location: {location}\nSize of Panel Area: {panel_area} m²\n{summary}", transform=figure.transFigure, bbox=dict(facecolor="white", boxstyle="round,pad=1", alpha=0.9))
+    return figure
+
+
+def plot_exceedance(yields, panel_area, location, dpi=REPORT_DPI, ax=None):
+    ## Draws the distribution of the synthetic annual yields of simulate_uncertainty, with the P50 / P75 / P90 yields marked.
+    ## Draws on ax if given (See ReportGenerator), otherwise on a new pyplot figure which the caller closes.
+    estimates = exceedance_yields(yields)["Annual Energy Yield (KWh)"]
+
+    # Change unit of measurement to approprate unit
+    max_value = np.max(yields)
+    if max_value >= 1000000:
+        scale, unit = 1000000, "GWh"
+    elif max_value >= 1000:
+        scale, unit = 1000, "MWh"
+    else:
+        scale, unit = 1, "KWh"
+
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.figure(figsize=(12, 9), dpi=dpi).gca()
+    figure = ax.figure
+    counts, _, _ = ax.hist(np.asarray(yields) / scale, bins=60, color="#6baed6")
+    # Raised plot "roof" for the estimate labels and the textbox
+    ax.set_ylim(0, counts.max() * 1.6)
+    for (estimate, value), shade in zip(estimates.items(), np.linspace(0.9, 0.5, len(estimates))):
+        ax.axvline(value / scale, color=str(1 - shade), linestyle="--")
+        ax.text(value / scale, counts.max() * 1.1, f" {estimate}", va="bottom")
+    ax.set_title("Annual Solar Energy Production Yield Uncertainty", fontsize=16)
+    ax.set_xlabel(f"Annual Energy Yield ({unit})")
+    ax.set_ylabel("Synthetic Years")
+    ax.grid(True, axis="y", alpha=0.3)
+    ax.set_axisbelow(True)
+    for side in ["top", "right", "left"]:
+        ax.spines[side].set_visible(False)
+    summary = "\n".join(f"{estimate}: {value / scale:.2f} {unit}" for estimate, value in estimates.items())
+    ax.text(0.02, 0.97, f"Location: {location}\nSize of Panel Area: {panel_area} m²\nSynthetic Years: {len(yields)}\n{summary}", transform=ax.transAxes, va="top",
+            bbox=dict(facecolor="white", boxstyle="round,pad=1", alpha=0.9))
+    return figure
+
+
+class ReportGenerator:
+    ## Renders site reports (yearly totals and monthly averages) to a PDF, or to two PNG files (<name>-years.png and <name>-months.png).
+    ## If the synthetic years of simulate_uncertainty are given, the report gets a page with the P50 / P75 / P90 yields (<name>-uncertainty.png).
+    ## The figures are created with the object oriented Figure API, so they are never registered with pyplot's global figure manager,
+    ## and are cleared after writing. Memory stays flat when rendering many reports in one long running process.
+
+    def __init__(self, dpi=REPORT_DPI, backend=REPORT_BACKEND):
+        if backend not in ["seaborn", "matplotlib"]:
+            raise ValueError("ReportGenerator parameter backend must either be seaborn or matplotlib.")
+        self.dpi = dpi
+        self.backend = backend
+        self.reports = 0
+
+    def figure(self, df, plot_type, panel_area, location):
+        # Draws one plot on a new Figure owned by the generator. Not attached to pyplot, so the figure is freed when it goes out of scope.
+        from matplotlib.figure import Figure
+        figure = Figure(figsize=(12, 9), dpi=self.dpi)
+        ax = figure.subplots()
+        # The uncertainty plot takes the synthetic annual yields instead of the aggregated data
+        if plot_type == "Uncertainty":
+            plot_exceedance(df, panel_area, location, dpi=self.dpi, ax=ax)
+        else:
+            plot = plot_data if self.backend == "seaborn" else plot_yield
+            plot(df, plot_type, panel_area, location, dpi=self.dpi, ax=ax)
+        return figure
+
+    @traced("plot")
+    def render(self, df, panel_area, location, path, uncertainty=None):
+        if not path.endswith((".pdf", ".png")):
+            raise ValueError("render_report parameter path must be a .pdf or .png file.")
+        plots = [(df, "Years"), (df, "Months")]
+        if uncertainty is not None:
+            plots.append((uncertainty, "Uncertainty"))
+        figures = []
+        try:
+            for data, plot_type in plots:
+                figures.append(self.figure(data, plot_type, panel_area, location))
+            if path.endswith(".pdf"):
+                from matplotlib.backends.backend_pdf import PdfPages
+                with PdfPages(path) as pdf:
+                    for figure in figures:
+                        pdf.savefig(figure)
+            else:
+                for (_, plot_type), figure in zip(plots, figures):
+                    figure.savefig(f"{path[:-4]}-{plot_type.lower()}.png")
+        finally:
+            # Break the references between the figure, its axes and artists right away instead of waiting for the garbage collector
+            for figure in figures:
+                figure.clear()
+        self.reports += 1
+        return path
+
+
+def render_report(df, panel_area, location, path, dpi=REPORT_DPI, backend=REPORT_BACKEND, uncertainty=None):
+    ## Renders a single site's report with a ReportGenerator. See ReportGenerator.render.
+    return ReportGenerator(dpi, backend).render(df, panel_area, location, path, uncertainty)
+
+
+def use_agg_backend():
+    ## Initializer of the report worker processes. The non-interactive Agg backend renders to files without a display.
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+@traced("reports")
+def render_reports(jobs, processes=None):
+    ## Renders many site reports in parallel, one report per job in a separate worker process. Jobs are dictionaries of render_report arguments.
+    ## A failing report doesn't stop the others. Returns a table with the Path and Error (None if rendered) of every job.
+    if not isinstance(jobs, list):
+        raise TypeError("render_reports's jobs parameter expects a list of dictionaries.")
+    rendered = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=use_agg_backend) as executor:
+        futures = [executor.submit(render_report, **job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                future.result()
+            except Exception as e:
+                rendered.append({"Path": job["path"], "Error": f"{type(e).__name__}: {e}"})
+            else:
+                rendered.append({"Path": job["path"], "Error": None})
+    return pd.DataFrame(rendered, columns=["Path", "Error"])
+
+
 if __name__ == "__main__":
     main()
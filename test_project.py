@@ -5,43 +5,137 @@ from project import calculate_daily_data
 from project import calculate_monthly_data
 from project import plot_data
 from project import SolarPanel
+from project import TokenBucket
+from project import fetch_month
+from project import ResponseCache
+from project import simulate_intervals
+from project import rollup_interval_yield
+from project import compare_yield_models
+from project import load_sites
+from project import run_batch
+from project import sweep_panels
+from project import yield_terms
+from project import linear_yield
+from project import IntervalBuffer
+from project import SOLAR_DATA_SCHEMA
+from project import aggregate_data
+from project import resample_aggregates
+from project import SiteStore
+from project import refresh_solar_data
+from project import GeocodeCache
+from project import OfflineGeocoder
+from project import reverse_geocode
+from project import plot_yield
+from project import render_report
+from project import render_reports
+from project import report_jobs
+from project import ReportGenerator
+from project import ResultsStore
+from project import SyntheticSource
+from project import SyntheticResponse
+from project import SolcastStandIn
+from project import synthetic_payload
+from project import Tracer
+from project import trace
+from project import parse_arguments
+from project import validate_site
+from project import SITE_COLUMNS
+from project import run_site
+from project import run_headless
+from project import resample_intervals
+from project import period_hours
+from project import PERIOD_MINUTES
+from project import simulate_uncertainty
+from project import exceedance_yields
+from project import select_typical_months
+from project import build_tmy
+from project import get_tmy
+from project import yield_profiles
+from project import project_lifetime
+from project import solar_position
+from project import transpose_irradiance
+from project import orient_solar_data
+from project import sweep_orientations
+from project import TrackerPanel
+from project import BifacialPanel
+from project import BifacialTrackerPanel
+from project import PANEL_MODELS
+from project import compare_panel_models
+from project import panel_model
+import numpy as np
 import pytest
+import threading
+import time
+import json
+import subprocess
+import sys
 import requests
 import pandas as pd
 from dotenv import load_dotenv
 import os
+from datetime import date
 from matplotlib.figure import Figure
-from geopy.geocoders import Nominatim
+from geopy.location import Location
+import matplotlib.pyplot as plt
 from unittest.mock import patch
+import pyarrow.dataset as ds
 
 
 # The concept of storing the API Key in an .env file and importing using dotenv and os libraries was suggested by CS50 Duck Debugger.
 load_dotenv()
 api_key = os.getenv("API_KEY")
+# Without an API key, the tests that fetch data run offline against a local Solcast stand-in server
+online = api_key is not None
+if not online:
+    api_key = "stand-in-key"
 
 
 # The use of fixtures was a suggested approach by CS50 Duck Debugger
 # Create a pytest fixture to test functions independently. Some functions in project alters and returns a new dataframe. This fixture makes sure every function can access the initial dataframe
 # create the new alteration, and be tested individually. Also makes test program more efficient as API call only has to be made once.
+# Months downloaded in earlier test runs are loaded from the local response cache.
+@pytest.fixture(scope="module")
+def session():
+    if online:
+        yield None
+        return
+    with SolcastStandIn(api_key=api_key) as server:
+        session = server.session()
+        yield session
+        session.close()
+
+
 @pytest.fixture
-def solar_data():
-    return get_solar_data("-33.856784", "151.215297", api_key, 2)
+def solar_data(session):
+    # Only real API responses are kept in the response cache
+    cache = ResponseCache() if online else None
+    data = get_solar_data("-33.856784", "151.215297", api_key, 2, cache=cache, session=session)
+    if cache is not None:
+        cache.close()
+    return data
 
 
-# The use of Nominatim module in GeoPy library for reverse geolocation was suggested in a YouTube video I watched.
-# Create an instance of a Location object to use throughout tests.
+# Create an instance of a Location object to use throughout tests. Looked up offline from the test gazetteer, and stored in a geocoding cache in tmp_path.
 @pytest.fixture
-def location():
-    geoLoc = Nominatim(user_agent="GetLoc")
-    return geoLoc.reverse("-33.856784, 151.215297")
+def geocode_cache(tmp_path):
+    return str(tmp_path / "geocode-cache.sqlite")
 
 
-def test_get_variables(location):
+@pytest.fixture
+def location(geocode_cache, gazetteer):
+    cache = GeocodeCache(geocode_cache)
+    location = reverse_geocode("-33.856784", "151.215297", cache=cache, offline=OfflineGeocoder(gazetteer))
+    cache.close()
+    return location
+
+
+def test_get_variables(location, geocode_cache):
     # The use of patch was a suggested approach by CS50 Duck Debugger.
     # Side effect is a list of inputs to all the input calls of the function. 1. = Latitude. 2. = Longitude. 3. = Years. 4. = Panel Area (m2). 5. = STC Module Efficiency. 6. = Temperature Coefficient.
-    # Test valid input case
-    with patch("builtins.input", side_effect=["-33.856784", "151.215297", "5", "20", "21.48", "-0.340"]):
-        result = get_variables()
+    # Test valid input case. The location is loaded from the geocoding cache, without any network lookups.
+    with patch("builtins.input", side_effect=["-33.856784", "151.215297", "5", "20", "21.48", "-0.340"]), \
+         patch("geopy.geocoders.Nominatim.reverse", side_effect=AssertionError("Network lookup")):
+        result = get_variables(geocode_cache)
         expected_output = ("-33.856784", "151.215297", location, 5, 20, 21.48, -0.340)
         assert result == expected_output
 
@@ -86,7 +180,7 @@ def test_generate_date_ranges():
     assert end == expected_lastrange_end
 
 
-def test_get_solar_data(solar_data):
+def test_get_solar_data(solar_data, session):
     # Test for correct object type returned. initial_dataframe is the pytest fixture.
     assert isinstance(solar_data, pd.DataFrame)
 
@@ -106,7 +200,7 @@ def test_get_solar_data(solar_data):
         get_solar_data("-33.856784", "151.215297", api_key, 15)
     # Test API Key
     with pytest.raises(requests.HTTPError):
-        get_solar_data("-33.856784", "151.215297", 1, 2)
+        get_solar_data("-33.856784", "151.215297", 1, 2, session=session)
 
 
 def test_calculate_daily_data(solar_data):
@@ -196,3 +290,889 @@ def test_plot_data(solar_data, location):
     # Test for correct object type returned
     figure = plot_data(df, "Months", 1, location)
     assert isinstance(figure, Figure)
+
+
+@pytest.fixture
+def synthetic_data():
+    return get_solar_data("-33.856784", "151.215297", "key", 2, rate_limit=1000, session=SyntheticSource())
+
+
+# Fake keep-alive session returning a fixed sequence of responses, so the retry logic can be tested without the API.
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_fetch_month():
+    payload = {"start": "2022-01-01T00:00:00Z"}
+    # Test that rate limiting, server errors and connection errors are retried
+    session = FakeSession([SyntheticResponse(429), SyntheticResponse(503), requests.ConnectionError(), SyntheticResponse(200, {"estimated_actuals": []})])
+    assert fetch_month(session, payload, retries=3, backoff=0) == {"estimated_actuals": []}
+    assert session.calls == 4
+
+    # Test that the server's Retry-After wait time is capped at the longest backoff
+    session = FakeSession([SyntheticResponse(429, headers={"Retry-After": "3600"}), SyntheticResponse(200, {"estimated_actuals": []})])
+    with patch("project.time.sleep") as sleep:
+        fetch_month(session, payload, retries=3, backoff=0.5)
+    sleep.assert_called_once_with(4)
+
+    # Test that a wrong API key is not retried
+    session = FakeSession([SyntheticResponse(401), SyntheticResponse(200, {})])
+    with pytest.raises(requests.HTTPError):
+        fetch_month(session, payload, retries=3, backoff=0)
+    assert session.calls == 1
+
+    # Test that HTTPError is raised after all retries are used up
+    session = FakeSession([SyntheticResponse(500)] * 3)
+    with pytest.raises(requests.HTTPError):
+        fetch_month(session, payload, retries=2, backoff=0)
+
+
+def test_token_bucket():
+    # Test that the burst is allowed straight away and the refill rate limits the rest
+    bucket = TokenBucket(100, 5)
+    for _ in range(5):
+        bucket.acquire()
+    assert bucket.tokens < 1
+
+    # Test that the function raises the correct errors
+    with pytest.raises(ValueError):
+        TokenBucket(0, 5)
+    with pytest.raises(ValueError):
+        TokenBucket(5, 0)
+
+
+def test_get_solar_data_concurrent(synthetic_data):
+    # Test that concurrently fetched months are reassembled in chronological order
+    assert synthetic_data["Period end"].is_monotonic_increasing
+    assert synthetic_data["Period end"].dt.month.nunique() == 12
+
+    # Test that the same data is returned independent of the concurrency limit
+    serial_data = get_solar_data("-33.856784", "151.215297", "key", 2, max_workers=1, rate_limit=1000, session=SyntheticSource())
+    pd.testing.assert_frame_equal(synthetic_data, serial_data)
+
+    # Test max_workers parameter
+    with pytest.raises(ValueError):
+        get_solar_data("-33.856784", "151.215297", "key", 2, max_workers=0)
+
+
+def test_response_cache(tmp_path):
+    payload = {"latitude": "-33.856784", "longitude": "151.215297", "output_parameters": ["gti", "air_temp"], "array_type": "fixed",
+               "start": "2022-01-01T00:00:00Z", "end": "2022-01-31T23:59:59Z", "format": "json", "api_key": "key"}
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    assert cache.get(payload) is None
+    cache.put(payload, {"estimated_actuals": [{"gti": 1}]})
+    # Test that the API key is not part of the cache key
+    assert cache.get(dict(payload, api_key="other")) == {"estimated_actuals": [{"gti": 1}]}
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    # Test that a re-run is served from the cache without any requests
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    session = SyntheticSource()
+    first = get_solar_data("-33.856784", "151.215297", "key", 2, rate_limit=1000, session=session, cache=cache)
+    second = get_solar_data("-33.856784", "151.215297", "key", 2, rate_limit=1000, session=FakeSession([]), cache=cache)
+    assert session.calls == 24
+    pd.testing.assert_frame_equal(first, second)
+
+    # Test that least recently used months are evicted when the cache grows too big
+    small_cache = ResponseCache(str(tmp_path / "small.sqlite"), max_bytes=1)
+    small_cache.put(payload, {"estimated_actuals": []})
+    small_cache.put(dict(payload, start="2022-02-01T00:00:00Z"), {"estimated_actuals": []})
+    assert small_cache.get(payload) is None
+
+    # Test that the function raises the correct errors
+    with pytest.raises(TypeError):
+        ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes="cat")
+    with pytest.raises(ValueError):
+        ResponseCache(str(tmp_path / "cache.sqlite"), ttl=-1)
+
+
+def test_solarpanel_vectorized(synthetic_data):
+    Panel = SolarPanel(45, 800, 25, 21.48, -0.340)
+    # Test that arrays give the same result as one value at a time
+    daytemp = np.array([10.0, 20.0, 30.0])
+    hourly_gti = np.array([200.0, 500.0, 800.0])
+    total_gti = np.array([1000.0, 4000.0, 6000.0])
+    result = Panel.calculate_yield(daytemp, hourly_gti, total_gti, 20)
+    assert isinstance(result, np.ndarray)
+    expected = [Panel.calculate_yield(t, h, g, 20) for t, h, g in zip(daytemp, hourly_gti, total_gti)]
+    assert np.allclose(result, expected)
+
+    # Test the batch entry point against the per row loop
+    monthly_data = calculate_monthly_data(synthetic_data)
+    expected = [Panel.calculate_yield(row["Average Daytime Temp"], row["Average hourly GTI (W/m2)"], row["Total GTI (Wh/m2)"], 20) for _, row in monthly_data.iterrows()]
+    monthly_data = Panel.calculate_yields(monthly_data, 20)
+    assert np.allclose(monthly_data["Energy Yield (KWh)"], expected)
+
+    with pytest.raises(TypeError):
+        Panel.calculate_yields("cat", 20)
+
+
+def test_simulate_intervals(synthetic_data):
+    Panel = SolarPanel(45, 800, 25, 21.48, -0.340)
+    interval_data = simulate_intervals(synthetic_data, Panel, 20)
+    assert all(column in interval_data.columns for column in ["Cell Temp", "Efficiency", "Energy Yield (KWh)"])
+    assert len(interval_data) == len(synthetic_data)
+    # Test that night intervals produce no energy
+    assert (interval_data.loc[interval_data["W/m2 (GTI)"] == 0, "Energy Yield (KWh)"] == 0).all()
+
+    # Test that the rollups add up to the same total
+    rollups = rollup_interval_yield(interval_data)
+    total = interval_data["Energy Yield (KWh)"].sum()
+    for resolution in ["Daily", "Monthly", "Yearly"]:
+        assert np.isclose(rollups[resolution]["Energy Yield (KWh)"].sum(), total)
+    assert len(rollups["Monthly"]) == 24
+
+    # Test the comparison against the monthly approximation
+    monthly_data = Panel.calculate_yields(calculate_monthly_data(synthetic_data), 20)
+    comparison = compare_yield_models(monthly_data, rollups["Monthly"])
+    assert np.isclose(comparison.loc[("Total", ""), "Interval Model (KWh)"], total)
+
+    # Test that the function raises the correct errors
+    with pytest.raises(TypeError):
+        simulate_intervals("cat", Panel, 20)
+    with pytest.raises(TypeError):
+        simulate_intervals(synthetic_data, "cat", 20)
+    with pytest.raises(ValueError):
+        rollup_interval_yield(synthetic_data)
+
+
+def test_run_batch(tmp_path):
+    # Test loading sites from CSV, with one invalid latitude and one invalid module efficiency
+    sites_file = tmp_path / "sites.csv"
+    sites_file.write_text("name,latitude,longitude,years,panel_area,STC_eff,temp_coeff\n"
+                          "Sydney,-33.856784,151.215297,2,20,21.48,-0.340\n"
+                          ",-91,151.215297,2,20,21.48,-0.340\n"
+                          "Oslo,59.91,10.75,2,20,50,-0.340\n"
+                          "Perth,-31.95,115.86,2,100,20,-0.35\n")
+    sites = load_sites(str(sites_file))
+    assert [site["name"] for site in sites] == ["Sydney", "Site 2", "Oslo", "Perth"]
+
+    # Test that failing sites are reported without aborting the batch
+    results, failures = run_batch(sites, "key", max_workers=2, processes=2, rate_limit=1000, session=SyntheticSource())
+    assert list(results["Site"].unique()) == ["Sydney", "Perth"]
+    assert len(results) == 48
+    assert results["Energy Yield (KWh)"].notna().all()
+    assert list(failures["Site"]) == ["Site 2", "Oslo"]
+    assert all(failures["Error"].str.startswith("ValueError"))
+
+    # Test that a site the offline geocoder can't name is reported as a failure, without aborting the batch
+    class PartialGeocoder:
+        def reverse(self, latitude, longitude):
+            if str(latitude).startswith("-31"):
+                raise ValueError("Outside of the gazetteer")
+            return Location("Sydney", (float(latitude), float(longitude)), {})
+
+    results, failures = run_batch([sites[0], sites[3]], "key", processes=1, rate_limit=1000, session=SyntheticSource(), offline=PartialGeocoder())
+    assert list(results["Location"].unique()) == ["Sydney"]
+    assert failures[["Site", "Stage"]].values.tolist() == [["Perth", "geocode"]]
+
+    # Test that the function raises the correct errors
+    with pytest.raises(ValueError):
+        load_sites(str(tmp_path / "sites.txt"))
+    json_file = tmp_path / "sites.json"
+    json_file.write_text('[{"latitude": 10, "longitude": 10}]')
+    with pytest.raises(ValueError):
+        load_sites(str(json_file))
+    with pytest.raises(TypeError):
+        run_batch("cat", "key")
+    with pytest.raises(ValueError):
+        run_batch(sites + [dict(sites[0])], "key")
+
+
+def test_sweep_panels(synthetic_data):
+    monthly_data = calculate_monthly_data(synthetic_data)
+    sweep = sweep_panels(monthly_data, [18, 21.48], [-0.45, -0.34], [1, 20], [0.96, 0.98])
+    assert len(sweep) == 16
+
+    # Test that every configuration matches a SolarPanel simulation of the same configuration
+    for _, row in sweep.sample(4, random_state=1).iterrows():
+        Panel = SolarPanel(45, 800, 25, row["STC_eff"], row["temp_coeff"], row["inverter_eff"])
+        expected = Panel.calculate_yields(monthly_data.copy(), row["panel_area"])["Energy Yield (KWh)"].sum()
+        assert np.isclose(row["Total Energy Yield (KWh)"], expected)
+
+    # Test that the linear decomposition gives the same yields as the SolarPanel model
+    gti, gti_temp = yield_terms(monthly_data)
+    expected = SolarPanel(45, 800, 25, 21.48, -0.34).calculate_yields(monthly_data.copy(), 20)["Energy Yield (KWh)"].to_numpy(dtype=float)
+    assert np.allclose(linear_yield(21.48, -0.34, 20, 0.96, gti, gti_temp), expected)
+
+    # Test that a month without sun hours adds nothing to the yield, instead of making it NaN
+    dark = monthly_data.copy()
+    dark.iloc[0, dark.columns.get_indexer(["Total GTI (Wh/m2)", "Average hourly GTI (W/m2)", "Average Daytime Temp"])] = [0, 0, np.nan]
+    dark_sweep = sweep_panels(dark, 21.48, -0.34, 20)
+    assert dark_sweep["Total Energy Yield (KWh)"].notna().all()
+    assert np.isclose(dark_sweep.loc[0, "Total Energy Yield (KWh)"], sweep_panels(monthly_data.iloc[1:], 21.48, -0.34, 20).loc[0, "Total Energy Yield (KWh)"])
+
+    # Test module datasheets given as pairs
+    paired = sweep_panels(monthly_data, [18, 21.48, 22], [-0.45, -0.34, -0.31], 20, paired=True)
+    assert len(paired) == 3
+    assert list(paired["temp_coeff"]) == [-0.45, -0.34, -0.31]
+
+    # Test that the function raises the correct errors
+    with pytest.raises(TypeError):
+        sweep_panels("cat", 20, -0.4, 1)
+    with pytest.raises(ValueError):
+        sweep_panels(monthly_data, [18, 20], [-0.4], 1, paired=True)
+    with pytest.raises(ValueError):
+        sweep_panels(monthly_data, 50, -0.4, 1)
+
+
+def test_project_lifetime(synthetic_data):
+    monthly_data = calculate_monthly_data(synthetic_data)
+    sweep = sweep_panels(monthly_data, [18, 21.48], [-0.45, -0.34], [1, 20])
+    profiles = yield_profiles(monthly_data, sweep)
+    assert profiles.shape == (8, 12)
+    assert np.allclose(profiles.sum(axis=1), sweep["Average Yearly Yield (KWh)"])
+
+    # Test that without degradation every year yields the profile, and that degradation and LID lower every following year
+    summary, curves = project_lifetime(profiles, 25, degradation=0, lid=0)
+    assert len(curves) == 8 * 25
+    assert np.allclose(curves["Energy Yield (KWh)"].groupby(level="Profile").max(), profiles.sum(axis=1))
+    assert np.allclose(summary["Lifetime Yield (MWh)"], profiles.sum(axis=1) * 25 / 1000)
+    summary, curves = project_lifetime(profiles, 30, degradation=[0.5] * 4 + [0.8] * 4, lid=2)
+    yearly = curves["Energy Yield (KWh)"].unstack()
+    assert (np.diff(yearly.to_numpy(), axis=1) < 0).all()
+    assert np.allclose(yearly[2] / yearly[1], [0.995] * 4 + [0.992] * 4)
+    assert np.allclose((summary["First Year Yield (KWh)"] / profiles.sum(axis=1))[:4], 0.98 * 0.995 ** (6.5 / 12), rtol=1e-3)
+    assert np.allclose(curves["Cumulative Yield (MWh)"].groupby(level="Profile").last(), summary["Lifetime Yield (MWh)"])
+
+    # Test that the functions raise the correct errors
+    with pytest.raises(TypeError):
+        project_lifetime("cat")
+    with pytest.raises(ValueError):
+        project_lifetime(profiles[[1, 2, 3]])
+    with pytest.raises(ValueError):
+        project_lifetime(profiles, 0)
+    with pytest.raises(ValueError):
+        project_lifetime(profiles, degradation=-1)
+    with pytest.raises(ValueError):
+        yield_profiles(monthly_data, sweep[["STC_eff"]])
+
+
+def test_panel_models(tmp_path):
+    # Test that trackers are simulated on tracker irradiance, and that bifacial panels add the rear side yield
+    source = SyntheticSource()
+    fixed = calculate_monthly_data(get_solar_data("-33.856784", "151.215297", "key", 2, rate_limit=1000, session=source))
+    tracked = calculate_monthly_data(get_solar_data("-33.856784", "151.215297", "key", 2, rate_limit=1000, session=source, array_type="horizontal_single_axis"))
+    assert tracked["Total GTI (Wh/m2)"].sum() > fixed["Total GTI (Wh/m2)"].sum()
+    assert TrackerPanel.array_type == "horizontal_single_axis" and BifacialTrackerPanel.array_type == "horizontal_single_axis"
+    monofacial = SolarPanel(45, 800, 25, 21.48, -0.34).calculate_yield(20, 500, 1000, 1)
+    assert np.isclose(BifacialPanel(45, 800, 25, 21.48, -0.34, bifaciality=0).calculate_yield(20, 500, 1000, 1), monofacial)
+    assert 1.06 < BifacialPanel(45, 800, 25, 21.48, -0.34).calculate_yield(20, 500, 1000, 1) / monofacial < 1.09
+
+    # Test that a mixed portfolio is simulated in one pass, with the same yields as every model on its own
+    monthly_data = {("Sydney", "fixed"): fixed, ("Sydney", "horizontal_single_axis"): tracked, ("Perth", "fixed"): fixed.iloc[:12]}
+    configurations = pd.DataFrame({"Site": ["Sydney"] * 4 + ["Perth"] * 3, "model": list(PANEL_MODELS) + ["bifacial", float("nan"), ""],
+                                   "STC_eff": [21.48, 20, 21.48, 22, 21.48, 21.48, 21.48], "temp_coeff": -0.34, "panel_area": [20, 20, 20, 20, 100, 100, 100]})
+    compared = compare_panel_models(monthly_data, configurations)
+    for site, model, STC_eff, temp_coeff, panel_area, total in compared[["Site", "model", "STC_eff", "temp_coeff", "panel_area", "Total Energy Yield (KWh)"]].itertuples(index=False):
+        Panel = panel_model(model)(45, 800, 25, STC_eff, temp_coeff)
+        expected = Panel.calculate_yields(monthly_data[(site, Panel.array_type)].copy(), panel_area)["Energy Yield (KWh)"].sum()
+        assert np.isclose(total, expected)
+    assert np.isclose(compared.loc[4, "Average Yearly Yield (KWh)"], compared.loc[4, "Total Energy Yield (KWh)"])
+    # Blank models are simulated with the default monofacial model
+    assert compared.loc[5, "Total Energy Yield (KWh)"] > 0
+    assert np.isclose(compared.loc[5, "Total Energy Yield (KWh)"], compared.loc[6, "Total Energy Yield (KWh)"])
+
+    # Test that batch sites are fetched and simulated with their panel models
+    sites = [{"name": "Fixed", "latitude": "-33.856784", "longitude": "151.215297", "years": 2, "panel_area": 20, "STC_eff": 21.48, "temp_coeff": -0.34, "model": float("nan")},
+             {"name": "Tracker", "latitude": "-33.856784", "longitude": "151.215297", "years": 2, "panel_area": 20, "STC_eff": 21.48, "temp_coeff": -0.34, "model": "tracker"},
+             {"name": "Unknown", "latitude": "-33.856784", "longitude": "151.215297", "years": 2, "panel_area": 20, "STC_eff": 21.48, "temp_coeff": -0.34, "model": "cat"}]
+    results, failures = run_batch(sites, "key", processes=1, rate_limit=1000, session=source)
+    totals = results.groupby("Site")["Energy Yield (KWh)"].sum()
+    assert totals["Tracker"] > totals["Fixed"]
+    assert list(failures["Site"]) == ["Unknown"]
+
+    # Test that the functions raise the correct errors
+    with pytest.raises(ValueError):
+        compare_panel_models(monthly_data, configurations.assign(Site="Oslo"))
+    with pytest.raises(ValueError):
+        compare_panel_models(monthly_data, configurations.drop(columns="model"))
+    with pytest.raises(TypeError):
+        compare_panel_models(fixed, configurations)
+    for column, value in [("STC_eff", 50), ("temp_coeff", -0.1), ("panel_area", -1)]:
+        with pytest.raises(ValueError):
+            compare_panel_models(monthly_data, configurations.assign(**{column: value}))
+    with pytest.raises(ValueError):
+        get_solar_data("-33.856784", "151.215297", "key", 2, session=source, array_type="dual_axis")
+
+
+def test_interval_buffer(synthetic_data):
+    # Test typed columns of the streamed dataframe
+    assert synthetic_data["W/m2 (GTI)"].dtype == np.float32
+    assert synthetic_data["Air Temp"].dtype == np.float32
+    assert synthetic_data["Period end"].dtype == "datetime64[ns]"
+
+    # Test that the buffer grows past its preallocated capacity without losing rows
+    buffer = IntervalBuffer(2)
+    for start in range(0, 10, 3):
+        buffer.append({"W/m2 (GTI)": np.arange(start, start + 3, dtype=np.float32)})
+    df = buffer.to_frame()
+    assert list(df["W/m2 (GTI)"]) == list(range(12))
+
+
+def test_solar_data_schema(synthetic_data):
+    # Test the compact column schema and datetime index
+    assert {column: str(dtype) for column, dtype in synthetic_data.dtypes.items()} == SOLAR_DATA_SCHEMA
+    assert isinstance(synthetic_data.index, pd.DatetimeIndex)
+    # Test that night intervals have NaN instead of None as Daytime Temp, and no sun hours
+    night = synthetic_data["W/m2 (GTI)"] == 0
+    assert synthetic_data.loc[night, "Daytime Temp"].isna().all()
+    assert (synthetic_data.loc[night, "Sun Hours"] == 0).all()
+    assert (synthetic_data.loc[~night, "Sun Hours"] == 0.5).all()
+
+
+def test_aggregate_data(synthetic_data):
+    aggregates = aggregate_data(synthetic_data)
+    assert list(aggregates) == ["Daily", "Weekly", "Monthly", "Yearly"]
+    assert list(aggregates["Weekly"].index.names) == ["Year", "Week"]
+    assert len(aggregates["Monthly"]) == 24
+    # Test that every resolution adds up to the same totals
+    for resolution in aggregates:
+        assert np.isclose(aggregates[resolution]["Total GTI (Wh/m2)"].sum(), synthetic_data["W/m2 (GTI)"].sum() * 0.5)
+        assert np.isclose(aggregates[resolution]["Total Sun Hours"].sum(), synthetic_data["Sun Hours"].sum())
+
+    # Test that resampled daily data matches the aggregated months and years
+    daily = aggregates["Daily"].copy()
+    daily["Energy Yield (KWh)"] = 1.0
+    for resolution in ["Monthly", "Yearly"]:
+        resampled = resample_aggregates(daily, resolution)
+        columns = ["Average Daytime Temp", "Total GTI (Wh/m2)", "Average hourly GTI (W/m2)"]
+        assert np.allclose(resampled[columns], aggregates[resolution][columns])
+    assert resample_aggregates(daily, "Yearly")["Energy Yield (KWh)"].sum() == len(daily)
+
+    # Test that the function raises the correct errors
+    with pytest.raises(TypeError):
+        aggregate_data("cat")
+    with pytest.raises(ValueError):
+        aggregate_data(synthetic_data, ["Hourly"])
+    with pytest.raises(ValueError):
+        resample_aggregates(aggregates["Monthly"], "Weekly")
+
+
+def test_refresh_solar_data(tmp_path):
+    store = SiteStore(str(tmp_path / "store"))
+    today = date(2025, 3, 15)
+    # Test that the first run fetches the whole window, including the current year up to yesterday
+    session = SyntheticSource()
+    data, monthly_data, fetched = refresh_solar_data("-33.856784", "151.215297", "key", 2, store, today=today, rate_limit=1000, session=session)
+    assert fetched == session.calls == 27
+    stored, stored_monthly, _ = store.load("-33.856784", "151.215297")
+    assert stored.index.max() < pd.Timestamp("2025-03-15 00:01")
+    pd.testing.assert_frame_equal(stored_monthly.drop(columns="Energy Yield (KWh)"), calculate_monthly_data(stored).drop(columns="Energy Yield (KWh)"))
+    # Test that only the full years of the window are returned, like get_solar_data returns them, and the partial year is kept in the store
+    assert data.index.max() < pd.Timestamp("2025-01-01 00:01")
+    pd.testing.assert_frame_equal(monthly_data, calculate_monthly_data(data))
+
+    # Test that a nightly refresh only fetches the partial current month, and merges it into the stored data
+    session = SyntheticSource()
+    _, _, fetched = refresh_solar_data("-33.856784", "151.215297", "key", 2, store, today=date(2025, 3, 16), rate_limit=1000, session=session)
+    assert fetched == session.calls == 1
+    stored, stored_monthly, _ = store.load("-33.856784", "151.215297")
+    assert not stored.index.duplicated().any()
+    assert stored.index.max() >= pd.Timestamp("2025-03-15 23:30")
+    pd.testing.assert_frame_equal(stored_monthly.drop(columns="Energy Yield (KWh)"), calculate_monthly_data(stored).drop(columns="Energy Yield (KWh)"))
+
+    # Test that a new month also refreshes the previous month, which was stored as a partial month
+    session = SyntheticSource()
+    _, _, fetched = refresh_solar_data("-33.856784", "151.215297", "key", 2, store, today=date(2025, 4, 2), rate_limit=1000, session=session)
+    assert fetched == 2
+
+    # Test that fixed and tracker data of the same site are stored side by side, without refetching each other's months
+    session = SyntheticSource()
+    _, _, fetched = refresh_solar_data("-33.856784", "151.215297", "key", 2, store, today=date(2025, 4, 2), rate_limit=1000, session=session, array_type="horizontal_single_axis")
+    assert fetched == 28
+    for array_type in ["fixed", "horizontal_single_axis", "fixed"]:
+        _, _, fetched = refresh_solar_data("-33.856784", "151.215297", "key", 2, store, today=date(2025, 4, 2), rate_limit=1000, session=session, array_type=array_type)
+        assert fetched == 0
+
+    # Test that a second batch of fixed and tracker sites at the same coordinates runs from the store without any requests
+    sites = [{"name": name, "latitude": "-33.856784", "longitude": "151.215297", "years": 2, "panel_area": 20, "STC_eff": 21.48, "temp_coeff": -0.34, "model": model}
+             for name, model in [("Fixed", "monofacial"), ("Tracker", "tracker")]]
+    store = SiteStore(str(tmp_path / "batch-store"))
+    first, _ = run_batch(sites, "key", processes=1, rate_limit=1000, session=SyntheticSource(), store=store)
+    session = SyntheticSource()
+    second, failures = run_batch(sites, "key", processes=1, rate_limit=1000, session=session, store=store)
+    assert session.calls == 0 and failures.empty
+    pd.testing.assert_frame_equal(first, second)
+
+    # Test that store and non-store runs return identical results
+    data, monthly_data, _ = refresh_solar_data("-33.856784", "151.215297", "key", 2, store, rate_limit=1000, session=session)
+    pd.testing.assert_frame_equal(data, get_solar_data("-33.856784", "151.215297", "key", 2, rate_limit=1000, session=session))
+    pd.testing.assert_frame_equal(monthly_data, calculate_monthly_data(data))
+    unstored, _ = run_batch(sites, "key", processes=1, rate_limit=1000, session=SyntheticSource())
+    pd.testing.assert_frame_equal(second, unstored)
+
+    # Test that the function raises the correct errors
+    with pytest.raises(TypeError):
+        refresh_solar_data("-33.856784", "151.215297", "key", 2, "store")
+    with pytest.raises(ValueError):
+        refresh_solar_data("-91", "151.215297", "key", 2, store)
+
+
+def test_lazy_imports():
+    # Test that importing the simulation core doesn't load the plotting, geocoding or HTTP stacks
+    code = "import sys, project; print(','.join(m for m in ['matplotlib', 'seaborn', 'geopy', 'requests', 'dotenv'] if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    path = tmp_path / "gazetteer.csv"
+    path.write_text("name,admin,country,latitude,longitude\n"
+                    "Sydney,New South Wales,Australia,-33.86785,151.20732\n"
+                    "Oslo,Oslo,Norway,59.91273,10.74609\n"
+                    "Suva,Central,Fiji,-18.14161,178.44149\n"
+                    "Apia,Tuamasaga,Samoa,-13.83333,-171.76666\n")
+    return str(path)
+
+
+def test_offline_geocoder(gazetteer):
+    offline = OfflineGeocoder(gazetteer)
+    location = offline.reverse("-33.856784", "151.215297")
+    assert isinstance(location, Location)
+    assert location.address == "Sydney, New South Wales, Australia"
+    assert location.raw["distance_km"] < 2
+    # Test that the nearest place is found across the antimeridian
+    assert offline.reverse("-17", "-179.9").address.startswith("Suva")
+    assert offline.reverse("-14", "-172.5").address.startswith("Apia")
+
+
+def test_reverse_geocode(tmp_path, gazetteer):
+    cache = GeocodeCache(str(tmp_path / "geocode.sqlite"))
+    location = reverse_geocode("-33.856784", "151.215297", cache=cache, offline=OfflineGeocoder(gazetteer))
+    # Test that nearby coordinates are served from the cache, without the offline geocoder or Nominatim
+    with patch("geopy.geocoders.Nominatim.reverse", side_effect=AssertionError("Network lookup")):
+        assert reverse_geocode("-33.8568", "151.2153", cache=cache) == location
+    assert cache.get("-33.86", "151.22") is None
+
+    # Test that the function raises the correct errors
+    with pytest.raises(ValueError):
+        GeocodeCache(str(tmp_path / "geocode.sqlite"), precision=10)
+
+
+@pytest.fixture
+def simulated_data(synthetic_data):
+    Panel = SolarPanel(45, 800, 25, 21.48, -0.340)
+    return Panel.calculate_yields(calculate_monthly_data(synthetic_data), 20)
+
+
+def test_plot_yield(simulated_data):
+    # Test both plot types and that the global dpi setting isn't changed
+    dpi = plt.rcParams["figure.dpi"]
+    for plot_type in ["Years", "Months"]:
+        figure = plot_yield(simulated_data, plot_type, 20, "Sydney", dpi=72)
+        assert isinstance(figure, Figure)
+        assert figure.dpi == 72
+        plt.close(figure)
+    assert plt.rcParams["figure.dpi"] == dpi
+
+    # Test that the function raises the correct errors
+    with pytest.raises(TypeError):
+        plot_yield("cat", "Months", 20, "Sydney")
+    with pytest.raises(ValueError):
+        plot_yield(simulated_data, "cat", 20, "Sydney")
+    with pytest.raises(TypeError):
+        plot_yield(simulated_data, "Months", 5.5, "Sydney")
+
+
+def test_simulate_uncertainty(synthetic_data, tmp_path):
+    aggregates = aggregate_data(synthetic_data, ["Daily", "Monthly"])
+    monthly = SolarPanel(45, 800, 25, 21.48, -0.34).calculate_yields(aggregates["Monthly"].copy(), 20)
+    annual = monthly["Energy Yield (KWh)"].astype(float).groupby(level="Year").sum()
+    # Test that without tolerances, resampled months only give yields between the lowest and highest historical year
+    yields = simulate_uncertainty(aggregates["Monthly"], 21.48, -0.34, 20, 1000, tolerances=(0, 0, 0), batch_size=300, seed=0)
+    assert len(yields) == 1000
+    assert annual.min() - 1e-6 <= yields.min() and yields.max() <= annual.max() + 1e-6
+    # Test that the panel tolerances spread the yields, that the estimates are ordered and that a seed gives the same years
+    yields = simulate_uncertainty(aggregates["Daily"], 21.48, -0.34, 20, 5000, seed=0)
+    assert yields.std() > 0
+    assert np.array_equal(yields, simulate_uncertainty(aggregates["Daily"], 21.48, -0.34, 20, 5000, seed=0))
+    estimates = exceedance_yields(yields)
+    assert list(estimates.index) == ["P50", "P75", "P90"]
+    assert estimates["Annual Energy Yield (KWh)"].is_monotonic_decreasing
+    assert (yields >= estimates.loc["P90", "Annual Energy Yield (KWh)"]).mean() == pytest.approx(0.9, abs=0.01)
+
+    # Test that the estimates are added to the report
+    render_report(monthly, 20, "Sydney", str(tmp_path / "report.png"), dpi=50, backend="matplotlib", uncertainty=yields)
+    assert os.path.exists(tmp_path / "report-uncertainty.png")
+
+    # Test that the function raises the correct errors
+    with pytest.raises(TypeError):
+        simulate_uncertainty("cat", 21.48, -0.34, 20)
+    with pytest.raises(ValueError):
+        simulate_uncertainty(aggregates["Monthly"].droplevel("Year"), 21.48, -0.34, 20)
+    with pytest.raises(ValueError):
+        simulate_uncertainty(aggregates["Monthly"], 21.48, -0.34, 20, 0)
+    with pytest.raises(ValueError):
+        simulate_uncertainty(aggregates["Monthly"].loc[(slice(None), slice(1, 6)), :], 21.48, -0.34, 20)
+    with pytest.raises(ValueError):
+        exceedance_yields(yields, [100])
+
+
+def test_render_report(simulated_data, tmp_path):
+    # Test that reports are written and all figures are closed, with both backends
+    location = Location("Sydney, Australia", (-33.856784, 151.215297), {})
+    figures = len(plt.get_fignums())
+    for backend in ["matplotlib", "seaborn"]:
+        path = render_report(simulated_data, 20, location, str(tmp_path / f"{backend}.pdf"), dpi=72, backend=backend)
+        assert os.path.getsize(path) > 0
+    render_report(simulated_data, 20, "Sydney", str(tmp_path / "report.png"), dpi=72, backend="matplotlib")
+    assert os.path.exists(tmp_path / "report-years.png") and os.path.exists(tmp_path / "report-months.png")
+    assert len(plt.get_fignums()) == figures
+
+    # Test parallel rendering, where a failing report doesn't stop the others
+    jobs = [{"df": simulated_data, "panel_area": 20, "location": "Sydney", "path": str(tmp_path / "a.pdf"), "dpi": 72, "backend": "matplotlib"},
+            {"df": simulated_data, "panel_area": -1, "location": "Sydney", "path": str(tmp_path / "b.pdf"), "dpi": 72, "backend": "matplotlib"}]
+    rendered = render_reports(jobs, processes=2)
+    assert list(rendered["Error"].isna()) == [True, False]
+    assert os.path.exists(tmp_path / "a.pdf")
+
+    # Test that batch report jobs are drawn with the chosen backend
+    results = simulated_data.reset_index().assign(Site="Sydney", Latitude="-33.856784", Longitude="151.215297")
+    jobs = report_jobs(results, [{"name": "Sydney", "panel_area": 20}], str(tmp_path / "reports"), dpi=72, backend="seaborn")
+    assert jobs[0]["backend"] == "seaborn" and jobs[0]["location"].address == "-33.856784, 151.215297"
+    assert render_reports(jobs, processes=1)["Error"].isna().all()
+
+    # Test that the function raises the correct errors
+    with pytest.raises(ValueError):
+        render_report(simulated_data, 20, "Sydney", str(tmp_path / "report.txt"), backend="matplotlib")
+    with pytest.raises(ValueError):
+        render_report(simulated_data, 20, "Sydney", str(tmp_path / "report.pdf"), backend="cat")
+
+
+def test_report_generator(simulated_data, tmp_path):
+    # Test that generated reports never register figures with pyplot, and that the generator can be reused
+    location = Location("Sydney, Australia", (-33.856784, 151.215297), {})
+    figures = len(plt.get_fignums())
+    for backend in ["matplotlib", "seaborn"]:
+        generator = ReportGenerator(dpi=72, backend=backend)
+        for i in range(3):
+            generator.render(simulated_data, 20, location, str(tmp_path / f"{backend}-{i}.pdf"))
+        assert generator.reports == 3
+        assert len(plt.get_fignums()) == figures
+
+    # Test that the figures are drawn on the given axes, without changing the global matplotlib style
+    with plt.rc_context():
+        plt.style.use("default")
+        style = dict(plt.rcParams)
+        figure = generator.figure(simulated_data, "Years", 20, location)
+        assert dict(plt.rcParams) == style
+    assert figure.axes[0].get_title() == "Total Solar Energy Production Yield by Year"
+    assert len(plt.get_fignums()) == figures
+
+    # Test that the class raises the correct errors
+    with pytest.raises(ValueError):
+        ReportGenerator(backend="cat")
+    with pytest.raises(ValueError):
+        generator.render(simulated_data, 20, location, str(tmp_path / "report.txt"))
+
+
+def test_results_store(synthetic_data, simulated_data, tmp_path):
+    # Test that every table is written partitioned by site and year, and read back with the same values
+    store = ResultsStore(str(tmp_path / "results"))
+    daily = calculate_daily_data(synthetic_data)
+    store.export("Sydney", synthetic_data, daily, simulated_data)
+    store.export("Site/2", monthly=simulated_data)
+    assert os.path.exists(tmp_path / "results" / "monthly" / "Site=Sydney" / f"Year={simulated_data.index[0][0]}" / "part-0.parquet")
+    monthly = store.load("monthly")
+    assert len(monthly) == 2 * len(simulated_data)
+    assert list(monthly.columns[:3]) == ["Site", "Year", "Month"]
+    sydney = monthly[monthly["Site"] == "Sydney"].set_index(["Year", "Month"])
+    assert np.allclose(sydney["Energy Yield (KWh)"], simulated_data["Energy Yield (KWh)"].astype(float))
+    assert len(store.load("intervals")) == len(synthetic_data)
+    assert len(store.load("daily", sites=["Sydney"])) == len(daily)
+
+    # Test filtering by partitions and by predicates on the data
+    year = int(simulated_data.index[0][0])
+    assert set(store.load("monthly", sites=["Site/2"], years=[year])["Year"]) == {year}
+    high = store.load("monthly", filter=ds.field("Energy Yield (KWh)") > 100, columns=["Site", "Energy Yield (KWh)"], memory_map=False)
+    assert (high["Energy Yield (KWh)"] > 100).all() and list(high.columns) == ["Site", "Energy Yield (KWh)"]
+
+    # Test that exporting a site again replaces its partitions instead of appending
+    store.export("Sydney", monthly=simulated_data)
+    assert len(store.load("monthly")) == 2 * len(simulated_data)
+    # Test that years a site no longer has are removed as well
+    last_year = simulated_data.index.get_level_values("Year").max()
+    store.export("Sydney", monthly=simulated_data.loc[[last_year]])
+    assert set(store.load("monthly", sites=["Sydney"])["Year"]) == {last_year}
+    # Test that data with other columns is rejected, without changing the stored results, unless it replaces the only site of the table
+    with pytest.raises(ValueError):
+        store.write("monthly", simulated_data.reset_index().assign(Site="Perth", Latitude="-31.95"))
+    assert len(store.load("monthly")) == len(simulated_data) + 12
+    store.write("intervals", synthetic_data.assign(Extra=1.0), "Sydney")
+    assert "Extra" in store.load("intervals").columns
+
+    # Test that the class raises the correct errors
+    with pytest.raises(ValueError):
+        store.load("cat")
+    with pytest.raises(ValueError):
+        store.write("monthly", simulated_data)
+    with pytest.raises(FileNotFoundError):
+        ResultsStore(str(tmp_path / "empty")).load("monthly")
+    with open(tmp_path / "results" / "monthly" / "_schema.json", "w") as file:
+        json.dump({"schema_version": 0}, file)
+    with pytest.raises(ValueError):
+        store.load("monthly")
+
+
+def test_solcast_stand_in(synthetic_data, tmp_path):
+    # Test that data fetched over HTTP from the stand-in matches the in-process source, and that cached months aren't requested again
+    with SolcastStandIn(api_key="key") as server:
+        session = server.session(max_workers=4)
+        cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+        data = get_solar_data("-33.856784", "151.215297", "key", 2, max_workers=4, rate_limit=1000, session=session, cache=cache)
+        pd.testing.assert_frame_equal(data, synthetic_data)
+        assert server.requests == 24
+        get_solar_data("-33.856784", "151.215297", "key", 2, max_workers=4, rate_limit=1000, session=session, cache=cache)
+        assert server.requests == 24
+        cache.close()
+
+        # Test that a wrong API key and a wrong path are rejected like the real API
+        with pytest.raises(requests.HTTPError):
+            get_solar_data("-33.856784", "151.215297", "wrong", 2, rate_limit=1000, session=session)
+        assert session.session.get(server.url.replace("radiation", "cat"), timeout=5).status_code == 404
+        session.close()
+
+    # Test the configurable latency and response size
+    params = {"start": "2022-01-01T00:00:00Z", "end": "2022-01-31T23:59:59Z"}
+    assert len(synthetic_payload(params, extra_fields=3)["estimated_actuals"][0]) == 7
+    with SolcastStandIn(latency=0.05, extra_fields=3) as server:
+        session = server.session()
+        start = time.perf_counter()
+        response = session.get(None, params={**params, "api_key": "any"}, timeout=5)
+        assert time.perf_counter() - start >= 0.05
+        assert response.json() == synthetic_payload(params, extra_fields=3)
+        assert server.bytes_sent == len(response.content)
+        session.close()
+
+    # Test that the classes raise the correct errors
+    with pytest.raises(ValueError):
+        SolcastStandIn(latency=-1)
+    with pytest.raises(ValueError):
+        SyntheticSource(latency=-1)
+
+
+def test_tracer(tmp_path):
+    # Test that stages and month requests are recorded as a Chrome trace, with bytes, rows and cache hits
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    with Tracer(str(tmp_path / "trace.json"), str(tmp_path / "profiles")) as tracer:
+        with SolcastStandIn() as server:
+            session = server.session()
+            for _ in range(2):
+                data = get_solar_data("-33.856784", "151.215297", "key", 2, rate_limit=1000, session=session, cache=cache)
+            session.close()
+        with trace("custom", rows=5) as span:
+            span["note"] = "added while running"
+        aggregate_data(data)
+    cache.close()
+    assert Tracer.active is None
+
+    with open(tmp_path / "trace.json") as file:
+        events = json.load(file)["traceEvents"]
+    months = [event for event in events if event["name"] == "month"]
+    assert len(months) == 48 and all(event["ph"] == "X" and event["cat"] == "request" for event in months)
+    assert sum(event["args"]["cache_hit"] for event in months) == 24
+    assert sum(event["args"].get("bytes", 0) for event in months) == server.bytes_sent
+    fetches = [event for event in events if event["name"] == "fetch"]
+    assert [event["args"]["rows"] for event in fetches] == [len(data)] * 2
+    custom = next(event for event in events if event["name"] == "custom")["args"]
+    assert custom["rows"] == 5 and custom["note"] == "added while running"
+
+    # Test the summary and that a cProfile dump is written per top level stage (2 fetches, custom and aggregate)
+    summary = tracer.summary().set_index("Name")
+    assert summary.loc["month", "Calls"] == 48 and summary.loc["aggregate", "Input rows"] == len(data)
+    profiles = [event["args"]["profile"] for event in events if "profile" in event["args"]]
+    assert len(profiles) == 4 and all(os.path.exists(path) for path in profiles)
+
+    # Test that nothing is recorded without an active tracer
+    with trace("ignored") as span:
+        span["rows"] = 1
+    assert len(tracer.events) == len(events)
+
+
+def test_parse_arguments_config(tmp_path):
+    # Test a single site run from a TOML config file with sections, where command line arguments override the config
+    config = tmp_path / "site.toml"
+    config.write_text('[site]\nlatitude = "-33.856784"\nlongitude = "151.215297"\nyears = 2\n\n[panel]\npanel_area = 20\nstc_eff = 21.48\ntemp_coeff = -0.34\n\n'
+                      '[run]\nworkers = 8\ncache = false\nreport = "site.pdf"\n')
+    args = parse_arguments(["--config", str(config), "--workers", "2", "--years", "3"])
+    assert (args.latitude, args.panel_area, args.STC_eff, args.temp_coeff) == ("-33.856784", 20, 21.48, -0.34)
+    assert (args.workers, args.years, args.cache, args.report, args.batch) == (2, "3", False, "site.pdf", None)
+    assert validate_site({column: getattr(args, column) for column in SITE_COLUMNS}) == ("-33.856784", "151.215297", 3, 20, 21.48, -0.34)
+
+    # Test YAML and JSON config files
+    (tmp_path / "site.yaml").write_text("latitude: '-33.856784'\nlongitude: '151.215297'\nyears: 2\npanel-area: 20\nSTC_eff: 21.48\ntemp_coeff: -0.34\nrate_limit: 2\n")
+    assert parse_arguments(["--config", str(tmp_path / "site.yaml")]).rate_limit == 2
+    (tmp_path / "batch.json").write_text(json.dumps({"batch": "sites.csv", "export": "results"}))
+    args = parse_arguments(["--config", str(tmp_path / "batch.json"), "--no-cache"])
+    assert (args.batch, args.export, args.cache) == ("sites.csv", "results", False)
+
+    # Test that the single site export can be turned off
+    assert parse_arguments(["--config", str(config)]).export is None
+    assert parse_arguments(["--config", str(config), "--no-export"]).export is False
+
+    # Test that unknown settings, missing site fields, unreadable config files and single site settings in the batch mode exit with an error
+    (tmp_path / "typo.toml").write_text('panel_aera = 20\n')
+    for argv in [["--config", str(tmp_path / "typo.toml")], ["--latitude", "10"], ["--config", str(tmp_path / "site.txt")], ["--config", str(tmp_path / "missing.toml")],
+                 ["--batch", "sites.csv", "--tilt", "30"], ["--batch", "sites.csv", "--mode", "interval"], ["--batch", "sites.csv", "--resample", "PT60M"]]:
+        with pytest.raises(SystemExit):
+            parse_arguments(argv)
+
+
+def test_transpose_irradiance():
+    # Test the sun position at solar noon in Sydney on the summer and winter solstice
+    zenith, azimuth, extraterrestrial = solar_position(np.array(["2023-12-22T02:00", "2023-06-21T02:00"], dtype="datetime64[ns]"), -33.86, 151.21)
+    assert np.allclose(zenith, [33.86 - 23.44, 33.86 + 23.44], atol=0.5)
+    assert (np.minimum(azimuth, 360 - azimuth) < 10).all()
+    assert 1300 < extraterrestrial.min() and extraterrestrial.max() < 1420
+
+    # Test that a flat panel gets the GHI, and that panels facing the pole get less than panels facing the equator
+    data = get_solar_data("-33.856784", "151.215297", "key", 2, rate_limit=1000, session=SyntheticSource(), components=True)
+    flat, north, south = transpose_irradiance(data, "-33.856784", "151.215297", [0, 30, 30], [0, 0, 180])
+    assert np.allclose(flat, data["W/m2 (GHI)"], atol=3)
+    assert north.sum() > flat.sum() > south.sum()
+    assert np.allclose(orient_solar_data(data, "-33.856784", "151.215297", 30)["W/m2 (GTI)"], north)
+
+    # Test that one download is evaluated for every orientation, and that the best orientation faces north at about the latitude
+    sweep = sweep_orientations(data, "-33.856784", "151.215297", range(0, 61, 10), [0, 90, 180, 270], 21.48, -0.34, 20)
+    assert len(sweep) == 28
+    best = sweep.loc[sweep["Average Yearly Yield (KWh)"].idxmax()]
+    assert best["azimuth"] == 0 and 20 <= best["tilt"] <= 40
+    flat_yield = sweep.loc[sweep["tilt"] == 0, "Average Yearly Yield (KWh)"]
+    assert np.allclose(flat_yield, flat_yield.iloc[0])
+
+    # Test that the functions raise the correct errors
+    with pytest.raises(TypeError):
+        transpose_irradiance("cat", "-33.856784", "151.215297", 30, 0)
+    with pytest.raises(ValueError):
+        transpose_irradiance(data.drop(columns="W/m2 (DNI)"), "-33.856784", "151.215297", 30, 0)
+    with pytest.raises(ValueError):
+        transpose_irradiance(data, "-33.856784", "151.215297", 100, 0)
+
+
+def test_build_tmy(tmp_path):
+    # Test that an unusually dull June is never picked as the typical June
+    data = get_solar_data("-33.856784", "151.215297", "key", 3, rate_limit=1000, session=SyntheticSource())
+    dull = (data.index.year == data.index.year[0]) & (data.index.month == 6)
+    data.loc[dull, "W/m2 (GTI)"] *= 0.3
+    selection = select_typical_months(data)
+    assert list(selection.index) == list(range(1, 13))
+    assert selection.loc[6, "Year"] != data.index.year[0]
+    assert (selection["FS Statistic"] >= 0).all()
+
+    # Test that the TMY is one non leap year of intervals, that aggregates to 12 months
+    tmy = build_tmy(data, selection)
+    assert len(tmy) == 17520
+    assert tmy["Period end"].is_monotonic_increasing
+    assert len(aggregate_data(tmy, ["Monthly"])["Monthly"]) == 12
+    assert len(build_tmy(resample_intervals(data, "PT60M"))) == 8760
+
+    # Test that the TMY is built once per site and then loaded from the store without any requests
+    store = SiteStore(str(tmp_path / "store"))
+    source = SyntheticSource()
+    first = get_tmy("-33.856784", "151.215297", "key", 2, store, rate_limit=1000, session=source)
+    calls = source.calls
+    second = get_tmy("-33.856784", "151.215297", "key", 2, store, rate_limit=1000, session=source)
+    assert source.calls == calls
+    pd.testing.assert_frame_equal(first, second)
+    get_tmy("-33.856784", "151.215297", "key", 2, store, rate_limit=1000, session=source, period="PT60M")
+    assert source.calls == calls * 2
+
+    # Test that a batch runs against the cached typical years
+    sites = [{"name": "Sydney", "latitude": "-33.856784", "longitude": "151.215297", "years": 2, "panel_area": 20, "STC_eff": 21.48, "temp_coeff": -0.34}]
+    results, failures = run_batch(sites, "key", processes=1, session=source, store=store, tmy=True, period="PT60M")
+    assert len(results) == 12 and failures.empty
+    assert source.calls == calls * 2
+
+    # Test that the functions raise the correct errors
+    with pytest.raises(TypeError):
+        select_typical_months("cat")
+    with pytest.raises(ValueError):
+        select_typical_months(data, {"Wind Speed": 1})
+    with pytest.raises(ValueError):
+        select_typical_months(data[data.index.month != 3])
+    with pytest.raises(TypeError):
+        get_tmy("-33.856784", "151.215297", "key", 2, str(tmp_path))
+    with pytest.raises(ValueError):
+        run_batch(sites, "key", tmy=True)
+
+
+def test_resample_intervals(synthetic_data):
+    # Test that resampling to every supported period keeps the monthly aggregates
+    columns = ["Average Daytime Temp", "Total GTI (Wh/m2)", "Total Sun Hours", "Average hourly GTI (W/m2)"]
+    monthly = aggregate_data(synthetic_data, ["Monthly"])["Monthly"][columns]
+    for period in PERIOD_MINUTES:
+        resampled = resample_intervals(synthetic_data, period)
+        assert (resampled["Period"] == period).all()
+        assert np.allclose(aggregate_data(resampled, ["Monthly"])["Monthly"][columns], monthly)
+    # Test that a finer period and back gives the original data, and that interval yields are conserved
+    roundtrip = resample_intervals(resample_intervals(synthetic_data, "PT5M"), "PT30M")
+    assert np.allclose(roundtrip[["W/m2 (GTI)", "Sun Hours"]], synthetic_data[["W/m2 (GTI)", "Sun Hours"]])
+    assert (roundtrip["Period end"].to_numpy() == synthetic_data["Period end"].to_numpy()).all()
+    data = synthetic_data.assign(**{"Energy Yield (KWh)": 1.0})
+    assert np.isclose(resample_intervals(data, "PT60M")["Energy Yield (KWh)"].sum(), len(data))
+
+    # Test that data can be fetched at its native period, and that unsupported periods raise errors
+    hourly = get_solar_data("-33.856784", "151.215297", "key", 2, rate_limit=1000, session=SyntheticSource(), period="PT60M")
+    assert np.allclose(period_hours(hourly), 1)
+    assert len(aggregate_data(hourly, ["Monthly"])["Monthly"]) == 24
+    with pytest.raises(ValueError):
+        period_hours(synthetic_data.assign(Period="PT7M"))
+    with pytest.raises(ValueError):
+        resample_intervals(synthetic_data, "PT7M")
+    with pytest.raises(ValueError):
+        mixed = pd.concat([resample_intervals(synthetic_data, "PT5M").head(12), resample_intervals(synthetic_data, "PT60M").tail(12)])
+        resample_intervals(mixed, "PT30M")
+    with pytest.raises(TypeError):
+        resample_intervals("cat", "PT60M")
+
+
+def test_run_site(tmp_path):
+    # Test the headless pipeline end to end against the in-process source, with the response cache disabled
+    report = str(tmp_path / "site.png")
+    monthly = run_site("-33.856784", "151.215297", "Sydney", 2, 20, 21.48, -0.34, "key", name="Sydney", report=report, results=str(tmp_path / "results"),
+                       backend="matplotlib", dpi=50, rate_limit=1000, cache_path=None, session=SyntheticSource())
+    assert monthly["Energy Yield (KWh)"].notna().all()
+    assert os.path.exists(tmp_path / "site-years.png") and os.path.exists(tmp_path / "site-uncertainty.png")
+    assert len(ResultsStore(str(tmp_path / "results")).load("monthly", sites=["Sydney"])) == len(monthly)
+
+    # Test that daily simulations are reported and exported by month, and that resolutions that can't be rolled up to months are rejected
+    with patch("project.SIMULATION_RESOLUTION", "Daily"):
+        daily = run_site("-33.856784", "151.215297", "Sydney", 2, 20, 21.48, -0.34, "key", name="Daily", report=str(tmp_path / "daily.png"), results=str(tmp_path / "results"),
+                         backend="matplotlib", dpi=50, rate_limit=1000, cache_path=None, session=SyntheticSource(), simulations=0)
+    assert list(daily.index.names) == ["Year", "Month", "Day"]
+    exported = ResultsStore(str(tmp_path / "results")).load("monthly", sites=["Daily"])
+    assert len(exported) == 24 and np.isclose(exported["Energy Yield (KWh)"].sum(), daily["Energy Yield (KWh)"].astype(float).sum())
+    for resolution in ["Weekly", "Yearly"]:
+        with patch("project.SIMULATION_RESOLUTION", resolution), pytest.raises(ValueError):
+            run_site("-33.856784", "151.215297", "Sydney", 2, 20, 21.48, -0.34, "key", report=None, results=None, cache_path=None, session=SyntheticSource())
+
+    # Test that the P50 of the report's uncertainty page is simulated with the same panel model as the yields
+    with patch("project.render_report") as render:
+        bifacial = run_site("-33.856784", "151.215297", "Sydney", 2, 20, 21.48, -0.34, "key", report=report, results=None, rate_limit=1000, cache_path=None,
+                            session=SyntheticSource(), model="bifacial")
+    p50 = exceedance_yields(render.call_args.kwargs["uncertainty"]).loc["P50", "Annual Energy Yield (KWh)"]
+    mean_yield = bifacial["Energy Yield (KWh)"].astype(float).sum() / 2
+    assert abs(p50 / mean_yield - 1) < 0.01
+    with pytest.raises(ValueError):
+        sweep_orientations(get_solar_data("-33.856784", "151.215297", "key", 2, rate_limit=1000, session=SyntheticSource(), components=True),
+                           "-33.856784", "151.215297", 30, 0, 21.48, -0.34, 20, model="tracker")
+
+    # Test that an invalid site exits with an error message before anything is fetched
+    args = parse_arguments(["--latitude", "-91", "--longitude", "151.2", "--years", "2", "--panel-area", "20", "--stc-eff", "21.48", "--temp-coeff", "-0.34"])
+    with pytest.raises(SystemExit, match="Invalid site"):
+        run_headless(args, "key")
+    args.latitude, args.years = "-33.8", "11"
+    with pytest.raises(SystemExit, match="between 2 and 10"):
+        run_headless(args, "key")